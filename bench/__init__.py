@@ -0,0 +1,5 @@
+# bench/__init__.py
+"""
+Бенчмарки ретранслятора и игрового протокола.
+Запуск из корня репозитория: python3 -m bench.<модуль>
+"""
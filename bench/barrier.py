@@ -0,0 +1,62 @@
+# bench/barrier.py
+"""
+Стоимость барьера: рассылка всем (n·(n−1) сообщений) против команды
+barrier на ретрансляторе (n команд и n строк released).
+
+    python3 -m bench.barrier --players 10 50 --barriers 20
+"""
+
+import argparse
+import contextlib
+import os
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater
+from player import Player
+
+
+def run(players, barriers, native, engine):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    elapsed = {}
+    go = threading.Barrier(players)
+
+    def body(name):
+        player = Player(name, "127.0.0.1", port)
+        player.connect_and_wait(players)
+        if not native:
+            player.conn.features.discard("barrier")
+        go.wait()
+        start = time.perf_counter()
+        for i in range(barriers):
+            player.sync_barrier(f"b{i}")
+        elapsed[name] = time.perf_counter() - start
+        player.conn.close()
+
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    stop_repeater(server)
+    return max(elapsed.values()) / barriers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--barriers", type=int, default=20)
+    parser.add_argument("--engine", default="loop")
+    args = parser.parse_args()
+
+    print(f"{'players':>8}{'mode':>12}{'relays':>10}{'ms/barrier':>12}")
+    for n in args.players:
+        for native, label, relays in ((False, "p2p", n * (n - 1)), (True, "repeater", 2 * n)):
+            per = run(n, args.barriers, native, args.engine)
+            print(f"{n:>8}{label:>12}{relays:>10}{per * 1e3:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
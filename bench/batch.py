@@ -0,0 +1,81 @@
+# bench/batch.py
+"""
+Пакетная проверка check_guesses: задержка на догадку и пропускная
+способность при K от 1 до 10 000 против K вызовов check_guess.
+
+    python3 -m bench.batch --players 3 --k 1 10 100 1000 10000
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater
+from player import Player
+
+
+def run(players, sizes, sequential_limit, engine, field_size):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    results = {}
+
+    def body(name):
+        player = Player(name, "127.0.0.1", port, field_size=field_size)
+        player.start_game(players)
+        guesser = player.all_players[0]
+        for k in sizes:
+            guesses = [(random.randint(1, field_size), random.randint(1, field_size)) for _ in range(k)]
+            player.sync_barrier(f"batch_{k}")
+            start = time.perf_counter()
+            player.check_guesses(guesser, guesses if guesser == name else None)
+            batched = time.perf_counter() - start
+
+            sequential = None
+            if k <= sequential_limit:
+                player.sync_barrier(f"seq_{k}")
+                start = time.perf_counter()
+                for x, y in guesses:
+                    if guesser == name:
+                        player.check_guess(guesser, x, y)
+                    else:
+                        player.check_guess(guesser)
+                sequential = time.perf_counter() - start
+            if guesser == name:
+                results[k] = (batched, sequential)
+        player.conn.close()
+
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    stop_repeater(server)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--sequential-limit", type=int, default=100)
+    parser.add_argument("--engine", default="loop")
+    parser.add_argument("--field", type=int, default=10 ** 6)
+    args = parser.parse_args()
+
+    results = run(args.players, args.k, args.sequential_limit, args.engine, args.field)
+    # Сообщений на проверку: доли догадки (n−1) + доли разности n·(n−1)
+    messages = (args.players - 1) + args.players * (args.players - 1)
+    print(f"{'K':>7}{'batch ms':>10}{'us/guess':>10}{'guesses/s':>12}{'msgs/s':>10}{'sequential us/guess':>21}")
+    for k in args.k:
+        batched, sequential = results[k]
+        seq = f"{sequential / k * 1e6:>21.0f}" if sequential is not None else f"{'-':>21}"
+        print(f"{k:>7}{batched * 1e3:>10.1f}{batched / k * 1e6:>10.0f}{k / batched:>12.0f}"
+              f"{messages / batched:>10.0f}{seq}")
+
+
+if __name__ == "__main__":
+    main()
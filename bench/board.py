@@ -0,0 +1,68 @@
+# bench/board.py
+"""
+Доска coords против packed: время раздачи и раскрытия одной проверки и
+байты долей разности на проводе при росте стороны поля и размерности.
+
+    python3 -m bench.board --players 10 --field 10 1000 1000000 --dims 2 3 5 10
+
+coords для d > 2 — то, во что обошлось бы делить каждую координату
+отдельно (d элементов по модулю n); packed — всегда один элемент по
+модулю n^d, в том числе больше 2^64.
+"""
+
+import argparse
+import random
+import time
+
+from crypto_utils import element_bytes, generate_additive_shares_vector, pack_point, reconstruct_additive_vector
+
+
+def check_once(num_parties, values, modulus):
+    """Одна проверка без сети: раздать догадку, посчитать доли разности всех сторон и раскрыть."""
+    totals = generate_additive_shares_vector([random.randrange(modulus) for _ in values], num_parties, modulus)
+    guess = generate_additive_shares_vector(values, num_parties, modulus)
+    diffs = [[(t - g) % modulus for t, g in zip(total, share)] for total, share in zip(totals, guess)]
+    return reconstruct_additive_vector(diffs, p=modulus)
+
+
+def measure(num_parties, values, modulus, budget):
+    repeat = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(10):
+            check_once(num_parties, values, modulus)
+        repeat += 10
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / repeat
+
+
+def payload_bytes(count, modulus):
+    """Доли разности одной проверки на проводе: count элементов фиксированной ширины."""
+    return count * element_bytes(modulus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--field", type=int, nargs="+", default=[10, 1000, 1000000])
+    parser.add_argument("--dims", type=int, nargs="+", default=[2, 3, 5, 10])
+    parser.add_argument("--budget", type=float, default=0.2, help="секунд на один замер")
+    args = parser.parse_args()
+
+    print(f"{'n':>9}{'d':>4}{'n^d bits':>10}{'coords us':>11}{'packed us':>11}{'speedup':>9}"
+          f"{'coords B':>10}{'packed B':>10}")
+    for n in args.field:
+        for d in args.dims:
+            point = [random.randrange(n) for _ in range(d)]
+            modulus = n ** d
+            packed = [pack_point(point, n)]
+            coords_us = measure(args.players, point, n, args.budget)
+            packed_us = measure(args.players, packed, modulus, args.budget)
+            print(f"{n:>9}{d:>4}{(modulus - 1).bit_length():>10}{coords_us * 1e6:>11.1f}{packed_us * 1e6:>11.1f}"
+                  f"{coords_us / packed_us:>8.2f}x{payload_bytes(d, n):>10}"
+                  f"{payload_bytes(1, modulus):>10}")
+
+
+if __name__ == "__main__":
+    main()
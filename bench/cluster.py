@@ -0,0 +1,168 @@
+# bench/cluster.py
+"""
+Кластер ретрансляторов: суммарная пропускная способность send при
+1..N узлах-процессах. Пары отправитель → получатель раскладываются по
+узлам, нагрузку дают N процессов-клиентов.
+
+    python3 -m bench.cluster --nodes 1 2 4 --pairs 32 --messages 2000 --placement random
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from bench.common import raw_client, recv_until
+
+PLACEMENTS = ("local", "cross", "random")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_cluster(nodes, engine):
+    ports = [free_port() for _ in range(nodes)]
+    links = [f"127.0.0.1:{free_port()}" for _ in range(nodes)]
+    procs = []
+    for i in range(nodes):
+        cmd = [sys.executable, "repeater.py", str(ports[i]), "--engine", engine]
+        if nodes > 1:
+            cmd += ["--cluster-node", links[i]]
+            for j in range(nodes):
+                if j != i:
+                    cmd += ["--cluster-peer", links[j]]
+        procs.append(subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    # Ждём, пока каждый узел начнёт принимать клиентов
+    for port in ports:
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+    return ports, procs
+
+
+def worker(index, pairs, ports, messages, total_clients, ready, go, results):
+    """Процесс нагрузки: пары (k, (узел отправителя, узел получателя))."""
+    senders, receivers = [], []
+    for k, (src, dst) in pairs:
+        sock, _ = raw_client(ports[src], f"s{k}", timeout=60)
+        senders.append((sock, f"r{k}"))
+        sock, rest = raw_client(ports[dst], f"r{k}", timeout=60)
+        receivers.append((sock, rest))
+    # Все клиенты кластера видны с каждого узла — каталог присутствия разошёлся
+    for sock, _ in senders:
+        sock.sendall(f"wait {total_clients}\n".encode())
+        header, rest = recv_until(sock, b"available connections:\n")
+        for _ in range(int(header.split()[-3])):
+            _, rest = recv_until(sock, b"\n", rest)
+    ready.wait()
+    go.wait()
+    start = time.perf_counter()
+
+    def blast(sock, target):
+        payload = b"".join(f"send {target} {i}||\n".encode() for i in range(messages))
+        sock.sendall(payload)
+
+    threads = [threading.Thread(target=blast, args=pair, daemon=True) for pair in senders]
+    for t in threads:
+        t.start()
+    selector = selectors.DefaultSelector()
+    counts = {}
+    tails = {}
+    for sock, rest in receivers:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        counts[sock] = rest.count(b"||")
+        tails[sock] = rest[-1:]
+    pending = sum(1 for sock in counts if counts[sock] < messages)
+    while pending:
+        for key, _ in selector.select(30):
+            sock = key.fileobj
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("узел закрыл соединение")
+            before = counts[sock]
+            # Маркер || может разорваться между чтениями — считаем по стыку
+            tail = tails[sock]
+            counts[sock] += (tail + chunk).count(b"||") - tail.count(b"||")
+            tails[sock] = chunk[-1:]
+            if before < messages <= counts[sock]:
+                pending -= 1
+    results.put((index, time.perf_counter() - start, len(senders) * messages))
+
+
+def run(nodes, pairs, messages, placement, engine):
+    ports, procs = start_cluster(nodes, engine)
+    assignments = []
+    for k in range(pairs):
+        src = k % nodes
+        if placement == "local":
+            dst = src
+        elif placement == "cross":
+            dst = (src + 1) % nodes
+        else:
+            dst = random.randrange(nodes)
+        assignments.append((k, (src, dst)))
+    # Процессов нагрузки столько же, сколько узлов
+    workers = max(1, nodes)
+    ready = multiprocessing.Barrier(workers + 1)
+    go = multiprocessing.Barrier(workers + 1)
+    results = multiprocessing.Queue()
+    procs_load = [multiprocessing.Process(target=worker, args=(i, assignments[i::workers], ports, messages,
+                                                             2 * pairs, ready, go, results))
+                  for i in range(workers)]
+    try:
+        for p in procs_load:
+            p.start()
+        ready.wait()
+        go.wait()
+        reports = [results.get(timeout=300) for _ in procs_load]
+    finally:
+        for p in procs_load:
+            p.join(5)
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.kill()
+    elapsed = max(r[1] for r in reports)
+    delivered = sum(r[2] for r in reports)
+    return delivered, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pairs", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=2000, help="сообщений на пару")
+    parser.add_argument("--placement", choices=PLACEMENTS, default="random",
+                        help="получатель на том же узле, на соседнем или на случайном")
+    parser.add_argument("--engine", default="loop")
+    args = parser.parse_args()
+
+    print(f"ядер: {os.cpu_count()}, размещение: {args.placement}")
+    print(f"{'nodes':>6}{'messages':>10}{'seconds':>9}{'msgs/s':>10}{'speedup':>9}")
+    base = None
+    for nodes in args.nodes:
+        delivered, elapsed = run(nodes, args.pairs, args.messages, args.placement, args.engine)
+        rate = delivered / elapsed
+        base = base or rate
+        print(f"{nodes:>6}{delivered:>10}{elapsed:>9.2f}{rate:>10.0f}{rate / base:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# bench/codec.py
+"""
+Кодеки сообщений: размер на проводе и время encode/decode для каждого
+горячего типа сообщения, JSON против двоичной раскладки.
+
+    python3 -m bench.codec --players 10 --field 1000000007 --k 100
+"""
+
+import argparse
+import os
+import random
+import time
+
+from codec import BinaryCodec, JsonCodec
+
+
+def samples(players, field_size, k):
+    me, other = players[0], players[-1]
+    elem = lambda: random.randrange(field_size)
+    return {
+        "share": {"type": "share", "from": me, "share_x": elem(), "share_y": elem()},
+        "share (seed)": {"type": "share", "from": me, "seed": os.urandom(16).hex()},
+        "guess_share": {"type": "guess_share", "from": me, "guesser": me,
+                        "share_gx": elem(), "share_gy": elem()},
+        "diff_share": {"type": "diff_share", "from": me, "d_x": elem(), "d_y": elem(), "guesser": other},
+        "diff_share (mask)": {"type": "diff_share", "from": me, "d_x": elem(), "d_y": elem(),
+                              "guesser": me, "mask": 12345, "e_x": elem(), "e_y": elem()},
+        f"diff_share (K={k})": {"type": "diff_share", "from": me, "guesser": other,
+                                "d_x": [elem() for _ in range(k)], "d_y": [elem() for _ in range(k)]},
+        f"diff_share (round, n)": {"type": "diff_share", "from": me, "round": 42,
+                                   "d_x": [elem() for _ in players], "d_y": [elem() for _ in players]},
+        "barrier": {"type": "barrier", "name": "round_123", "from": me},
+    }
+
+
+def timed(func, arg, budget):
+    repeat = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(100):
+            func(arg)
+        repeat += 100
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--field", type=int, default=1000000007)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--budget", type=float, default=0.2, help="секунд на один замер")
+    args = parser.parse_args()
+
+    players = [f"player_{i:03d}" for i in range(args.players)]
+    codecs = (JsonCodec(), BinaryCodec(players, args.field))
+    print(f"{'message':<24}{'json B':>8}{'bin B':>8}{'json enc us':>13}{'bin enc us':>12}"
+          f"{'json dec us':>13}{'bin dec us':>12}")
+    for name, data in samples(players, args.field, args.k).items():
+        encoded = [codec.encode(data) for codec in codecs]
+        for codec, raw in zip(codecs, encoded):
+            assert codec.decode(raw) == data, name
+        enc = [timed(codec.encode, data, args.budget) for codec in codecs]
+        dec = [timed(codec.decode, raw, args.budget) for codec, raw in zip(codecs, encoded)]
+        print(f"{name:<24}{len(encoded[0]):>8}{len(encoded[1]):>8}{enc[0] * 1e6:>13.2f}{enc[1] * 1e6:>12.2f}"
+              f"{dec[0] * 1e6:>13.2f}{dec[1] * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# bench/common.py
+
+import collections
+import contextlib
+import socket
+import threading
+import time
+
+import repeater
+
+
+def start_repeater(engine="loop", **options):
+    """Поднимает ретранслятор на свободном порту localhost в фоновом потоке."""
+    if engine == "loop":
+        server = repeater.EventLoopServer(("127.0.0.1", 0), **options)
+    else:
+        server = repeater.ThreadedTCPServer(("127.0.0.1", 0), repeater.ThreadedTCPRequestHandler)
+        server.daemon_threads = True
+        for key, value in options.items():
+            setattr(server, key, value)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def stop_repeater(server):
+    server.shutdown()
+    server.server_close()
+
+
+def recv_until(sock, marker, buf=b""):
+    while marker not in buf:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError("соединение закрыто")
+        buf += chunk
+    idx = buf.index(marker) + len(marker)
+    return buf[:idx], buf[idx:]
+
+
+def raw_client(port, nickname, host="127.0.0.1", timeout=30, rcvbuf=None):
+    """Сырой клиент без пауз RepeaterConnection: только рукопожатие с никнеймом."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.settimeout(timeout)
+    sock.connect((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    _, rest = recv_until(sock, b"Pick nickname: ")
+    sock.sendall(f"{nickname}\n".encode())
+    header, rest = recv_until(sock, b"available connections:\n", rest)
+    count = int(header.split()[-3])
+    for _ in range(count):
+        _, rest = recv_until(sock, b"\n", rest)
+    return sock, rest
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class DelayProxy:
+    """
+    TCP-прокси на localhost, который задерживает каждый кусок данных в
+    обе стороны на delay секунд — как сеть с односторонней задержкой
+    delay между клиентами и ретранслятором.
+    """
+
+    def __init__(self, target_port, delay, host="127.0.0.1"):
+        self.target = (host, target_port)
+        self.delay = delay
+        self.listener = socket.create_server((host, 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self.target)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream)
+            self._pipe(upstream, client)
+
+    def _pipe(self, src, dst):
+        """Читатель ставит куски в очередь со временем выдачи, писатель выдаёт их не раньше."""
+        queue = collections.deque()
+        ready = threading.Condition()
+
+        def read():
+            while True:
+                try:
+                    data = src.recv(65536)
+                except OSError:
+                    data = b""
+                with ready:
+                    queue.append((time.perf_counter() + self.delay, data))
+                    ready.notify()
+                if not data:
+                    return
+
+        def write():
+            while True:
+                with ready:
+                    ready.wait_for(lambda: queue)
+                    due, data = queue.popleft()
+                time.sleep(max(0.0, due - time.perf_counter()))
+                if not data:
+                    with contextlib.suppress(OSError):
+                        dst.shutdown(socket.SHUT_WR)
+                    return
+                try:
+                    dst.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=read, daemon=True).start()
+        threading.Thread(target=write, daemon=True).start()
+
+    def close(self):
+        self.listener.close()
@@ -0,0 +1,94 @@
+# bench/fanout.py
+"""
+Задержка рассылки send a,b,... при одном зависшем получателе.
+
+Отправитель шлёт сообщения всем K здоровым получателям и одному, который
+не читает сокет. Меряем задержку у здоровых для каждой политики.
+
+    python3 -m bench.fanout --receivers 20 --messages 2000 --size 2048
+"""
+
+import argparse
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater, raw_client, percentile
+from repeater import ENGINES, SLOW_POLICIES
+
+
+def reader(sock, rest, expected, latencies, idle_timeout):
+    sock.settimeout(idle_timeout)
+    buf = rest
+    got = 0
+    try:
+        while got < expected:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+            frames = buf.split(b"||")
+            buf = frames.pop()
+            now = time.perf_counter()
+            for frame in frames:
+                latencies.append(now - float(frame.split(b":")[1]))
+                got += 1
+    except OSError:
+        pass
+
+
+def run(engine, policy, receivers, messages, size, outbox_limit):
+    server = start_repeater(engine, outbox_limit=outbox_limit, slow_policy=policy)
+    port = server.server_address[1]
+    sender, _ = raw_client(port, "sender")
+    laggard, _ = raw_client(port, "laggard", rcvbuf=4096)
+    names = [f"r{i}" for i in range(receivers)]
+    latencies = []
+    threads = []
+    for name in names:
+        sock, rest = raw_client(port, name)
+        t = threading.Thread(target=reader, args=(sock, rest, messages, latencies, 5), daemon=True)
+        t.start()
+        threads.append((t, sock))
+
+    recipients = ",".join(names + ["laggard"])
+    padding = "x" * size
+    start = time.perf_counter()
+    for seq in range(messages):
+        sender.sendall(f"send {recipients} {seq}:{time.perf_counter()}:{padding}||\n".encode())
+    send_time = time.perf_counter() - start
+    for t, sock in threads:
+        t.join()
+        sock.close()
+    for sock in (sender, laggard):
+        sock.close()
+    stop_repeater(server)
+    return {
+        "engine": engine,
+        "policy": policy,
+        "delivered": len(latencies) / max(1, receivers * messages),
+        "send_s": send_time,
+        "p50_ms": percentile(latencies, 0.5) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--receivers", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--outbox-limit", type=int, default=256 * 1024)
+    parser.add_argument("--engine", choices=ENGINES, action="append")
+    parser.add_argument("--policy", choices=SLOW_POLICIES, action="append")
+    args = parser.parse_args()
+
+    print(f"{'engine':<10}{'policy':<12}{'delivered':>10}{'send s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for engine in args.engine or ENGINES:
+        for policy in args.policy or SLOW_POLICIES:
+            r = run(engine, policy, args.receivers, args.messages, args.size, args.outbox_limit)
+            print(f"{r['engine']:<10}{r['policy']:<12}{r['delivered']:>10.0%}{r['send_s']:>9.2f}"
+                  f"{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# bench/framing.py
+"""
+Разбор пачки сообщений, пришедших кусками по 4 КБ: старая склейка str
+с поиском || против FrameReader (text и lp).
+
+    python3 -m bench.framing --messages 500 --size 20000
+"""
+
+import argparse
+import time
+
+from framing import FrameReader, pack_frame
+
+
+def legacy_extract(chunks):
+    """Разбор, как в RepeaterConnection до FrameReader."""
+    buffer = ""
+    queue = []
+    for chunk in chunks:
+        buffer += chunk.decode()
+        while "||" in buffer:
+            idx = buffer.index("||")
+            raw = buffer[:idx].strip()
+            buffer = buffer[idx + 2:]
+            if raw.startswith("{"):
+                queue.append(raw)
+    return queue
+
+
+def reader_extract(chunks, mode):
+    reader = FrameReader(delimiters=(b"||", b"\n"), mode=mode)
+    queue = []
+    for chunk in chunks:
+        reader.feed(chunk)
+        for frame in reader.frames():
+            queue.append(frame.decode())
+    return queue
+
+
+def split(stream, chunk):
+    return [stream[i:i + chunk] for i in range(0, len(stream), chunk)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=4096)
+    args = parser.parse_args()
+
+    payloads = [('{"type": "share", "i": %d, "pad": "%s"}' % (i, "x" * args.size)).encode() + b"||"
+                for i in range(args.messages)]
+    text = split(b"".join(payloads), args.chunk)
+    lp = split(b"".join(pack_frame(p) for p in payloads), args.chunk)
+
+    for name, fn in (("legacy str", lambda: legacy_extract(text)),
+                     ("FrameReader text", lambda: reader_extract(text, "text")),
+                     ("FrameReader lp", lambda: reader_extract(lp, "lp"))):
+        start = time.perf_counter()
+        count = len(fn())
+        elapsed = time.perf_counter() - start
+        print(f"{name:<18}{count:>8} msgs {elapsed * 1e3:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench/inbox.py
+"""
+Ожидание сообщений при перемешанном порядке прихода: старый
+wait_for_message с повторным json.loads всей очереди против Inbox.
+
+    python3 -m bench.inbox --rounds 200 --players 10
+"""
+
+import argparse
+import collections
+import json
+import random
+import time
+
+from inbox import Inbox
+
+
+class FakeConnection:
+    """Соединение без сети: все кадры уже в очереди."""
+
+    def __init__(self, frames):
+        self.message_queue = collections.deque(frames)
+
+    def recv_message(self, timeout=60):
+        return self.message_queue.popleft() if self.message_queue else None
+
+
+def make_frames(rounds, players):
+    frames = []
+    for r in range(rounds):
+        for p in range(1, players):
+            frames.append(json.dumps({"type": "diff_share", "from": f"p{p}", "guesser": f"g{r}", "d_x": 1, "d_y": 2}))
+            frames.append(json.dumps({"type": "barrier", "from": f"p{p}", "name": f"round_{r}"}))
+    random.Random(1).shuffle(frames)
+    return frames
+
+
+def legacy_wait(queue, msg_type, check, counter):
+    """wait_for_message до Inbox: полный проход с json.loads по очереди."""
+    new_queue = []
+    found = None
+    for item in queue:
+        if found is not None:
+            new_queue.append(item)
+            continue
+        data = json.loads(item)
+        counter[0] += 1
+        if data.get("type") == msg_type and check(data):
+            found = data
+            continue
+        new_queue.append(item)
+    queue[:] = new_queue
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--players", type=int, default=10)
+    args = parser.parse_args()
+    frames = make_frames(args.rounds, args.players)
+    wanted = args.players - 1
+
+    queue = list(frames)
+    parses = [0]
+    start = time.perf_counter()
+    for r in range(args.rounds):
+        for _ in range(wanted):
+            legacy_wait(queue, "diff_share", lambda d: d.get("guesser") == f"g{r}", parses)
+        for _ in range(wanted):
+            legacy_wait(queue, "barrier", lambda d: d.get("name") == f"round_{r}", parses)
+    legacy = time.perf_counter() - start
+    print(f"legacy  {len(frames):>7} msgs {parses[0]:>10} json.loads {legacy * 1e3:>9.1f} ms")
+
+    inbox = Inbox(FakeConnection(frames))
+    start = time.perf_counter()
+    for r in range(args.rounds):
+        inbox.collect("diff_share", wanted, tag=f"g{r}", timeout=1)
+        inbox.collect("barrier", wanted, tag=f"round_{r}", timeout=1)
+    indexed = time.perf_counter() - start
+    print(f"inbox   {len(frames):>7} msgs {inbox.parsed:>10} json.loads {indexed * 1e3:>9.1f} ms"
+          f"  (max depth {inbox.max_depth})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+# bench/load.py
+"""
+Нагрузочный генератор и soak-тест ретранслятора. Тысячи клиентов проходят
+рукопожатие с никнеймом и шлют send по схеме 1:1, широковещательно или
+все-всем с заданной частотой. Отчёт: пропускная способность, задержка
+p50/p99/p999, сбои по секундам; в soak-режиме после каждого цикла
+проверяется, что соединения, потоки и дескрипторы ретранслятора
+вернулись к исходным.
+
+    python3 -m bench.load --clients 2000 --pattern pairs --rate 5000 --duration 10
+    python3 -m bench.load --clients 500 --pattern all --group 8 --soak 5 --engine threaded
+"""
+
+import argparse
+import collections
+import json
+import math
+import multiprocessing
+import os
+import resource
+import selectors
+import time
+
+from bench.cluster import start_cluster
+from bench.common import raw_client, recv_until
+
+# pairs — клиент шлёт напарнику; broadcast — первый в группе шлёт остальным;
+# all — каждый в группе шлёт всем остальным
+PATTERNS = ("pairs", "broadcast", "all")
+# Задержки копятся в логарифмической гистограмме с шагом 2%: её можно
+# складывать между процессами, а перцентили точны до шага
+BUCKET_RATIO = 1.02
+BUCKET_MIN = 1e-6
+
+
+def bucket(seconds):
+    return max(0, int(math.log(max(seconds, BUCKET_MIN) / BUCKET_MIN, BUCKET_RATIO)))
+
+
+def histogram_percentile(histogram, q):
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= rank:
+            return BUCKET_MIN * BUCKET_RATIO ** (index + 1)
+    return BUCKET_MIN * BUCKET_RATIO ** (max(histogram) + 1)
+
+
+def groups_for(names, pattern, group):
+    """[(отправитель, [получатели])] для схемы рассылки."""
+    size = 2 if pattern == "pairs" else group
+    plan = []
+    for start in range(0, len(names), size):
+        members = names[start:start + size]
+        if len(members) < 2:
+            continue
+        if pattern == "pairs":
+            plan += [(members[0], [members[1]]), (members[1], [members[0]])]
+        elif pattern == "broadcast":
+            plan.append((members[0], members[1:]))
+        else:
+            plan += [(member, [other for other in members if other != member]) for member in members]
+    return plan
+
+
+def worker(index, host, port, names, pattern, group, rate, duration, drain, size, ready, go, results):
+    """Процесс нагрузки: свои клиенты, свой цикл select."""
+    timeline = collections.defaultdict(lambda: {"sent": 0, "delivered": 0, "errors": 0,
+                                                "latency": collections.Counter()})
+    report = {"worker": index, "clients": 0, "connect_failures": 0, "connect_s": 0.0, "errors": [],
+              "sent": 0, "expected": 0, "delivered": 0, "latency": collections.Counter()}
+
+    def fail(stage, error, second=0):
+        timeline[second]["errors"] += 1
+        if len(report["errors"]) < 10:
+            report["errors"].append(f"{stage}: {error!r}")
+
+    socks = {}
+    start = time.monotonic()
+    for name in names:
+        try:
+            sock, rest = raw_client(port, name, host=host, timeout=30)
+        except (OSError, ConnectionError) as e:
+            report["connect_failures"] += 1
+            fail("connect", e)
+            continue
+        socks[name] = (sock, rest)
+    report["clients"] = len(socks)
+    report["connect_s"] = time.monotonic() - start
+
+    plan = [(socks[sender][0], ",".join(r for r in recipients if r in socks), len(recipients))
+            for sender, recipients in groups_for(names, pattern, group) if sender in socks]
+    selector = selectors.DefaultSelector()
+    tails = {}
+    for name, (sock, rest) in socks.items():
+        sock.settimeout(5)
+        selector.register(sock, selectors.EVENT_READ, name)
+        tails[sock] = rest
+    padding = "x" * size
+
+    ready.wait()
+    go.wait()
+    t0 = time.monotonic()
+    alive = {sock for sock, _ in socks.values()}
+
+    def receive(sock, now):
+        try:
+            chunk = sock.recv(65536)
+        except OSError as e:
+            chunk = b""
+            fail("recv", e, int(now - t0))
+        if not chunk:
+            selector.unregister(sock)
+            alive.discard(sock)
+            fail("recv", ConnectionError("ретранслятор закрыл соединение"), int(now - t0))
+            return
+        frames = (tails[sock] + chunk).split(b"||")
+        tails[sock] = frames.pop()
+        second = timeline[int(now - t0)]
+        for frame in frames:
+            try:
+                latency = now - float(frame.split(b":")[1])
+            except (IndexError, ValueError):
+                continue
+            b = bucket(latency)
+            report["latency"][b] += 1
+            second["latency"][b] += 1
+            second["delivered"] += 1
+            report["delivered"] += 1
+
+    cursor = 0
+    while True:
+        now = time.monotonic()
+        elapsed = now - t0
+        if elapsed < duration and plan:
+            # Догоняем расписание: столько send, сколько положено к этому моменту
+            due = int(rate * elapsed) - report["sent"]
+            for _ in range(min(due, len(plan))):
+                sock, recipients, count = plan[cursor % len(plan)]
+                cursor += 1
+                if sock not in alive or not recipients:
+                    continue
+                line = f"send {recipients} {report['sent']}:{time.monotonic()}:{padding}||\n"
+                try:
+                    sock.sendall(line.encode())
+                except OSError as e:
+                    fail("send", e, int(elapsed))
+                    continue
+                report["sent"] += 1
+                report["expected"] += count
+                timeline[int(elapsed)]["sent"] += 1
+        elif report["delivered"] >= report["expected"] or elapsed > duration + drain or not alive:
+            break
+        for key, _ in selector.select(0.002):
+            receive(key.fileobj, time.monotonic())
+
+    for sock, _ in socks.values():
+        sock.close()
+    report["timeline"] = {second: dict(values, latency=dict(values["latency"]))
+                          for second, values in timeline.items()}
+    report["latency"] = dict(report["latency"])
+    results.put(report)
+
+
+def repeater_stats(pid):
+    """Потоки и открытые дескрипторы процесса ретранслятора (Linux /proc)."""
+    stats = {"threads": None, "fds": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    stats["threads"] = int(line.split()[1])
+        stats["fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        pass
+    return stats
+
+
+def connections_seen(probe):
+    """Сколько клиентов видит ретранслятор (кроме пробника): ответ на print."""
+    sock, rest = probe
+    sock.sendall(b"print\n")
+    header, rest = recv_until(sock, b"available connections:\n", rest)
+    count = int(header.split()[-3])
+    for _ in range(count):
+        _, rest = recv_until(sock, b"\n", rest)
+    return count
+
+
+def settle(probe, pid, baseline, timeout):
+    """Ждать возврата к исходному числу соединений и потоков; последний замер."""
+    deadline = time.monotonic() + timeout
+    while True:
+        state = {"connections": connections_seen(probe), **repeater_stats(pid)}
+        clean = state["connections"] <= baseline["connections"] and (
+            state["threads"] is None or state["threads"] <= baseline["threads"])
+        if clean or time.monotonic() > deadline:
+            return state
+        time.sleep(0.2)
+
+
+def run_cycle(cycle, args, port):
+    names = [f"c{cycle}_{k}" for k in range(args.clients)]
+    # Группа целиком в одном процессе: задержка меряется одними часами
+    size = 2 if args.pattern == "pairs" else args.group
+    chunks = [names[i:i + size] for i in range(0, len(names), size)]
+    shares = [sum(chunks[i::args.procs], []) for i in range(args.procs)]
+    ready = multiprocessing.Barrier(args.procs + 1)
+    go = multiprocessing.Barrier(args.procs + 1)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, daemon=True,
+                                     args=(i, args.host, port, shares[i], args.pattern, args.group,
+                                           args.rate / args.procs, args.duration, args.drain, args.size,
+                                           ready, go, results))
+             for i in range(args.procs)]
+    for p in procs:
+        p.start()
+    ready.wait()
+    go.wait()
+    reports = [results.get(timeout=args.duration + args.drain + 600) for _ in procs]
+    for p in procs:
+        p.join(5)
+
+    latency = collections.Counter()
+    timeline = collections.defaultdict(lambda: {"sent": 0, "delivered": 0, "errors": 0,
+                                                "latency": collections.Counter()})
+    for report in reports:
+        latency.update(report["latency"])
+        for second, values in report["timeline"].items():
+            merged = timeline[second]
+            for key in ("sent", "delivered", "errors"):
+                merged[key] += values[key]
+            merged["latency"].update(values["latency"])
+    sent = sum(r["sent"] for r in reports)
+    delivered = sum(r["delivered"] for r in reports)
+    expected = sum(r["expected"] for r in reports)
+    return {
+        "cycle": cycle,
+        "clients": sum(r["clients"] for r in reports),
+        "connect_failures": sum(r["connect_failures"] for r in reports),
+        "connect_s": round(max(r["connect_s"] for r in reports), 3),
+        "sent": sent,
+        "delivered": delivered,
+        "lost": expected - delivered,
+        "sends_per_s": round(sent / args.duration, 1),
+        "deliveries_per_s": round(delivered / args.duration, 1),
+        "latency_ms": {q: round(histogram_percentile(latency, p) * 1000, 3)
+                       for q, p in (("p50", 0.5), ("p99", 0.99), ("p999", 0.999))},
+        "errors": sum((r["errors"] for r in reports), []),
+        "timeline": [
+            {"second": second, "sent": values["sent"], "delivered": values["delivered"],
+             "errors": values["errors"],
+             "p99_ms": round(histogram_percentile(values["latency"], 0.99) * 1000, 3)}
+            for second, values in sorted(timeline.items())
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="готовый ретранслятор; без него запускается свой")
+    parser.add_argument("--pid", type=int, help="pid готового ретранслятора (для потоков и дескрипторов)")
+    parser.add_argument("--engine", default="loop", help="движок своего ретранслятора")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--pattern", choices=PATTERNS, default="pairs")
+    parser.add_argument("--group", type=int, default=16, help="размер группы для broadcast и all")
+    parser.add_argument("--rate", type=float, default=2000, help="send в секунду, всего")
+    parser.add_argument("--size", type=int, default=64, help="байт полезной нагрузки")
+    parser.add_argument("--duration", type=float, default=10, help="секунд нагрузки в цикле")
+    parser.add_argument("--drain", type=float, default=5, help="секунд дождаться запоздавших")
+    parser.add_argument("--procs", type=int, default=1, help="процессов нагрузки")
+    parser.add_argument("--soak", type=int, default=1, metavar="CYCLES",
+                        help="циклов подключение → нагрузка → отключение")
+    parser.add_argument("--settle", type=float, default=10, help="секунд на возврат к исходному после цикла")
+    parser.add_argument("--timeline", action="store_true", help="печатать сбои и p99 по секундам")
+    parser.add_argument("--output", help="JSON-отчёт")
+    args = parser.parse_args()
+
+    # Тысячи сокетов: поднимаем предел дескрипторов (его унаследует и свой ретранслятор)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    repeater = None
+    port, pid = args.port, args.pid
+    if port is None:
+        ports, procs = start_cluster(1, args.engine)
+        port, repeater = ports[0], procs[0]
+        pid = repeater.pid
+    try:
+        probe = raw_client(port, f"loadprobe{os.getpid()}", host=args.host, timeout=60)
+        baseline = {"connections": connections_seen(probe), **repeater_stats(pid)}
+        print(f"ретранслятор: {args.host}:{port}, соединений {baseline['connections']}, "
+              f"потоков {baseline['threads']}, дескрипторов {baseline['fds']}")
+        print(f"{'cycle':>6}{'clients':>8}{'conn fail':>10}{'sends/s':>9}{'deliv/s':>9}{'lost':>7}"
+              f"{'p50 ms':>9}{'p99 ms':>9}{'p999 ms':>9}{'conns':>7}{'threads':>8}{'fds':>6}")
+        cycles = []
+        for cycle in range(args.soak):
+            result = run_cycle(cycle, args, port)
+            if repeater is not None and repeater.poll() is not None:
+                result["after"] = {"exit_code": repeater.returncode}
+                cycles.append(result)
+                print(f"ретранслятор завершился с кодом {repeater.returncode}")
+                break
+            result["after"] = settle(probe, pid, baseline, args.settle)
+            cycles.append(result)
+            after, latency = result["after"], result["latency_ms"]
+            print(f"{cycle:>6}{result['clients']:>8}{result['connect_failures']:>10}{result['sends_per_s']:>9.0f}"
+                  f"{result['deliveries_per_s']:>9.0f}{result['lost']:>7}{latency['p50']:>9.2f}"
+                  f"{latency['p99']:>9.2f}{latency['p999']:>9.2f}{after['connections']:>7}"
+                  f"{str(after['threads']):>8}{str(after['fds']):>6}")
+            if args.timeline:
+                for second in result["timeline"]:
+                    print(f"        {second['second']:>4}s  sent {second['sent']:>7}  delivered "
+                          f"{second['delivered']:>8}  errors {second['errors']:>4}  p99 {second['p99_ms']:.2f} ms")
+            for error in result["errors"][:3]:
+                print(f"        {error}")
+
+        # Утечка — то, что не вернулось к исходному после отключения всех клиентов
+        leaks = {}
+        finals = [c["after"] for c in cycles if "connections" in c["after"]]
+        if finals:
+            last = finals[-1]
+            for key in ("connections", "threads", "fds"):
+                if last[key] is not None and baseline[key] is not None and last[key] > baseline[key]:
+                    leaks[key] = [after[key] for after in finals]
+        print("утечки: " + (", ".join(f"{key} {values}" for key, values in leaks.items()) if leaks else "нет"))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"args": vars(args), "baseline": baseline, "cycles": cycles, "leaks": leaks},
+                          f, indent=2, ensure_ascii=False)
+    finally:
+        if repeater is not None:
+            repeater.kill()
+
+
+if __name__ == "__main__":
+    main()
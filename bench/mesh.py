@@ -0,0 +1,61 @@
+# bench/mesh.py
+"""
+Время одновременного раунда: всё через ретранслятор против прямых
+TCP-соединений и Unix-сокетов между игроками.
+
+    python3 -m bench.mesh --players 2 5 10 --rounds 20
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater
+from mesh import MESH_MODES
+from player import Player
+
+
+def run(players, rounds, mesh, engine, field_size):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    elapsed = {}
+
+    def body(name):
+        player = Player(name, "127.0.0.1", port, field_size=field_size, round_mode="simultaneous", mesh=mesh)
+        player.ask_guess = lambda: (random.randint(1, field_size), random.randint(1, field_size))
+        player.start_game(players)
+        start = time.perf_counter()
+        for round_num in range(1, rounds + 1):
+            player.play_simultaneous_round(round_num)
+        elapsed[name] = time.perf_counter() - start
+        player.conn.close()
+
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    stop_repeater(server)
+    return max(elapsed.values()) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--engine", default="loop")
+    parser.add_argument("--field", type=int, default=10 ** 6)
+    args = parser.parse_args()
+
+    print(f"{'players':>8}" + "".join(f"{mode + ' ms/round':>18}" for mode in MESH_MODES))
+    for n in args.players:
+        row = [run(n, args.rounds, mode, args.engine, args.field) for mode in MESH_MODES]
+        print(f"{n:>8}" + "".join(f"{value * 1000:>18.1f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
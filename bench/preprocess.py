@@ -0,0 +1,93 @@
+# bench/preprocess.py
+"""
+Предобработка масок: задержка хода check_guess с пулом и без него и,
+отдельно, пропускная способность пополнения пула.
+
+    python3 -m bench.preprocess --players 3 --turns 200 --pool 64
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+
+from bench.common import percentile, start_repeater, stop_repeater
+from player import Player
+
+
+def run(players, turns, pool_size, batch, engine, field_size, share_mode):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    latencies = []
+    refill = {}
+
+    def body(name):
+        player = Player(name, "127.0.0.1", port, field_size=field_size, share_mode=share_mode,
+                        pool_size=pool_size, pool_batch=batch)
+        start = time.perf_counter()
+        player.start_game(players)
+        if player.pool is not None and name == "p0":
+            refill["startup"] = time.perf_counter() - start
+        for turn in range(turns):
+            guesser = player.all_players[turn % players]
+            player.sync_barrier(f"turn_{turn}")
+            start = time.perf_counter()
+            if guesser == name:
+                player.check_guess(guesser, random.randint(1, field_size), random.randint(1, field_size))
+                latencies.append(time.perf_counter() - start)
+            else:
+                player.check_guess(guesser)
+            if player.pool is not None:
+                start = time.perf_counter()
+                before = player.pool.next_id
+                player.refill_pool()
+                if name == "p0":
+                    refill.setdefault("sent", 0)
+                    refill["sent"] += player.pool.next_id - before
+                    refill["send_time"] = refill.get("send_time", 0.0) + time.perf_counter() - start
+        if player.pool is not None and name == "p0":
+            refill.update(generated=player.pool.generated, generate_time=player.pool.generate_time,
+                          hits=player.pool.hits, misses=player.pool.misses)
+            player.pool.close()
+        player.conn.close()
+
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    stop_repeater(server)
+    return latencies, refill
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--pool", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--engine", default="loop")
+    parser.add_argument("--field", type=int, default=10 ** 6)
+    parser.add_argument("--shares", default="plain")
+    args = parser.parse_args()
+
+    print(f"{'mode':>8}{'turn p50 ms':>13}{'turn p99 ms':>13}{'mean ms':>10}")
+    for pool_size in (0, args.pool):
+        latencies, refill = run(args.players, args.turns, pool_size, args.batch, args.engine,
+                                args.field, args.shares)
+        mode = f"pool {pool_size}" if pool_size else "online"
+        print(f"{mode:>8}{percentile(latencies, 0.5) * 1e3:>13.2f}{percentile(latencies, 0.99) * 1e3:>13.2f}"
+              f"{sum(latencies) / len(latencies) * 1e3:>10.2f}")
+    # Пополнение: генерация в фоновом потоке и досылка между ходами — раздельно
+    print(f"\nпополнение (p0): сгенерировано {refill['generated']} масок, "
+          f"{refill['generated'] / max(refill['generate_time'], 1e-9):.0f} масок/с в фоне; "
+          f"разослано {refill.get('sent', 0)} между ходами, "
+          f"{refill.get('sent', 0) / max(refill.get('send_time', 0.0), 1e-9):.0f} масок/с; "
+          f"попаданий {refill['hits']}, промахов {refill['misses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# bench/rematch.py
+"""
+Серия партий: время между партиями и возврат после обрыва. Каждая партия
+с нуля (новые соединения, connect, договор о кодеке, Q) против play_session
+на одном соединении (реванш — барьер и новая Q), и возврат игрока по
+контрольной точке против перезапуска партии у всех.
+
+    python3 -m bench.rematch --players 3 10 --games 5 --crash-after 2
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater
+from player import Player
+
+
+class Crash(Exception):
+    """Игрок «упал»: соединение уже закрыто."""
+
+
+class SeriesPlayer(Player):
+    """Догадки случайные; crash_after — на этой своей догадке оборвать соединение."""
+
+    def __init__(self, *args, crash_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crash_after = crash_after
+        self.guesses = 0
+
+    def ask_guess(self):
+        self.guesses += 1
+        if self.guesses == self.crash_after:
+            self.conn.close()
+            raise Crash(self.nickname)
+        return random.randint(1, self.field_size), random.randint(1, self.field_size)
+
+
+def run_threads(players, body):
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def from_scratch(port, players, games, field_size):
+    """Каждая партия — новые Player в своей комнате; время до первого раунда."""
+    gaps = []
+    for game in range(games):
+        ready = {}
+        start = time.perf_counter()
+
+        def body(name):
+            player = SeriesPlayer(name, "127.0.0.1", port, field_size=field_size, room=f"scratch{game}")
+            player.start_game(players)
+            ready[name] = time.perf_counter() - start
+            player.play_rounds()
+            player.conn.close()
+
+        run_threads(players, body)
+        gaps.append(max(ready.values()))
+    return gaps
+
+
+def series(port, players, games, field_size, room, crash_after=None, checkpoints=None):
+    """
+    play_session у всех игроков. Возвращает (время реванша по партиям —
+    максимум по игрокам, время resume упавшего, победители у каждого).
+    """
+    players_spans = {}
+    results = {}
+    resumed = []
+
+    def make(name, crash):
+        return SeriesPlayer(name, "127.0.0.1", port, field_size=field_size, room=room, trace=True,
+                            crash_after=crash, checkpoint=checkpoints and os.path.join(checkpoints, name))
+
+    def body(name):
+        player = make(name, crash_after if name == "p0" else None)
+        try:
+            results[name] = player.play_session(players, games)
+        except Crash:
+            while True:
+                # Ретранслятор мог ещё не заметить обрыв — ник пока занят
+                player = make(name, None)
+                try:
+                    results[name] = player.play_session(players, games)
+                    break
+                except ConnectionError:
+                    time.sleep(0.01)
+            resumed.extend(elapsed for phase, _, elapsed in player.spans.events if phase == "resume")
+        players_spans[name] = player.spans
+
+    run_threads(players, body)
+    rematches = [[elapsed for phase, _, elapsed in spans.events if phase == "rematch"]
+                 for spans in players_spans.values()]
+    per_game = [max(times) for times in zip(*rematches)]
+    return per_game, resumed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--games", type=int, default=5)
+    parser.add_argument("--field", type=int, default=10)
+    parser.add_argument("--crash-after", type=int, default=2, help="на какой своей догадке падает p0")
+    parser.add_argument("--engine", default="loop")
+    args = parser.parse_args()
+
+    server = start_repeater(args.engine)
+    port = server.server_address[1]
+    print(f"{'n':>5}{'scratch ms':>12}{'rematch ms':>12}{'resume ms':>11}{'agreed':>8}")
+    for n in args.players:
+        scratch = from_scratch(port, n, args.games, args.field)
+        rematch, _, results = series(port, n, args.games, args.field, f"series{n}")
+        agreed = len({str(r) for r in results.values()}) == 1
+        with tempfile.TemporaryDirectory() as checkpoints:
+            _, resumed, crashed = series(port, n, args.games, args.field, f"crash{n}", args.crash_after, checkpoints)
+        # У вернувшегося игрока в списке те же партии — начиная с той, в которую он вернулся
+        agreed = agreed and all(crashed[name][-len(crashed["p0"]):] == crashed["p0"] for name in crashed)
+        resume = f"{statistics.median(resumed) * 1e3:>11.2f}" if resumed else f"{'—':>11}"
+        print(f"{n:>5}{statistics.median(scratch) * 1e3:>12.2f}{statistics.median(rematch) * 1e3:>12.2f}"
+              f"{resume}{'да' if agreed else 'нет':>8}")
+    stop_repeater(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# bench/repeater_engines.py
+"""
+Сравнение движков ретранслятора: сколько соединений удерживается
+и какова задержка пересылки a -> b при N простаивающих клиентах.
+
+    python3 -m bench.repeater_engines --idle 2000 --rounds 2000
+"""
+
+import argparse
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater, raw_client, recv_until, percentile
+from repeater import ENGINES
+
+
+def run_engine(engine, idle, rounds):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    a, _ = raw_client(port, "bench_a")
+    b, rest = raw_client(port, "bench_b")
+
+    idle_socks = []
+    failures = 0
+    for i in range(idle):
+        try:
+            sock, _ = raw_client(port, f"idle{i}", timeout=10)
+            idle_socks.append(sock)
+        except OSError:
+            failures += 1
+    threads = threading.active_count()
+
+    latencies = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        a.sendall(f"send bench_b {i}||\n".encode())
+        frame, rest = recv_until(b, b"||", rest)
+        latencies.append(time.perf_counter() - start)
+
+    for sock in idle_socks + [a, b]:
+        sock.close()
+    stop_repeater(server)
+    return {
+        "engine": engine,
+        "connections": len(idle_socks) + 2,
+        "failures": failures,
+        "threads": threads,
+        "p50_us": percentile(latencies, 0.5) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--idle", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--engine", choices=ENGINES, action="append")
+    args = parser.parse_args()
+
+    print(f"{'engine':<10}{'conns':>8}{'fail':>6}{'threads':>9}{'p50 us':>10}{'p99 us':>10}")
+    for engine in args.engine or ENGINES:
+        r = run_engine(engine, args.idle, args.rounds)
+        print(f"{r['engine']:<10}{r['connections']:>8}{r['failures']:>6}{r['threads']:>9}"
+              f"{r['p50_us']:>10.0f}{r['p99_us']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# bench/replay.py
+"""
+Воспроизведение записанной трассы (run_player.py --record FILE) через
+Player без сети: время разбора кадров, фазы протокола и профиль CPU.
+
+    python3 -m bench.replay trace.bin --players 3 --rounds turns --profile 25
+    python3 -m bench.replay trace.bin --speed 1
+    python3 -m bench.replay --check
+
+Настройки игры (--field, --board, --rounds, ...) должны совпадать с
+записанными — трасса хранит только кадры. Если трасса кончилась раньше
+игры, это печатается, и код выхода — 1. С --check вместо трассы:
+записать настоящие игры на локальном ретрансляторе и проверить, что
+каждая воспроизводится до своего последнего раунда.
+"""
+
+import argparse
+import contextlib
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import tempfile
+import time
+
+from bench.common import start_repeater, stop_repeater
+from bench.rematch import run_threads
+from bench.simulate import ScriptedPlayer
+from codec import CODECS
+from metrics import set_verbosity
+from player import BOARDS, OPEN_MODES, ROUND_MODES, SHARE_MODES, TIE_BREAKS
+from replay import TraceEnded, replay
+from transcript import RECEIVED, read_transcript
+
+
+def record_game(path, players, **options):
+    """Настоящая игра на локальном ретрансляторе; p0 пишет трассу в path. Возвращает p0."""
+    server = start_repeater()
+    port = server.server_address[1]
+    recorded = {}
+
+    def body(name):
+        player = ScriptedPlayer(name, "127.0.0.1", port, room="check",
+                                record=path if name == "p0" else None, **options)
+        player.play(players)
+        recorded[name] = player
+
+    run_threads(players, body)
+    stop_repeater(server)
+    return recorded["p0"]
+
+
+def check(players, field):
+    """
+    Записать и воспроизвести игру в каждом режиме раундов и раскрытия:
+    с reduce метки на ретрансляторе несут nonce игры, и воспроизведение
+    должно взять записанный. Возвращает число провалов.
+    """
+    failed = 0
+    print(f"{'rounds':<14}{'open':<8}{'live':>6}{'replay':>8}")
+    for rounds, open_mode in itertools.product(ROUND_MODES, OPEN_MODES):
+        options = {"field_size": field, "round_mode": rounds, "open_mode": open_mode}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "check.trace")
+            live = record_game(path, players, **options)
+            meta, records = read_transcript(path)[0]
+            try:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    replayed = replay(meta, records, players, **options)[0].completed_round
+            except TraceEnded as e:
+                replayed = f"обрыв {e.player.completed_round}"
+        ok = replayed == live.completed_round
+        failed += not ok
+        print(f"{rounds:<14}{open_mode:<8}{live.completed_round:>6}{replayed:>8}{'' if ok else '  ПРОВАЛ'}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("trace", nargs="?")
+    parser.add_argument("--check", action="store_true",
+                        help="записать настоящие игры и проверить, что они воспроизводятся до конца")
+    parser.add_argument("--session", type=int, default=0, help="номер сессии в файле трассы")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="во сколько раз быстрее записи отдавать кадры; без флага — без пауз")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--field", type=int, default=10)
+    parser.add_argument("--board", choices=BOARDS, default="coords")
+    parser.add_argument("--dims", type=int, default=2)
+    parser.add_argument("--rounds", choices=ROUND_MODES, default="turns")
+    parser.add_argument("--tie-break", choices=TIE_BREAKS, default="first")
+    parser.add_argument("--shares", choices=SHARE_MODES, default="plain")
+    parser.add_argument("--open", choices=OPEN_MODES, default="peers")
+    parser.add_argument("--codec", choices=CODECS, default="binary")
+    parser.add_argument("--pool", type=int, default=0, help="размер пула масок")
+    parser.add_argument("--seed", type=int, default=0, help="зерно догадок")
+    parser.add_argument("--profile", type=int, metavar="N", help="показать N самых дорогих функций (cProfile)")
+    args = parser.parse_args()
+    set_verbosity(0)
+    if args.check:
+        raise SystemExit(1 if check(args.players, args.field) else 0)
+    if args.trace is None:
+        parser.error("нужен файл трассы или --check")
+
+    meta, records = read_transcript(args.trace)[args.session]
+    received = [payload for kind, _, payload in records if kind == RECEIVED]
+    print(f"трасса: {meta['nickname']}, кадров {len(records)} (принято {len(received)}, "
+          f"{sum(map(len, received))} Б), длительность {records[-1][1] if records else 0:.3f} с")
+
+    options = {"field_size": args.field, "board": args.board, "dimensions": args.dims,
+               "round_mode": args.rounds, "tie_break": args.tie_break, "share_mode": args.shares,
+               "open_mode": args.open, "codec": args.codec, "pool_size": args.pool}
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        player, conn = replay(meta, records, args.players, speed=args.speed, seed=args.seed, **options)
+        truncated = None
+    except TraceEnded as e:
+        player, conn, truncated = e.player, e.conn, e
+    if profiler:
+        profiler.disable()
+    elapsed = time.perf_counter() - start
+
+    print(f"воспроизведено {conn.position} из {len(conn.frames)} кадров за {elapsed * 1e3:.1f} мс "
+          f"({conn.position / elapsed:.0f} кадров/с), разобрано сообщений {player.inbox.parsed}, "
+          f"отправлено {conn.sent_bytes} Б")
+    phases = sorted(player.spans.summary().items(), key=lambda item: -item[1]["total_ms"])
+    for name, summary in phases:
+        print(f"  {name:<24}{summary['count']:>7}{summary['total_ms']:>11.2f} мс")
+    if profiler:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("tottime").print_stats(args.profile)
+        print(out.getvalue())
+    if truncated:
+        print(f"НЕПОЛНОЕ воспроизведение: {truncated}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
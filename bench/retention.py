@@ -0,0 +1,105 @@
+# bench/retention.py
+"""
+Память долгой игры: 1000 одновременных раундов с хранением сообщений
+по ходу протокола и без него. Каждый игрок после раунда r шлёт пирам
+ещё и опоздавший дубль diff_share раунда r−1 (как повтор при сбое),
+который больше никому не нужен. Без хранения по раундам такие сообщения
+копятся в Inbox до конца игры.
+
+    python3 -m bench.retention --players 4 --rounds 1000 --every 100
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+import tracemalloc
+
+from bench.common import start_repeater, stop_repeater
+from metrics import set_verbosity
+from player import Player
+
+
+class StalePlayer(Player):
+    """Игрок, досылающий после каждого раунда устаревший дубль."""
+
+    def play_simultaneous_round(self, round_num):
+        winners = super().play_simultaneous_round(round_num)
+        if round_num > 1:
+            msg = self.codec.encode({
+                "type": "diff_share",
+                "from": self.nickname,
+                "round": round_num - 1,
+                "d_x": [0] * self.num_parties,
+                "d_y": [0] * self.num_parties
+            })
+            self.send_to(self.peers, msg)
+        return winners
+
+
+def run(players, rounds, every, retention, mesh):
+    server = start_repeater("loop")
+    port = server.server_address[1]
+    field_size = 10 ** 9
+    inboxes = []
+    samples = []
+    # Все игроки заканчивают раунд k*every и ждут замера
+    checkpoint = threading.Barrier(players, action=lambda: samples.append((
+        len(samples) * every + every,
+        sum(inbox.depth for inbox in inboxes),
+        tracemalloc.get_traced_memory()[0],
+        sum(sum(inbox.evicted.values()) for inbox in inboxes),
+        sum(sum(inbox.overflow.values()) for inbox in inboxes),
+    )))
+
+    def body(name):
+        player = StalePlayer(name, "127.0.0.1", port, field_size=field_size, round_mode="simultaneous", mesh=mesh)
+        player.ask_guess = lambda: (random.randint(1, field_size), random.randint(1, field_size))
+        if not retention:
+            # Как до хранения по раундам: без предела и без выбрасывания законченного
+            player.inbox.limit = None
+            player.inbox.retire = player.inbox.retire_round = lambda *args: None
+        inboxes.append(player.inbox)
+        player.start_game(players)
+        for round_num in range(1, rounds + 1):
+            player.play_simultaneous_round(round_num)
+            if round_num % every == 0:
+                checkpoint.wait()
+        player.conn.close()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stop_repeater(server)
+    return samples, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--every", type=int, default=100, help="замер каждые N раундов")
+    parser.add_argument("--mesh", default="tcp", help="прямые связи между игроками (off — всё через ретранслятор)")
+    args = parser.parse_args()
+
+    set_verbosity(0)
+    for retention in (False, True):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            samples, peak, elapsed = run(args.players, args.rounds, args.every, retention, args.mesh)
+        print(f"хранение по раундам: {'да' if retention else 'нет'}, {elapsed:.1f} с, пик {peak / 2 ** 20:.1f} МБ")
+        print(f"{'round':>7}{'inbox msgs':>12}{'traced MB':>11}{'evicted':>9}{'overflow':>10}")
+        for round_num, depth, traced, evicted, overflow in samples:
+            print(f"{round_num:>7}{depth:>12}{traced / 2 ** 20:>11.2f}{evicted:>9}{overflow:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/rounds.py
+"""
+Время полного круга (каждый игрок угадал по разу): очередные ходы по
+одному, они же конвейером и одновременный раунд. Поле большое, чтобы
+игра не кончилась. --latency добавляет одностороннюю задержку между
+игроками и ретранслятором — тогда видно, сколько сетевых обходов стоит ход.
+
+    python3 -m bench.rounds --players 2 5 10 --cycles 3 --latency 10
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+
+from bench.common import DelayProxy, start_repeater, stop_repeater
+from player import Player
+
+
+def run(players, cycles, mode, engine, field_size, latency=0.0):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    proxy = DelayProxy(port, latency) if latency else None
+    if proxy is not None:
+        port = proxy.port
+    elapsed = {}
+
+    def body(name):
+        round_mode = "simultaneous" if mode == "simultaneous" else "turns"
+        player = Player(name, "127.0.0.1", port, field_size=field_size, round_mode=round_mode)
+        player.ask_guess = lambda: (random.randint(1, field_size), random.randint(1, field_size))
+        player.start_game(players)
+        start = time.perf_counter()
+        round_num = 0
+        for _ in range(cycles):
+            if mode == "simultaneous":
+                round_num += 1
+                player.play_simultaneous_round(round_num)
+                continue
+            if mode == "pipelined":
+                for _ in player.all_players:
+                    round_num += 1
+                    player.play_pipelined_turn(round_num)
+                continue
+            for guesser in player.all_players:
+                round_num += 1
+                player.play_turn(round_num, guesser)
+        elapsed[name] = time.perf_counter() - start
+        player.conn.close()
+
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    if proxy is not None:
+        proxy.close()
+    stop_repeater(server)
+    return max(elapsed.values()) / cycles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--engine", default="loop")
+    parser.add_argument("--field", type=int, default=10 ** 6)
+    parser.add_argument("--latency", type=float, default=0, help="односторонняя задержка до ретранслятора, мс")
+    args = parser.parse_args()
+    latency = args.latency / 1000
+
+    print(f"{'players':>8}{'turns s/cycle':>16}{'pipelined s/cycle':>19}{'simultaneous s/cycle':>22}")
+    for n in args.players:
+        turns = run(n, args.cycles, "turns", args.engine, args.field, latency)
+        pipelined = run(n, args.cycles, "pipelined", args.engine, args.field, latency)
+        simultaneous = run(n, args.cycles, "simultaneous", args.engine, args.field, latency)
+        print(f"{n:>8}{turns:>16.4f}{pipelined:>19.4f}{simultaneous:>22.4f}")
+
+
+if __name__ == "__main__":
+    main()
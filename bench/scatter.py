@@ -0,0 +1,113 @@
+# bench/scatter.py
+"""
+Раздача долей одной командой: сколько системных вызовов записи делает
+игрок и сколько команд разбирает ретранслятор на раздаче Q и на
+одновременный раунд. Режимы: send — как раньше, send на каждого пира
+отдельной записью; batch — те же send, но собранные в одну запись;
+scatter — одна команда scatter на всех пиров.
+
+    python3 -m bench.scatter --players 4 16 64 --rounds 20
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+
+import repeater
+from bench.common import start_repeater, stop_repeater
+from metrics import set_verbosity
+from player import Player
+
+MODES = ("send", "batch", "scatter")
+
+
+def commands_parsed():
+    with repeater.stats.lock:
+        return sum(value for name, value in repeater.stats.counters.items() if name.startswith("commands_total"))
+
+
+class CountingPlayer(Player):
+    """Игрок, у которого соединение переведено в режим mode, а раздача Q — между двумя общими барьерами."""
+
+    def __init__(self, *args, mode="scatter", gate=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mode = mode
+        self.gate = gate
+
+    def generate_secret_point(self):
+        if self.mode != "scatter":
+            self.conn.features.discard("scatter")
+        if self.mode == "send":
+            self.conn.batch = contextlib.nullcontext
+        self.gate.wait()
+        super().generate_secret_point()
+        self.gate.wait()
+
+
+def run(players, rounds, mode, engine):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    field_size = 10 ** 9
+    conns = []
+    samples = []
+    # Замер на границах фаз: все игроки стоят на барьере
+    gate = threading.Barrier(players, action=lambda: samples.append((
+        time.perf_counter(), commands_parsed(), sum(conn.writes for conn in conns))))
+    errors = []
+
+    def body(name):
+        try:
+            player = CountingPlayer(name, "127.0.0.1", port, field_size=field_size,
+                                    round_mode="simultaneous", mode=mode, gate=gate)
+            player.ask_guess = lambda: (random.randint(1, field_size), random.randint(1, field_size))
+            conns.append(player.conn)
+            player.start_game(players)
+            for round_num in range(1, rounds + 1):
+                player.play_simultaneous_round(round_num)
+            gate.wait()
+            player.conn.close()
+        except Exception as e:
+            errors.append(repr(e))
+            gate.abort()
+
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop_repeater(server)
+    if errors:
+        raise RuntimeError(errors[0])
+    (_, q_commands, q_writes), (q_end, round_commands, round_writes), (end, commands, writes) = samples
+    return {
+        "q_writes": (round_writes - q_writes) / players,
+        "q_commands": round_commands - q_commands,
+        "round_writes": (writes - round_writes) / players / rounds,
+        "round_commands": (commands - round_commands) / rounds,
+        "round_ms": (end - q_end) / rounds * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--engine", default="loop")
+    args = parser.parse_args()
+
+    set_verbosity(0)
+    print(f"{'players':>8}{'mode':>9}{'Q writes/player':>17}{'Q commands':>12}"
+          f"{'round writes/player':>21}{'round commands':>16}{'round ms':>10}")
+    for players in args.players:
+        for mode in MODES:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = run(players, args.rounds, mode, args.engine)
+            print(f"{players:>8}{mode:>9}{result['q_writes']:>17.1f}{result['q_commands']:>12}"
+                  f"{result['round_writes']:>21.1f}{result['round_commands']:>16.0f}{result['round_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench/sharing.py
+"""
+Раздача долей: поштучный random.randint против пакетного CSPRNG и
+сжатия зёрнами — время на раздачу и исходящие байты раздающего.
+
+    python3 -m bench.sharing --players 2 10 50 200 --k 1 100 10000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from crypto_utils import expand_seed, generate_additive_shares_vector, generate_seed_shares
+
+
+def legacy_shares_vector(secrets, num_parties, p):
+    """Как было: по random.randint на каждую долю каждого секрета."""
+    vectors = [[] for _ in range(num_parties)]
+    for secret in secrets:
+        shares = [random.randint(0, p - 1) for _ in range(num_parties - 1)]
+        shares.append((secret - sum(shares)) % p)
+        for vector, share in zip(vectors, shares):
+            vector.append(share)
+    return vectors
+
+
+def plain_bytes(vectors, k):
+    """Исходящие байты раздающего: сообщение guess_share каждому пиру."""
+    return sum(len(json.dumps({"type": "guess_share", "from": "p0", "guesser": "p0",
+                               "share_gx": vector[:k], "share_gy": vector[k:]}))
+               for vector in vectors[1:])
+
+
+def seed_bytes(seeds, k):
+    return sum(len(json.dumps({"type": "guess_share", "from": "p0", "guesser": "p0",
+                               "seed": seed.hex(), "count": k}))
+               for seed in seeds if seed is not None)
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 10, 50, 200])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--field", type=int, default=10 ** 6)
+    parser.add_argument("--budget", type=float, default=0.2, help="секунд на одну ячейку таблицы")
+    args = parser.parse_args()
+
+    p = args.field
+    print(f"{'n':>5}{'K':>7}{'randint ms':>12}{'bulk ms':>10}{'seed ms':>10}{'expand ms':>11}"
+          f"{'plain B':>12}{'seed B':>9}")
+    for n in args.players:
+        for k in args.k:
+            secrets = [random.randrange(p) for _ in range(2 * k)]
+            # Число повторов подбираем так, чтобы ячейка укладывалась в budget
+            once, _ = timed(lambda: legacy_shares_vector(secrets, n, p), 1)
+            repeat = max(1, int(args.budget / max(once, 1e-6)))
+            legacy, _ = timed(lambda: legacy_shares_vector(secrets, n, p), repeat)
+            bulk, vectors = timed(lambda: generate_additive_shares_vector(secrets, n, p), repeat)
+            seeded, (seeds, correction) = timed(
+                lambda: generate_seed_shares(secrets, n, p, correction_index=0), repeat)
+            expand, _ = timed(lambda: expand_seed(seeds[1], 2 * k, p), repeat)
+
+            # Проверка: доли из зёрен и поправка складываются в секреты
+            total = [sum(column) % p for column in zip(correction, *(expand_seed(s, 2 * k, p)
+                                                                    for s in seeds if s is not None))]
+            assert total == secrets
+
+            print(f"{n:>5}{k:>7}{legacy * 1e3:>12.2f}{bulk * 1e3:>10.2f}{seeded * 1e3:>10.2f}"
+                  f"{expand * 1e3:>11.3f}{plain_bytes(vectors, k):>12}{seed_bytes(seeds, k):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# bench/simulate.py
+"""
+Полная игра без терминала: ретранслятор на свободном порту localhost и N
+игроков с заданной стратегией догадок в потоках или процессах. Замеряет
+время до Q, задержку раунда, сообщения и байты за раунд и память на
+игрока; отчёт пишет в JSON, чтобы сравнивать прогоны между собой.
+
+    python3 -m bench.simulate --players 2 10 50 200 --field 10 100 --output report.json
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+
+from bench.common import percentile, start_repeater, stop_repeater
+from codec import CODECS
+from crypto_utils import unpack_point
+from framing import FRAME_MODES
+from mesh import MESH_MODES
+from metrics import set_verbosity
+from player import BOARDS, OPEN_MODES, ROUND_MODES, SHARE_MODES, Player
+from session import wrap
+
+# random — случайная клетка; sweep — игроки обходят поле вперемешку, не повторяясь
+STRATEGIES = ("random", "sweep")
+WORKERS = ("threads", "processes")
+
+
+def rss_kb():
+    """Текущий RSS процесса, КБ; без /proc — пиковый."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ScriptedPlayer(Player):
+    """Игрок без input(): догадки по стратегии, счётчики отправленного."""
+
+    def __init__(self, *args, strategy="random", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.strategy = strategy
+        self.guesses = 0
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.q_time = 0.0
+
+    def ask_guess(self):
+        n, d = self.field_size, self.dimensions
+        if self.strategy == "sweep":
+            cell = (self.my_index + self.guesses * self.num_parties) % (n ** d)
+            self.guesses += 1
+            return tuple(c + 1 for c in unpack_point(cell, n, d))
+        return tuple(random.randint(1, n) for _ in range(d))
+
+    def send_to(self, recipients, msg):
+        count = len(recipients) if isinstance(recipients, list) else 1
+        self.sent_messages += count
+        self.sent_bytes += count * len(wrap(self.session, msg).encode())
+        super().send_to(recipients, msg)
+
+    def send_each(self, messages):
+        self.sent_messages += len(messages)
+        self.sent_bytes += sum(len(wrap(self.session, msg).encode()) for msg in messages.values())
+        super().send_each(messages)
+
+    def open_on_repeater(self, *vectors):
+        # Одна команда reduce ретранслятору вместо рассылки всем пирам
+        self.sent_messages += 1
+        self.sent_bytes += len(f"reduce {self.game_key(f'open_{self.openings + 1}')} {self.num_parties} "
+                               f"{self.modulus} {','.join(str(v) for vector in vectors for v in vector)}")
+        return super().open_on_repeater(*vectors)
+
+    def generate_secret_point(self):
+        start = time.perf_counter()
+        super().generate_secret_point()
+        self.q_time = time.perf_counter() - start
+
+
+def play(name, port, players, strategy, max_rounds, options, finished=None):
+    """Одна игра одного игрока; словарь замеров. finished — барьер перед закрытием."""
+    player = ScriptedPlayer(name, "127.0.0.1", port, strategy=strategy, **options)
+    start = time.perf_counter()
+    player.start_game(players)
+    result = {"time_to_q": time.perf_counter() - start, "q_sharing": player.q_time}
+
+    rounds = []
+    winners = []
+    round_num = 0
+
+    def timed(step, *args):
+        messages, sent = player.sent_messages, player.sent_bytes
+        begin = time.perf_counter()
+        outcome = step(*args)
+        rounds.append((time.perf_counter() - begin, player.sent_messages - messages, player.sent_bytes - sent))
+        return outcome
+
+    while not winners and round_num < max_rounds:
+        if player.round_mode == "simultaneous":
+            round_num += 1
+            winners = timed(player.play_simultaneous_round, round_num)
+            continue
+        if player.pipelines_turns():
+            round_num += 1
+            if timed(player.play_pipelined_turn, round_num):
+                winners = [player.turn_guesser(round_num)]
+            continue
+        for guesser in player.all_players:
+            round_num += 1
+            if timed(player.play_turn, round_num, guesser):
+                winners = [guesser]
+            if winners or round_num >= max_rounds:
+                break
+
+    result.update(rounds=rounds, winners=winners, rss_kb=rss_kb(), phases=player.spans.summary())
+    if finished is not None:
+        finished.wait()
+    if player.pool is not None:
+        player.pool.close()
+    player.conn.close()
+    return result
+
+
+def play_process(name, port, players, strategy, max_rounds, options, results):
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results.put((name, play(name, port, players, strategy, max_rounds, options)))
+    except Exception as e:
+        results.put((name, {"error": repr(e)}))
+
+
+def run_threads(port, players, strategy, max_rounds, options, timeout):
+    results = {}
+    # Память меряем, пока все игроки живы: после игры они ждут на барьере
+    finished = threading.Barrier(players + 1)
+
+    def body(name):
+        try:
+            results[name] = play(name, port, players, strategy, max_rounds, options, finished)
+        except Exception as e:
+            results[name] = {"error": repr(e)}
+            finished.abort()
+
+    baseline = rss_kb()
+    threads = [threading.Thread(target=body, args=(f"p{i}",), daemon=True) for i in range(players)]
+    for t in threads:
+        t.start()
+    try:
+        finished.wait(timeout)
+        # Память, освобождённая после прошлого прогона, может сделать разницу отрицательной
+        per_player = max(0, rss_kb() - baseline) / players
+    except threading.BrokenBarrierError:
+        per_player = None
+    for t in threads:
+        t.join(timeout)
+    for result in results.values():
+        if "rss_kb" in result:
+            result["rss_kb"] = per_player
+    return results
+
+
+def run_processes(port, players, strategy, max_rounds, options, timeout):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=play_process,
+                                     args=(f"p{i}", port, players, strategy, max_rounds, options, results),
+                                     daemon=True)
+             for i in range(players)]
+    for p in procs:
+        p.start()
+    collected = {}
+    try:
+        for _ in procs:
+            name, result = results.get(timeout=timeout)
+            collected[name] = result
+    finally:
+        for p in procs:
+            p.join(1)
+            if p.is_alive():
+                p.terminate()
+    return collected
+
+
+def summarize(players, field_size, results, wall):
+    errors = {name: r["error"] for name, r in results.items() if "error" in r}
+    games = [r for r in results.values() if "error" not in r]
+    summary = {"players": players, "field": field_size, "wall_s": round(wall, 4), "errors": errors}
+    if len(games) < players:
+        summary["errors"].setdefault("_", f"закончили {len(games)} из {players}")
+    if not games:
+        return summary
+    # Раунд закончен, когда его закончил последний игрок; трафик — сумма по всем
+    per_round = list(zip(*(r["rounds"] for r in games)))
+    latency = [max(d for d, _, _ in row) for row in per_round]
+    messages = [sum(m for _, m, _ in row) for row in per_round]
+    sent = [sum(b for _, _, b in row) for row in per_round]
+    memory = [r["rss_kb"] for r in games if r["rss_kb"] is not None]
+    count = max(1, len(per_round))
+    summary.update({
+        "rounds": len(per_round),
+        "winners": games[0]["winners"],
+        "time_to_q_s": round(max(r["time_to_q"] for r in games), 4),
+        "q_sharing_s": round(max(r["q_sharing"] for r in games), 4),
+        "round_latency_ms": {
+            "mean": round(sum(latency) / count * 1000, 3),
+            "p50": round(percentile(latency, 0.5) * 1000, 3),
+            "p99": round(percentile(latency, 0.99) * 1000, 3),
+            "max": round(max(latency, default=0) * 1000, 3),
+        },
+        "messages_per_round": round(sum(messages) / count, 1),
+        "bytes_per_round": round(sum(sent) / count, 1),
+        # Фазы протокола: время самого медленного игрока по каждой
+        "phase_ms": {name: max(r["phases"].get(name, {"total_ms": 0})["total_ms"] for r in games)
+                     for name in sorted({name for r in games for name in r["phases"]})},
+        "memory_per_player_kb": {
+            "mean": round(sum(memory) / len(memory), 1) if memory else None,
+            "max": round(max(memory), 1) if memory else None,
+        },
+    })
+    return summary
+
+
+def simulate(players, field_size, args, options):
+    server = start_repeater(args.engine)
+    port = server.server_address[1]
+    options = dict(options, field_size=field_size)
+    start = time.perf_counter()
+    try:
+        if args.workers == "processes":
+            results = run_processes(port, players, args.strategy, args.max_rounds, options, args.timeout)
+        else:
+            results = run_threads(port, players, args.strategy, args.max_rounds, options, args.timeout)
+    finally:
+        stop_repeater(server)
+    return summarize(players, field_size, results, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 10, 50, 200])
+    parser.add_argument("--field", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--strategy", choices=STRATEGIES, default="sweep")
+    parser.add_argument("--workers", choices=WORKERS, default="threads")
+    parser.add_argument("--rounds", choices=ROUND_MODES, default="simultaneous")
+    parser.add_argument("--shares", choices=SHARE_MODES, default="plain")
+    parser.add_argument("--open", choices=OPEN_MODES, default="peers")
+    parser.add_argument("--board", choices=BOARDS, default="coords")
+    parser.add_argument("--dims", type=int, default=2, help="размерность поля (больше 2 — с --board packed)")
+    parser.add_argument("--codec", choices=CODECS, default="binary")
+    parser.add_argument("--frames", choices=FRAME_MODES, default="text")
+    parser.add_argument("--mesh", choices=MESH_MODES, default="off")
+    parser.add_argument("--pool", type=int, default=0, help="размер пула масок")
+    parser.add_argument("--max-rounds", type=int, default=50, help="остановить игру без победителя")
+    parser.add_argument("--engine", default="loop")
+    parser.add_argument("--timeout", type=float, default=600, help="секунд на одну игру")
+    parser.add_argument("--output", default="simulate_report.json")
+    args = parser.parse_args()
+    # Печать на каждое сообщение всё равно уходит в /dev/null — не тратим на неё время
+    set_verbosity(0)
+
+    options = {"round_mode": args.rounds, "share_mode": args.shares, "open_mode": args.open, "codec": args.codec,
+               "frame_mode": args.frames, "mesh": args.mesh, "pool_size": args.pool,
+               "board": args.board, "dimensions": args.dims}
+    report = {
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "engine": args.engine,
+        "workers": args.workers,
+        "strategy": args.strategy,
+        "options": options,
+        "max_rounds": args.max_rounds,
+        "scenarios": [],
+    }
+    print(f"{'players':>8}{'field':>7}{'rounds':>7}{'to Q s':>8}{'round p50 ms':>14}{'round p99 ms':>14}"
+          f"{'msgs/round':>12}{'bytes/round':>13}{'KB/player':>11}")
+    for field_size in args.field:
+        for n in args.players:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                summary = simulate(n, field_size, args, options)
+            report["scenarios"].append(summary)
+            if summary["errors"] or "rounds" not in summary:
+                print(f"{n:>8}{field_size:>7}  ошибки: {summary['errors']}")
+                continue
+            latency = summary["round_latency_ms"]
+            memory = summary["memory_per_player_kb"]["mean"]
+            print(f"{n:>8}{field_size:>7}{summary['rounds']:>7}{summary['time_to_q_s']:>8.3f}"
+                  f"{latency['p50']:>14.2f}{latency['p99']:>14.2f}{summary['messages_per_round']:>12.0f}"
+                  f"{summary['bytes_per_round']:>13.0f}{memory if memory is not None else float('nan'):>11.0f}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"отчёт: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
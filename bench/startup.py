@@ -0,0 +1,54 @@
+# bench/startup.py
+"""
+Время до первого раунда: N игроков в потоках подключаются к
+ретранслятору на localhost, ждут друг друга, проходят game_start,
+генерируют Q и барьер point_generated.
+
+    python3 -m bench.startup --players 2 10 100
+"""
+
+import argparse
+import contextlib
+import os
+import threading
+import time
+
+from bench.common import start_repeater, stop_repeater
+from player import Player
+
+
+def time_to_first_round(players, engine, field_size):
+    server = start_repeater(engine)
+    port = server.server_address[1]
+    ready = {}
+    start = time.perf_counter()
+
+    def run(name):
+        player = Player(name, "127.0.0.1", port, field_size=field_size)
+        player.start_game(players)
+        ready[name] = time.perf_counter() - start
+        player.conn.close()
+
+    threads = [threading.Thread(target=run, args=(f"p{i}",), daemon=True) for i in range(players)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    stop_repeater(server)
+    return max(ready.values()) if len(ready) == players else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 10, 100])
+    parser.add_argument("--engine", default="loop")
+    parser.add_argument("--field", type=int, default=10)
+    args = parser.parse_args()
+
+    for n in args.players:
+        print(f"{n:>5} игроков: {time_to_first_round(n, args.engine, args.field):8.2f} с до первого раунда")
+
+
+if __name__ == "__main__":
+    main()
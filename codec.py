@@ -0,0 +1,180 @@
+# codec.py
+
+import base64
+import binascii
+import json
+import struct
+
+from crypto_utils import decode_elements, element_bytes, encode_elements
+
+# Двоичные сообщения идут через ретранслятор как текст: маркер + base64,
+# в алфавите которого нет ни \n, ни |, ни {
+BINARY_MARKER = "~"
+CODECS = ("json", "binary")
+
+# Виды полей фиксированной раскладки
+ELEM = "elem"   # элемент поля, 1/2/4/8 байт по размеру поля (шире — сколько нужно)
+VEC = "vec"     # 4 байта длины + элементы
+NICK = "nick"   # номер игрока в all_players, 2 байта
+U32 = "u32"     # номер раунда или маски, 4 байта
+TEXT = "text"   # строка до 255 байт (имя барьера)
+BLOB = "blob"   # hex-строка до 255 байт, передаётся самими байтами (зерно)
+
+_NICK = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+_BYTE = struct.Struct("!B")
+
+# Раскладки горячих сообщений; номер раскладки — первый байт сообщения
+LAYOUTS = (
+    ("share", (("from", NICK), ("share_x", ELEM), ("share_y", ELEM))),
+    ("share", (("from", NICK), ("seed", BLOB))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("share_gx", ELEM), ("share_gy", ELEM))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("seed", BLOB))),
+    ("diff_share", (("from", NICK), ("guesser", NICK), ("d_x", ELEM), ("d_y", ELEM))),
+    ("diff_share", (("from", NICK), ("guesser", NICK), ("d_x", ELEM), ("d_y", ELEM),
+                    ("mask", U32), ("e_x", ELEM), ("e_y", ELEM))),
+    ("diff_share", (("from", NICK), ("guesser", NICK), ("d_x", VEC), ("d_y", VEC))),
+    ("diff_share", (("from", NICK), ("round", U32), ("d_x", VEC), ("d_y", VEC))),
+    ("barrier", (("from", NICK), ("name", TEXT))),
+    # Ходы конвейером: вместо угадывающего — номер раунда
+    ("guess_share", (("from", NICK), ("round", U32), ("share_gx", ELEM), ("share_gy", ELEM))),
+    ("guess_share", (("from", NICK), ("round", U32), ("seed", BLOB))),
+    ("diff_share", (("from", NICK), ("round", U32), ("d_x", ELEM), ("d_y", ELEM))),
+    # Поле packed: вся точка — один элемент по модулю n^d
+    ("share", (("from", NICK), ("share_p", ELEM))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("share_gp", ELEM))),
+    ("guess_share", (("from", NICK), ("round", U32), ("share_gp", ELEM))),
+    ("diff_share", (("from", NICK), ("guesser", NICK), ("d_p", ELEM))),
+    ("diff_share", (("from", NICK), ("guesser", NICK), ("d_p", VEC))),
+    ("diff_share", (("from", NICK), ("round", U32), ("d_p", ELEM))),
+    ("diff_share", (("from", NICK), ("round", U32), ("d_p", VEC))),
+    # Одновременный раунд: угадывающий и номер раунда
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("round", U32), ("share_gx", ELEM), ("share_gy", ELEM))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("round", U32), ("seed", BLOB))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("round", U32), ("share_gp", ELEM))),
+    # Пакет догадок: векторы долей или зерно с их длиной
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("share_gx", VEC), ("share_gy", VEC))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("share_gp", VEC))),
+    ("guess_share", (("from", NICK), ("guesser", NICK), ("seed", BLOB), ("count", U32))),
+    # Партия масок пула
+    ("pool", (("from", NICK), ("first", U32), ("r_x", VEC), ("r_y", VEC))),
+    ("pool", (("from", NICK), ("first", U32), ("seed", BLOB), ("count", U32))),
+)
+
+
+class JsonCodec:
+    """Исходный формат: json.dumps/json.loads."""
+
+    name = "json"
+
+    def encode(self, data):
+        return json.dumps(data)
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+class BinaryCodec:
+    """
+    Фиксированная двоичная раскладка для share, guess_share, diff_share,
+    pool и barrier: элементы поля упакованы struct в самую узкую ширину, которой
+    хватает для field_size (без него — 8 байт), никнеймы заменены номерами
+    в all_players. Поле шире 64 бит (packed-доска n^d) пишется байтами
+    фиксированной ширины из crypto_utils. Сообщения без подходящей
+    раскладки (и значения, которые в неё не помещаются) кодируются JSON;
+    decode понимает оба формата.
+    """
+
+    name = "binary"
+
+    def __init__(self, players, field_size=None):
+        bits = (field_size - 1).bit_length() if field_size else 64
+        # Больше 8 байт struct не умеет — такие элементы пишет crypto_utils
+        self.modulus = field_size if bits > 64 else None
+        self.elem_code = next(code for code, width in (("B", 8), ("H", 16), ("I", 32), ("Q", 64))
+                              if bits <= width or code == "Q")
+        self.elem = struct.Struct("!" + self.elem_code)
+        self.elem_size = element_bytes(field_size) if self.modulus else self.elem.size
+        self.players = list(players)
+        self.index = {player: i for i, player in enumerate(self.players)}
+        self.layouts = {}
+        for number, (msg_type, fields) in enumerate(LAYOUTS):
+            key = (msg_type, frozenset(name for name, _ in fields))
+            self.layouts.setdefault(key, []).append((number, fields))
+
+    def _pack_elems(self, values):
+        if self.modulus is None:
+            return struct.pack(f"!{len(values)}{self.elem_code}", *values)
+        if not all(isinstance(value, int) and 0 <= value < self.modulus for value in values):
+            raise ValueError("элемент вне поля")
+        return encode_elements(values, self.modulus)
+
+    def _unpack_elems(self, blob, offset, count):
+        if self.modulus is None:
+            return list(struct.unpack_from(f"!{count}{self.elem_code}", blob, offset))
+        return decode_elements(blob, count, self.modulus, offset)
+
+    def _pack(self, number, fields, data):
+        out = bytearray(_BYTE.pack(number))
+        for name, kind in fields:
+            value = data[name]
+            if kind == ELEM:
+                if isinstance(value, list):
+                    raise TypeError(name)
+                out += self._pack_elems([value])
+            elif kind == VEC:
+                if not isinstance(value, list):
+                    raise TypeError(name)
+                out += _U32.pack(len(value))
+                out += self._pack_elems(value)
+            elif kind == NICK:
+                out += _NICK.pack(self.index[value])
+            elif kind == U32:
+                out += _U32.pack(value)
+            else:
+                raw = value.encode() if kind == TEXT else bytes.fromhex(value)
+                out += _BYTE.pack(len(raw)) + raw
+        return out
+
+    def encode(self, data):
+        candidates = self.layouts.get((data.get("type"), frozenset(data) - {"type"}), ())
+        for number, fields in candidates:
+            try:
+                packed = self._pack(number, fields, data)
+            except (KeyError, TypeError, ValueError, struct.error):
+                continue
+            return BINARY_MARKER + base64.b64encode(packed).decode()
+        return json.dumps(data)
+
+    def decode(self, raw):
+        if not raw.startswith(BINARY_MARKER):
+            return json.loads(raw)
+        try:
+            blob = base64.b64decode(raw[len(BINARY_MARKER):], validate=True)
+            msg_type, fields = LAYOUTS[blob[0]]
+            data = {"type": msg_type}
+            offset = 1
+            for name, kind in fields:
+                if kind == ELEM:
+                    (data[name],) = self._unpack_elems(blob, offset, 1)
+                    offset += self.elem_size
+                elif kind == VEC:
+                    (count,) = _U32.unpack_from(blob, offset)
+                    offset += _U32.size
+                    data[name] = self._unpack_elems(blob, offset, count)
+                    offset += count * self.elem_size
+                elif kind == NICK:
+                    (number,) = _NICK.unpack_from(blob, offset)
+                    data[name] = self.players[number]
+                    offset += _NICK.size
+                elif kind == U32:
+                    (data[name],) = _U32.unpack_from(blob, offset)
+                    offset += _U32.size
+                else:
+                    (length,) = _BYTE.unpack_from(blob, offset)
+                    value = blob[offset + 1:offset + 1 + length]
+                    data[name] = value.decode() if kind == TEXT else value.hex()
+                    offset += 1 + length
+        except (binascii.Error, IndexError, ValueError, struct.error) as e:
+            raise ValueError(f"повреждённое двоичное сообщение: {e}") from e
+        return data
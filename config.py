@@ -3,8 +3,61 @@
 SERVER_HOST = "45.67.32.157"
 SERVER_PORT = 62000  # Используем порт 62000, можно менять 62000-62009
 
+# Кадрирование на проводе: text (маркеры || и \n) или lp (префикс длины,
+# договариваемся с ретранслятором после выбора никнейма)
+FRAME_MODE = "text"
+
+# Интервал опроса print, если ретранслятор не поддерживает wait N
+PEER_POLL_INTERVAL = 1
+
 FIELD_SIZE = 10  # n - размер поля n x n (стороны договариваются заранее)
 
+# Доска (тоже договариваются заранее): coords — координаты x и y делятся и
+# раскрываются по отдельности; packed — точка поля n^DIMENSIONS одним
+# числом по модулю n^DIMENSIONS, при любой размерности один элемент
+BOARD = "coords"
+DIMENSIONS = 2
+
+# Режим раундов (тоже договариваются заранее): turns — по очереди,
+# simultaneous — все угадывают одновременно, TIE_BREAK решает ничьи
+ROUND_MODE = "turns"
+TIE_BREAK = "first"
+
+# Раздача долей: plain — сами доли каждому пиру, seed — короткие зёрна,
+# из которых пиры разворачивают доли локально (принимаются оба варианта)
+SHARE_MODE = "plain"
+
+# Раскрытие долей разности (тоже договариваются заранее): peers — каждый
+# рассылает свои всем, reduce — сумму считает ретранслятор. Ретранслятор
+# без reduce (и кластер) — всегда peers
+OPEN_MODE = "peers"
+
+# Предобработка (тоже договариваются заранее): сколько случайных масок
+# держать розданными впрок (0 — без пула) и по сколько рассылать за раз
+PREPROCESS_POOL = 0
+PREPROCESS_BATCH = 16
+
+# Кодек сообщений: binary — компактная двоичная раскладка, если её
+# поддерживают все игроки (договариваются на старте), иначе json
+CODEC = "binary"
+
+# Комната на ретрансляторе (команда join): в каждой своя игра,
+# None — общая комната, как у ретранслятора без комнат
+ROOM = None
+
+# Прямые соединения между игроками после знакомства через ретранслятор:
+# off, tcp или unix (Unix-сокеты для игроков на одной машине)
+MESH = "off"
+
+# Пределы очередей игрока: сырые кадры в соединении и разобранные
+# сообщения в Inbox. Сверх предела вытесняются самые старые (и считаются)
+QUEUE_LIMIT = 100000
+INBOX_LIMIT = 10000
+
+# Подробность вывода игрока: 0 — только итог игры, 1 — ход игры,
+# 2 — каждое сообщение (доли, барьеры, сеть)
+VERBOSITY = 2
+
 # Большое простое число для модулярной арифметики
 # Берём простое > n, чтобы арифметика работала корректно
-PRIME = 1000000007
\ No newline at end of file
+PRIME = 1000000007
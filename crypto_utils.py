@@ -1,6 +1,38 @@
 # crypto_utils.py
 
-import random
+import hashlib
+import os
+from config import PRIME
+
+SEED_BYTES = 16
+
+
+def _element_width(p):
+    """Байт на элемент Z_p: запас в 64 бита делает смещение от взятия по модулю пренебрежимым."""
+    return (p.bit_length() + 64 + 7) // 8
+
+
+def _elements_from_bytes(data, count, p):
+    width = _element_width(p)
+    from_bytes = int.from_bytes
+    return [from_bytes(data[i:i + width], "big") % p for i in range(0, count * width, width)]
+
+
+def random_field_elements(count, p=None, randbytes=os.urandom):
+    """
+    count случайных элементов Z_p из одного вызова randbytes — по умолчанию
+    os.urandom (CSPRNG); воспроизведение трассы подставляет ГПСЧ с зерном.
+    """
+    if p is None:
+        p = PRIME
+    return _elements_from_bytes(randbytes(count * _element_width(p)), count, p)
+
+
+def expand_seed(seed, count, p=None):
+    """Развернуть короткое зерно в count элементов Z_p; SHAKE-256 в роли ГПСЧ."""
+    if p is None:
+        p = PRIME
+    return _elements_from_bytes(hashlib.shake_256(seed).digest(count * _element_width(p)), count, p)
 
 
 def generate_additive_shares(secret, num_parties, p=None):
@@ -9,17 +41,97 @@ def generate_additive_shares(secret, num_parties, p=None):
     сумма которых по модулю p равна secret.
     """
     if p is None:
-        from config import PRIME
         p = PRIME
-    shares = [random.randint(0, p - 1) for _ in range(num_parties - 1)]
+    shares = random_field_elements(num_parties - 1, p)
     last_share = (secret - sum(shares)) % p
     shares.append(last_share)
     return shares
 
 
+def generate_additive_shares_vector(secrets, num_parties, p=None, randbytes=os.urandom):
+    """
+    Аддитивное разбиение сразу K секретов. Возвращает num_parties векторов
+    длины K: i-й вектор — доли i-й стороны по всем секретам.
+    """
+    if p is None:
+        p = PRIME
+    k = len(secrets)
+    flat = random_field_elements(k * (num_parties - 1), p, randbytes)
+    vectors = [flat[i * k:(i + 1) * k] for i in range(num_parties - 1)]
+    sums = [sum(column) for column in zip(*vectors)] if vectors else [0] * k
+    vectors.append([(secret - total) % p for secret, total in zip(secrets, sums)])
+    return vectors
+
+
+def generate_seed_shares(secrets, num_parties, p=None, correction_index=None, randbytes=os.urandom):
+    """
+    Разбиение со сжатием зёрнами: каждая сторона, кроме correction_index,
+    получает короткое зерно и сама разворачивает из него свои K долей
+    (expand_seed), а стороне correction_index достаётся явный вектор
+    поправки. Возвращает (seeds, correction), seeds[correction_index] — None.
+    """
+    if p is None:
+        p = PRIME
+    if correction_index is None:
+        correction_index = num_parties - 1
+    k = len(secrets)
+    seeds = [None if i == correction_index else randbytes(SEED_BYTES) for i in range(num_parties)]
+    expanded = [expand_seed(seed, k, p) for seed in seeds if seed is not None]
+    sums = [sum(column) for column in zip(*expanded)] if expanded else [0] * k
+    correction = [(secret - total) % p for secret, total in zip(secrets, sums)]
+    return seeds, correction
+
+
+def reconstruct_additive_vector(vectors, p=None):
+    """Поэлементно восстанавливает K секретов из векторов долей всех сторон."""
+    if p is None:
+        p = PRIME
+    return [sum(column) % p for column in zip(*vectors)]
+
+
 def reconstruct_additive(shares, p=None):
     """Восстанавливает секрет из аддитивных долей."""
     if p is None:
-        from config import PRIME
         p = PRIME
-    return sum(shares) % p
\ No newline at end of file
+    return sum(shares) % p
+
+
+def pack_point(coords, n):
+    """
+    Точка d-мерного поля со сторонами n (координаты 0..n-1, первая старшая)
+    одним числом 0..n^d-1: точки равны, только если равны эти числа.
+    """
+    value = 0
+    for c in coords:
+        value = value * n + c
+    return value
+
+
+def unpack_point(value, n, d):
+    """Обратное к pack_point: d координат 0..n-1."""
+    coords = []
+    for _ in range(d):
+        value, c = divmod(value, n)
+        coords.append(c)
+    return coords[::-1]
+
+
+def element_bytes(p):
+    """Ширина элемента Z_p на проводе, байт: столько, чтобы поместилось p-1."""
+    return max(1, ((p - 1).bit_length() + 7) // 8)
+
+
+def encode_elements(values, p):
+    """Элементы Z_p подряд, каждый — element_bytes(p) байт big-endian; для p любой величины."""
+    width = element_bytes(p)
+    return b"".join(value.to_bytes(width, "big") for value in values)
+
+
+def decode_elements(data, count, p, offset=0):
+    """count элементов Z_p, записанных encode_elements, начиная с offset."""
+    width = element_bytes(p)
+    end = offset + count * width
+    if end > len(data):
+        raise ValueError("мало байт для элементов")
+    from_bytes = int.from_bytes
+    return [from_bytes(data[i:i + width], "big") for i in range(offset, end, width)]
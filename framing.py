@@ -0,0 +1,137 @@
+# framing.py
+
+import struct
+
+# text — команды завершаются \n, сообщения от ретранслятора маркером ||;
+# lp — каждый кадр предваряется 4-байтной длиной (big-endian)
+FRAME_MODES = ("text", "lp")
+LENGTH = struct.Struct("!I")
+# Больше этого кадр не бывает: заголовок lp (или строка text без
+# разделителя) длиннее — испорченный или враждебный поток
+MAX_FRAME = 16 * 1024 * 1024
+
+
+class FrameError(ConnectionError):
+    """Поток нельзя разобрать на кадры — соединение остаётся только закрыть."""
+
+
+def pack_frame(payload):
+    """Кадр режима lp: длина + данные."""
+    return LENGTH.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """
+    Приёмный буфер байтового потока: recv_into в заранее выделенный
+    bytearray и нарезка на кадры по разделителям (режим text) или по
+    префиксу длины (режим lp). Копируется только готовый кадр, хвост
+    буфера не сдвигается на каждом кадре и не сканируется повторно.
+    Кадр режима text возвращается вместе со своим разделителем.
+    Кадр длиннее max_frame — FrameError, буфер под него не выделяется.
+    """
+
+    def __init__(self, delimiters=(b"\n",), size=65536, mode="text", max_frame=MAX_FRAME):
+        self.mode = mode
+        self.max_frame = max_frame
+        self.delimiters = tuple(delimiters)
+        # Для каждого разделителя: найденная позиция (или -1) и граница,
+        # до которой его в буфере точно нет — чтобы не сканировать заново
+        self.hits = [-1] * len(self.delimiters)
+        self.misses = [0] * len(self.delimiters)
+        self.chunk = size
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _reserve(self, n):
+        """Гарантирует n свободных байт после end."""
+        if len(self.buf) - self.end >= n:
+            return
+        pending = self.end - self.start
+        if self.start:
+            self.buf[:pending] = bytes(self.view[self.start:self.end])
+            self.hits = [h - self.start if h != -1 else -1 for h in self.hits]
+            self.misses = [max(0, m - self.start) for m in self.misses]
+            self.start, self.end = 0, pending
+        if len(self.buf) - self.end < n:
+            self.view.release()
+            self.buf.extend(bytes(max(n, len(self.buf))))
+            self.view = memoryview(self.buf)
+
+    def recv_into(self, sock):
+        """Читает из сокета прямо в буфер. Возвращает число байт (0 — соединение закрыто)."""
+        self._reserve(self.chunk // 4)
+        n = sock.recv_into(self.view[self.end:])
+        self.end += n
+        return n
+
+    def feed(self, data):
+        self._reserve(len(data))
+        self.buf[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def take_until(self, marker):
+        """Забирает данные до marker включительно, без разбиения на кадры."""
+        idx = self.buf.find(marker, self.start, self.end)
+        if idx == -1:
+            return None
+        return self._take(idx + len(marker), self.start)
+
+    def take_all(self):
+        return self._take(self.end, self.start)
+
+    def _take(self, stop, begin):
+        frame = bytes(self.view[begin:stop])
+        self.start = stop
+        if self.start == self.end:
+            self.start = self.end = 0
+            self.hits = [-1] * len(self.delimiters)
+            self.misses = [0] * len(self.delimiters)
+        return frame
+
+    def _find_delimiter(self):
+        """Ближайший разделитель после start: (позиция, длина) или None."""
+        best = None
+        for i, delimiter in enumerate(self.delimiters):
+            hit = self.hits[i]
+            if hit < self.start:
+                begin = max(self.start, self.misses[i])
+                hit = self.buf.find(delimiter, begin, self.end)
+                if hit == -1:
+                    self.misses[i] = max(begin, self.end - len(delimiter) + 1)
+                self.hits[i] = hit
+            if hit != -1 and (best is None or hit < best[0]):
+                best = (hit, len(delimiter))
+        return best
+
+    def next_frame(self):
+        """Следующий полный кадр или None, если кадр ещё не дочитан."""
+        if self.mode == "lp":
+            if self.end - self.start < LENGTH.size:
+                return None
+            (length,) = LENGTH.unpack_from(self.buf, self.start)
+            if length > self.max_frame:
+                raise FrameError(f"кадр {length} Б больше допустимых {self.max_frame} Б")
+            stop = self.start + LENGTH.size + length
+            if stop > self.end:
+                self._reserve(stop - self.end)
+                return None
+            return self._take(stop, self.start + LENGTH.size)
+
+        found = self._find_delimiter()
+        if found is None:
+            if self.end - self.start > self.max_frame:
+                raise FrameError(f"строка без разделителя длиннее {self.max_frame} Б")
+            return None
+        return self._take(found[0] + found[1], self.start)
+
+    def frames(self):
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
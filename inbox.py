@@ -0,0 +1,213 @@
+# inbox.py
+
+import collections
+import json
+import time
+
+from config import INBOX_LIMIT
+from session import unwrap
+
+# Сколько законченных ключей (барьеров) помнить, чтобы отбрасывать опоздавших
+RETIRED_KEYS = 4096
+
+
+def message_key(data):
+    """
+    Ключ индекса: тип сообщения и чей это ход/барьер (guesser или name),
+    а для сообщений без них — номер раунда.
+    """
+    return data.get("type"), data.get("guesser", data.get("name", data.get("round")))
+
+
+class Inbox:
+    """
+    Почтовый ящик между RepeaterConnection и Player. Каждый кадр
+    разбирается ровно один раз (decode — json.loads или кодек игрока,
+    см. codec.py) и раскладывается по индексу
+    (type, guesser/name) -> from -> очередь, так что ожидание сообщения
+    нужного типа не пересматривает чужие сообщения.
+
+    Хранение привязано к ходу протокола: после retire/retire_round
+    сообщения законченного барьера или раунда выбрасываются, а
+    опоздавшие не сохраняются (evicted). Сверх limit сообщений
+    вытесняются самые старые (overflow).
+
+    Сообщения игр из upcoming (следующая партия, переигровка после обрыва)
+    не отбрасываются, а ждут switch. Типы из control не раскладываются —
+    их сразу получает обработчик, даже пока игрок ждёт другое сообщение.
+    """
+
+    def __init__(self, conn, session=None, limit=INBOX_LIMIT):
+        self.conn = conn
+        # Сообщения других игр (сессий) отбрасываются и только считаются
+        self.session = session
+        self.foreign = 0
+        self.upcoming = set()
+        self.early = collections.deque()
+        self.control = {}
+        self.boxes = {}
+        self.depth = 0
+        self.max_depth = 0
+        self.parsed = 0
+        self.decode = json.loads
+        self.limit = limit
+        # Законченные ключи (type, tag) и раунды: все раунды <= retired_round
+        self.retired = collections.OrderedDict()
+        self.retired_round = 0
+        # По типам: выброшено как устаревшее и вытеснено по пределу
+        self.evicted = collections.Counter()
+        self.overflow = collections.Counter()
+
+    def queue_depth(self):
+        """Сколько сообщений ждёт разбора: разложенные + сырые в соединении."""
+        return self.depth + len(self.conn.message_queue)
+
+    def _file(self, raw):
+        session, payload = unwrap(raw)
+        if self.session is not None and session != self.session:
+            if session in self.upcoming and (self.limit is None or len(self.early) < self.limit):
+                self.early.append(raw)
+            else:
+                self.foreign += 1
+            return
+        try:
+            data = self.decode(payload)
+        except ValueError:
+            return
+        self.parsed += 1
+        handler = self.control.get(data.get("type"))
+        if handler is not None:
+            handler(data)
+            return
+        key = message_key(data)
+        if self._stale(key):
+            self.evicted[key[0]] += 1
+            return
+        senders = self.boxes.setdefault(key, collections.OrderedDict())
+        senders.setdefault(data.get("from"), collections.deque()).append(data)
+        self.depth += 1
+        if self.limit is not None and self.depth > self.limit:
+            self._overflow()
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def _stale(self, key):
+        tag = key[1]
+        if type(tag) is int and tag <= self.retired_round:
+            return True
+        return key in self.retired
+
+    def _overflow(self):
+        """Предел превышен: вытеснить самое старое сообщение из самой старой ячейки."""
+        key = next(iter(self.boxes))
+        senders = self.boxes[key]
+        sender = next(iter(senders))
+        senders[sender].popleft()
+        self.overflow[key[0]] += 1
+        self._taken(senders, key, sender, None)
+
+    def _evict(self, key):
+        senders = self.boxes.pop(key, None)
+        if senders:
+            count = sum(len(queue) for queue in senders.values())
+            self.depth -= count
+            self.evicted[key[0]] += count
+
+    def retire(self, key):
+        """Ключ (type, tag) закончен: выбросить его сообщения и не хранить опоздавшие."""
+        self.retired[key] = None
+        if len(self.retired) > RETIRED_KEYS:
+            self.retired.popitem(last=False)
+        self._evict(key)
+
+    def retire_round(self, round_num):
+        """Раунды до round_num включительно закончены: выбросить все их сообщения."""
+        self.retired_round = max(self.retired_round, round_num)
+        for key in [key for key in self.boxes if self._stale(key)]:
+            self._evict(key)
+
+    def switch(self, session, upcoming=()):
+        """
+        Перейти к игре session: всё разложенное и законченное относится к
+        прошлой игре и выбрасывается, сообщения новой, пришедшие заранее,
+        раскладываются. Если обработчик служебного сообщения бросил
+        исключение, ещё не разложенные остаются в early до следующего switch.
+        """
+        self.session = session
+        self.upcoming = set(upcoming)
+        self.boxes = {}
+        self.depth = 0
+        self.retired.clear()
+        self.retired_round = 0
+        early, self.early = self.early, collections.deque()
+        while early:
+            raw = early.popleft()
+            try:
+                self._file(raw)
+            except BaseException:
+                # Они пришли раньше отложенных по ходу разбора — и встают впереди
+                early.extend(self.early)
+                self.early = early
+                raise
+
+    def _pump(self, timeout):
+        """Дождаться хотя бы одного кадра и разложить всё, что уже пришло."""
+        raw = self.conn.recv_message(timeout=timeout)
+        if raw is None:
+            return False
+        self._file(raw)
+        while self.conn.message_queue:
+            self._file(self.conn.message_queue.popleft())
+        return True
+
+    def _take(self, key, sender, extra_check):
+        senders = self.boxes.get(key)
+        if not senders:
+            return None
+        if extra_check is not None:
+            # Произвольный фильтр — линейно, но только внутри своей ячейки
+            for who, queue in senders.items():
+                if sender is not None and who != sender:
+                    continue
+                for i, data in enumerate(queue):
+                    if extra_check(data):
+                        del queue[i]
+                        return self._taken(senders, key, who, data)
+            return None
+        if sender is None:
+            sender = next(iter(senders))
+        queue = senders.get(sender)
+        if not queue:
+            return None
+        return self._taken(senders, key, sender, queue.popleft())
+
+    def _taken(self, senders, key, sender, data):
+        if not senders[sender]:
+            del senders[sender]
+            if not senders:
+                del self.boxes[key]
+        self.depth -= 1
+        return data
+
+    def wait(self, msg_type, tag=None, sender=None, extra_check=None, timeout=300):
+        """Следующее сообщение msg_type с guesser/name == tag (и from == sender)."""
+        key = (msg_type, tag)
+        deadline = time.time() + timeout
+        while True:
+            data = self._take(key, sender, extra_check)
+            if data is not None:
+                return data
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self._pump(max(0.1, remaining))
+
+    def collect(self, msg_type, count, tag=None, timeout=300):
+        """Собрать count сообщений msg_type с guesser/name == tag."""
+        results = []
+        deadline = time.time() + timeout
+        while len(results) < count:
+            data = self.wait(msg_type, tag, timeout=deadline - time.time())
+            if data is None:
+                break
+            results.append(data)
+        return results
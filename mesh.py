@@ -0,0 +1,271 @@
+# mesh.py
+
+import collections
+import hmac
+import os
+import secrets
+import select
+import shutil
+import socket
+import tempfile
+import time
+
+from framing import FrameError, FrameReader, pack_frame
+
+# off — всё через ретранслятор; tcp — прямые TCP-соединения между игроками;
+# unix — то же, но с игроком на той же машине через Unix-сокет
+MESH_MODES = ("off", "tcp", "unix")
+# Сколько входящих hello ждут своего mesh_link, пока старейшее не закрыто
+MAX_PENDING = 64
+
+
+def machine_id():
+    """Чем отличить «та же машина»: /etc/machine-id, а без него — имя хоста."""
+    try:
+        with open("/etc/machine-id") as f:
+            return f.read().strip()
+    except OSError:
+        return socket.gethostname()
+
+
+class PeerMesh:
+    """
+    Прямые соединения с каждым пиром после знакомства через ретранслятор.
+    Повторяет интерфейс RepeaterConnection, которым пользуются Player и
+    Inbox: send_to уходит напрямую тем пирам, с кем есть связь, остальным —
+    через ретранслятор; recv_message ждёт select'ом сразу и прямые сокеты,
+    и ретранслятор. Кадры на прямых связях — с префиксом длины, внутри то
+    же, что доставил бы ретранслятор.
+    """
+
+    def __init__(self, relay, mode="tcp"):
+        self.relay = relay
+        self.mode = mode
+        self.nickname = relay.nickname
+        # Барьер ретранслятора прошёл бы мимо прямых связей — синхронизируемся сообщениями
+        self.features = relay.features - {"barrier"}
+        self.message_queue = collections.deque()
+        self.links = {}
+        self.readers = {}
+        self.listeners = []
+        self.unix_dir = None
+        self.fallbacks = 0
+        # Входящие соединения с чужим или испорченным hello — закрыты, не привязаны;
+        # hello пиров, чей mesh_link ещё не разобран: (ник, токен, сокет, reader)
+        self.rejected = 0
+        self.pending = collections.deque()
+
+    def listen(self):
+        """Открыть слушающие сокеты; вернуть адреса для рассылки пирам."""
+        host = self.relay.sock.getsockname()[0]
+        tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp.bind((host, 0))
+        tcp.listen(socket.SOMAXCONN)
+        self.listeners.append(tcp)
+        offer = {"tcp": [host, tcp.getsockname()[1]], "machine": machine_id()}
+        if self.mode == "unix" and hasattr(socket, "AF_UNIX"):
+            self.unix_dir = tempfile.mkdtemp(prefix="mpc-mesh-")
+            path = os.path.join(self.unix_dir, "peer.sock")
+            unix = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            unix.bind(path)
+            unix.listen(socket.SOMAXCONN)
+            self.listeners.append(unix)
+            offer["unix"] = path
+        return offer
+
+    def _attach(self, peer, sock, reader=None):
+        if sock.family != getattr(socket, "AF_UNIX", None):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(30)
+        self.links[peer] = sock
+        self.readers[sock] = (peer, reader or FrameReader(mode="lp"))
+
+    def dial(self, peer, offer, timeout=5):
+        """
+        Дозвониться до peer по его адресам. Возвращает случайный токен
+        связи — он уходит в hello и отдельно через ретранслятор в mesh_link,
+        чтобы peer узнал, что звонили именно мы; None — связи нет, остаётся
+        ретранслятор.
+        """
+        token = secrets.token_hex(16)
+        attempts = []
+        if self.mode == "unix" and offer.get("unix") and offer.get("machine") == machine_id():
+            attempts.append((socket.AF_UNIX, offer["unix"]))
+        attempts.append((socket.AF_INET, tuple(offer["tcp"])))
+        for family, address in attempts:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(address)
+                sock.sendall(pack_frame(f"hello {self.nickname} {token}".encode()))
+            except OSError:
+                sock.close()
+                continue
+            self._attach(peer, sock)
+            return token
+        return None
+
+    @staticmethod
+    def _parse_hello(hello):
+        """«hello <ник> <токен>» — (ник, токен); что-то другое — None."""
+        parts = hello.decode(errors="replace").split(" ")
+        if len(parts) != 3 or parts[0] != "hello" or not parts[2]:
+            return None
+        return parts[1], parts[2]
+
+    def _reject(self, sock):
+        self.rejected += 1
+        sock.close()
+
+    def _claim(self, peer, token, sent, sock, reader):
+        """Привязать сокет к peer, если токен из hello совпал с его mesh_link; иначе закрыть."""
+        if peer in self.links or not token or not hmac.compare_digest(sent.encode(), token.encode()):
+            self._reject(sock)
+            return
+        self._attach(peer, sock, reader)
+        # Всё, что пир успел прислать следом за hello
+        self._queue_frames(sock, reader)
+
+    def accept(self, peer, token, timeout=10):
+        """
+        Принимать входящие, пока не придёт hello от peer с токеном из его
+        mesh_link. Hello другого пира, чей mesh_link ещё не разобран,
+        откладывается до его accept; испорченное или с чужим токеном —
+        сокет закрывается, ждём дальше. False — не дождались.
+        """
+        for entry in [entry for entry in self.pending if entry[0] == peer]:
+            self.pending.remove(entry)
+            self._claim(peer, token, *entry[1:])
+        deadline = time.time() + timeout
+        while peer not in self.links:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select(self.listeners, [], [], remaining)
+            for listener in readable:
+                sock, _ = listener.accept()
+                sock.settimeout(max(0.1, deadline - time.time()))
+                reader = FrameReader(mode="lp")
+                try:
+                    hello = None
+                    while hello is None:
+                        if not reader.recv_into(sock):
+                            raise ConnectionError("пир закрыл соединение")
+                        hello = reader.next_frame()
+                except OSError:
+                    sock.close()
+                    continue
+                parsed = self._parse_hello(hello)
+                if parsed is None or parsed[0] in self.links:
+                    self._reject(sock)
+                elif parsed[0] == peer:
+                    self._claim(peer, token, parsed[1], sock, reader)
+                else:
+                    self.pending.append((*parsed, sock, reader))
+                    if len(self.pending) > MAX_PENDING:
+                        self._reject(self.pending.popleft()[2])
+        return True
+
+    def reject_pending(self):
+        """Отложенные hello, к которым так и не пришёл mesh_link, — закрыть."""
+        while self.pending:
+            self._reject(self.pending.popleft()[2])
+
+    def _drop(self, sock):
+        peer, _ = self.readers.pop(sock)
+        self.links.pop(peer, None)
+        self.fallbacks += 1
+        sock.close()
+
+    def send_to(self, recipients, data):
+        if not isinstance(recipients, list):
+            recipients = [recipients]
+        frame = pack_frame(data.encode())
+        relayed = []
+        for peer in recipients:
+            sock = self.links.get(peer)
+            if sock is not None:
+                try:
+                    sock.sendall(frame)
+                    continue
+                except OSError:
+                    self._drop(sock)
+            relayed.append(peer)
+        if relayed:
+            self.relay.send_to(relayed, data)
+
+    def scatter(self, messages):
+        relayed = {}
+        for peer, data in messages.items():
+            sock = self.links.get(peer)
+            if sock is not None:
+                try:
+                    sock.sendall(pack_frame(data.encode()))
+                    continue
+                except OSError:
+                    self._drop(sock)
+            relayed[peer] = data
+        self.relay.scatter(relayed)
+
+    def batch(self):
+        """Прямые связи пишутся сразу; собирается только запись в ретранслятор."""
+        return self.relay.batch()
+
+    def _collect_relay(self):
+        queue = self.relay.message_queue
+        while queue:
+            self.message_queue.append(queue.popleft())
+
+    def _read_direct(self, sock):
+        _, reader = self.readers[sock]
+        try:
+            received = reader.recv_into(sock)
+        except OSError:
+            received = 0
+        if not received:
+            # Связь оборвалась — дальше этот пир через ретранслятор
+            self._drop(sock)
+            return
+        self._queue_frames(sock, reader)
+
+    def _queue_frames(self, sock, reader):
+        try:
+            for frame in reader.frames():
+                self.message_queue.append(frame.decode())
+        except FrameError:
+            # Поток от пира испорчен — дальше он через ретранслятор
+            self._drop(sock)
+
+    def recv_message(self, timeout=60):
+        self.relay.flush()
+        deadline = time.time() + timeout
+        while True:
+            self._collect_relay()
+            if self.message_queue:
+                return self.message_queue.popleft()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            socks = [self.relay.sock] + list(self.readers)
+            readable, _, _ = select.select(socks, [], [], remaining)
+            for sock in readable:
+                if sock is self.relay.sock:
+                    self.relay.poll(0)
+                else:
+                    self._read_direct(sock)
+
+    def barrier(self, name, count, timeout=3600):
+        return self.relay.barrier(name, count, timeout)
+
+    def reduce(self, tag, count, modulus, values, timeout=3600):
+        """Сумма приходит одной строкой и ни с чем не упорядочена — reduce идёт через ретранслятор."""
+        return self.relay.reduce(tag, count, modulus, values, timeout)
+
+    def close(self):
+        for sock in list(self.readers):
+            sock.close()
+        for listener in self.listeners:
+            listener.close()
+        if self.unix_dir:
+            shutil.rmtree(self.unix_dir, ignore_errors=True)
+        self.relay.close()
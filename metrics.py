@@ -0,0 +1,153 @@
+# metrics.py
+
+import bisect
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+from config import VERBOSITY
+
+# Сколько печатать: 0 — только итог игры; 1 — ход игры (раунды, догадки,
+# результаты); 2 — каждое сообщение (доли, барьеры, сеть)
+VERBOSITY_LEVELS = (0, 1, 2)
+verbosity = VERBOSITY
+
+# Границы корзин гистограмм: секунды (1 мкс … 10 с) и байты (16 Б … 4 МБ)
+SECONDS_BOUNDS = tuple(base * 10.0 ** exp for exp in range(-6, 1) for base in (1, 2.5, 5)) + (10.0,)
+BYTES_BOUNDS = tuple(16 * 4 ** i for i in range(10))
+
+
+def set_verbosity(level):
+    global verbosity
+    verbosity = level
+
+
+def log(level, *args):
+    """print, если уровень подробности не ниже level."""
+    if level <= verbosity:
+        print(*args)
+
+
+class Histogram:
+    """Счётчики по корзинам с фиксированными границами; квантиль — верхняя граница корзины."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return float("inf") if self.counts[-1] else 0.0
+
+    def lines(self, name):
+        lines = [f"{name}_count {self.count}", f"{name}_sum {self.sum:g}",
+                 f"{name}_p50 {self.quantile(0.5):g}", f"{name}_p99 {self.quantile(0.99):g}"]
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        return lines
+
+
+class Metrics:
+    """
+    Счётчики и гистограммы процесса, потокобезопасно. render отдаёт строки
+    «имя значение» (совместимо с текстовым форматом Prometheus) — их
+    возвращают команда stats ретранслятора и HTTP-эндпоинт.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value, bounds=SECONDS_BOUNDS):
+        self.update((), ((name, value, bounds),))
+
+    def update(self, counters, observations):
+        """Несколько счётчиков [(имя, +n)] и наблюдений [(имя, значение, границы)] под одной блокировкой."""
+        with self.lock:
+            for name, value in counters:
+                self.counters[name] += value
+            for name, value, bounds in observations:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram(bounds)
+                histogram.observe(value)
+
+    def render(self, gauges=()):
+        """Строки метрик; gauges — [(имя, значение)], снятые в момент запроса."""
+        lines = [f"uptime_seconds {time.time() - self.started:.1f}"]
+        lines += [f"{name} {value}" for name, value in gauges]
+        with self.lock:
+            lines += [f"{name} {value}" for name, value in sorted(self.counters.items())]
+            for name, histogram in sorted(self.histograms.items()):
+                lines += histogram.lines(name)
+        return lines
+
+
+class Spans:
+    """
+    Длительности фаз протокола у игрока: сводка по фазам (сколько раз,
+    всего, максимум) и, если keep_events, все события — для трассы в
+    формате Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, keep_events=False):
+        self.totals = collections.defaultdict(lambda: [0, 0.0, 0.0])
+        self.events = [] if keep_events else None
+        self.origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            total = self.totals[name]
+            total[0] += 1
+            total[1] += elapsed
+            total[2] = max(total[2], elapsed)
+            if self.events is not None:
+                self.events.append((name, start - self.origin, elapsed))
+
+    def summary(self):
+        return {name: {"count": count, "total_ms": round(total * 1000, 3), "max_ms": round(longest * 1000, 3)}
+                for name, (count, total, longest) in self.totals.items()}
+
+    def chrome_trace(self, process, thread=0):
+        return [{"name": name, "ph": "X", "ts": round(start * 1e6), "dur": round(elapsed * 1e6),
+                 "pid": process, "tid": thread}
+                for name, start, elapsed in self.events or ()]
+
+
+def timed(name):
+    """Декоратор метода: весь вызов — фаза name в self.spans."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.spans.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
@@ -1,127 +1,405 @@
 # network.py
 
+import collections
+import contextlib
+import select
 import socket
 import time
-from config import SERVER_HOST, SERVER_PORT
+from codec import BINARY_MARKER
+from session import SESSION_MARKER
+from config import QUEUE_LIMIT, SERVER_HOST, SERVER_PORT, FRAME_MODE
+from framing import FrameReader, pack_frame
+from metrics import log
+from transcript import END, RECEIVED, SENT, TranscriptWriter
 
 
 class RepeaterConnection:
-    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, nickname=None):
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, nickname=None, frame_mode=FRAME_MODE, room=None,
+                 record=None, sock=None):
         self.host = host
         self.port = port
         self.nickname = nickname
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.buffer = ""
-        self.message_queue = []
+        self.room = room
+        # Пока ретранслятор не подтвердил lp, говорим текстом
+        self.requested_frame_mode = frame_mode
+        self.frame_mode = "text"
+        self.sock = sock or socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Сообщения игроков заканчиваются ||, служебные строки ретранслятора — \n
+        self.reader = FrameReader(delimiters=(b"||", b"\n"))
+        self.lines = []
+        self.message_queue = collections.deque()
+        # Сверх queue_limit неразобранных сообщений вытесняются самые старые
+        self.queue_limit = QUEUE_LIMIT
+        self.overflow = 0
+        # Присутствие по подписке (subscribe): текущий состав и события joined/left
+        self.roster = set()
+        self.presence_events = collections.deque()
+        # Возможности ретранслятора (команда features) и отпущенные им барьеры
+        self.features = set()
+        self.released = set()
+        # Суммы, разосланные ретранслятором по reduce: метка -> вектор
+        self.reduced = {}
+        # Сборка записи: внутри batch() всё копится в outbuf и уходит одним sendall
+        self.outbuf = bytearray()
+        self.batch_depth = 0
+        self.writes = 0
+        # record — путь файла трассы: все записи в сокет и принятые кадры с метками времени
+        self.recorder = None
+        if record:
+            self.recorder = TranscriptWriter(record, {"nickname": nickname, "room": room, "host": host,
+                                                      "port": port, "frame_mode": frame_mode})
 
     def connect(self):
         self.sock.connect((self.host, self.port))
+        # Запись собирается вручную (batch, scatter) — Nagle её только задержал бы
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sock.settimeout(30)
         data = self._recv_until("Pick nickname: ")
-        print(f"[NET] Получено: {data}")
-        self.sock.sendall(f"{self.nickname}\n".encode())
-        print(f"[NET] Отправлен никнейм: {self.nickname}")
-        time.sleep(1)
-        data = self._recv_all_available()
-        print(f"[NET] Ответ сервера:\n{data}")
+        log(2, f"[NET] Получено: {data}")
+        self._sendall(f"{self.nickname}\n".encode())
+        log(2, f"[NET] Отправлен никнейм: {self.nickname}")
+        # Ответ на никнейм — список подключённых; ждём ровно его, без пауз
+        peers = self._await(self._scan_roster, 30)
+        if peers is None:
+            raise ConnectionError("Ретранслятор не прислал список подключённых")
+        self.roster = set(peers)
+        log(2, f"[NET] Ответ сервера:\n{len(peers)} available connections:\n" + "\n".join(peers))
+        if self.requested_frame_mode != "text":
+            self._negotiate_frames(self.requested_frame_mode)
+        self.features = self._query_features()
+        if self.room:
+            peers = self.join(self.room)
+            if peers is None:
+                raise ConnectionError("Ретранслятор не поддерживает комнаты (join)")
+            log(2, f"[NET] Комната {self.room}: {peers}")
+
+    def join(self, room):
+        """
+        Перейти в комнату: print, send, wait и barrier дальше видят только
+        её участников. Возвращает список участников, None — нет команды join.
+        """
+        if "rooms" not in self.features:
+            return None
+        self.lines.clear()
+        self._send_command(f"join {room}")
+        peers = self._await(lambda: self._scan_roster("join"), 30)
+        if not isinstance(peers, list):
+            return None
+        self.room = room
+        self.roster = set(peers)
+        return peers
+
+    def _await(self, scan, timeout):
+        """
+        Читать кадры по одному, пока scan() не найдёт ответ ретранслятора
+        в self.lines. scan возвращает None, пока ответа нет.
+        """
+        self.flush()
+        deadline = time.time() + timeout
+        while True:
+            result = scan()
+            if result is not None:
+                return result
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self._read_frame(remaining):
+                return None
+
+    def _scan_roster(self, command=None):
+        """
+        Ищет ответ на print/wait: заголовок "N available connections:" и N строк.
+        Возвращает список ников, False — если ретранслятор не знает command.
+        """
+        for i, line in enumerate(self.lines):
+            if line.startswith("Nickname"):
+                raise ConnectionError(f"Ретранслятор отклонил никнейм: {line}")
+            if command and line.startswith(f"Unknown command: {command}"):
+                del self.lines[:i + 1]
+                return False
+            if line.endswith("available connections:"):
+                count = int(line.split()[0])
+                if len(self.lines) - i - 1 < count:
+                    return None
+                peers = self.lines[i + 1:i + 1 + count]
+                del self.lines[:i + 1 + count]
+                return peers
+        return None
+
+    def _query_features(self):
+        """Старый ретранслятор ответит Unknown command — возможностей нет."""
+        def scan():
+            for i, line in enumerate(self.lines):
+                if line.startswith("features"):
+                    del self.lines[:i + 1]
+                    return set(line.split()[1:])
+                if line.startswith("Unknown command: features"):
+                    del self.lines[:i + 1]
+                    return set()
+            return None
+
+        self._send_command("features")
+        return self._await(scan, 10) or set()
+
+    def _negotiate_frames(self, mode):
+        """
+        Просим ретранслятор перейти на кадры с префиксом длины. Старый
+        ретранслятор ответит Unknown command — тогда остаёмся на тексте.
+        """
+        def scan():
+            for i, line in enumerate(self.lines):
+                if line == f"frames {mode}":
+                    del self.lines[:i + 1]
+                    # Всё после подтверждения — уже кадры lp
+                    self.reader.mode = mode
+                    return mode
+                if line.startswith("Unknown command: frames"):
+                    del self.lines[:i + 1]
+                    return "text"
+            return None
+
+        self._send_command(f"frames {mode}")
+        # _await разбирает по одному кадру и не проскочит момент переключения
+        self.frame_mode = self._await(scan, 10) or "text"
+        if self.frame_mode == mode:
+            log(2, f"[NET] Режим кадров: {mode}")
+        else:
+            log(2, "[NET] Ретранслятор не поддерживает кадры, остаюсь на тексте")
+
+    def _send_command(self, command):
+        if self.frame_mode == "lp":
+            self._write(pack_frame(command.encode()))
+        else:
+            self._write(f"{command}\n".encode())
+
+    def _write(self, data):
+        """Отправить байты; внутри batch() — только дописать в буфер."""
+        if self.batch_depth:
+            self.outbuf += data
+            return
+        self._sendall(data)
+        self.writes += 1
+
+    def _sendall(self, data):
+        if self.recorder:
+            self.recorder.write(SENT, data)
+        self.sock.sendall(data)
+
+    def flush(self):
+        """Точка сброса: накопленное в batch() — одним sendall."""
+        if self.outbuf:
+            data = bytes(self.outbuf)
+            self.outbuf.clear()
+            self._sendall(data)
+            self.writes += 1
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Собрать запись шага протокола: команды и сообщения уходят одним
+        sendall на выходе или перед первым ожиданием ответа (recv_message,
+        barrier и прочие запросы сбрасывают буфер сами).
+        """
+        self.batch_depth += 1
+        try:
+            yield
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.flush()
 
     def send_to(self, recipients, data):
         """Отправить данные получателям с маркером || для разделения."""
         if isinstance(recipients, list):
             recipients = ",".join(recipients)
         data_clean = data.strip()
-        msg = f"send {recipients} {data_clean}||\n"
-        self.sock.sendall(msg.encode())
+        self._send_command(f"send {recipients} {data_clean}||")
+
+    def scatter(self, messages):
+        """
+        Разным получателям — разные данные: {ник: данные}. Ретранслятор
+        со scatter получает одну команду; старый — send на каждого, но
+        тоже одной записью.
+        """
+        if not messages:
+            return
+        if "scatter" not in self.features:
+            with self.batch():
+                for recipient, data in messages.items():
+                    self.send_to(recipient, data)
+            return
+        self._send_command("scatter " + "".join(f"{recipient} {data.strip()}||"
+                                                for recipient, data in messages.items()))
 
     def recv_message(self, timeout=60):
         """Получить одно JSON-сообщение, разделённое маркером ||"""
+        self.flush()
         if self.message_queue:
-            return self.message_queue.pop(0)
+            return self.message_queue.popleft()
 
         deadline = time.time() + timeout
 
         while time.time() < deadline:
             self._extract_messages()
             if self.message_queue:
-                return self.message_queue.pop(0)
+                return self.message_queue.popleft()
 
             remaining = max(0.1, deadline - time.time())
             self.sock.settimeout(remaining)
             try:
-                chunk = self.sock.recv(4096).decode()
-                if not chunk:
+                if not self.reader.recv_into(self.sock):
                     break
-                self.buffer += chunk
             except socket.timeout:
                 break
 
         self._extract_messages()
         if self.message_queue:
-            return self.message_queue.pop(0)
+            return self.message_queue.popleft()
 
         return None
 
+    def _handle_frame(self, frame):
+        """Сообщение игрока (кадр с ||) — в очередь, служебная строка — в lines."""
+        if self.recorder:
+            self.recorder.write(RECEIVED, frame)
+        if frame.endswith(b"||"):
+            raw = frame[:-2].decode().strip()
+            if raw.startswith(("{", BINARY_MARKER, SESSION_MARKER)):
+                if self.queue_limit is not None and len(self.message_queue) >= self.queue_limit:
+                    self.message_queue.popleft()
+                    self.overflow += 1
+                self.message_queue.append(raw)
+        else:
+            # В режиме lp ответ на print приходит одним кадром из нескольких строк
+            for line in frame.decode().split("\n"):
+                line = line.strip()
+                if line.startswith("released "):
+                    self.released.add(line[len("released "):])
+                elif line.startswith("reduced "):
+                    _, tag, values = line.split(" ", 2)
+                    self.reduced[tag] = [int(value) for value in values.split(",")]
+                elif line.startswith(("joined ", "left ")):
+                    event, _, who = line.partition(" ")
+                    self.presence_events.append((event, who))
+                    if event == "joined":
+                        self.roster.add(who)
+                    else:
+                        self.roster.discard(who)
+                elif line:
+                    self.lines.append(line)
+
     def _extract_messages(self):
-        """Извлечь все JSON-сообщения из буфера по маркеру ||"""
-        while "||" in self.buffer:
-            idx = self.buffer.index("||")
-            raw = self.buffer[:idx].strip()
-            self.buffer = self.buffer[idx + 2:]
+        """Разобрать все полные кадры из буфера. Декодируются только готовые кадры."""
+        for frame in self.reader.frames():
+            self._handle_frame(frame)
 
-            if raw.startswith("{"):
-                self.message_queue.append(raw)
+    def _read_frame(self, timeout):
+        """Дочитать и разобрать ровно один кадр."""
+        frame = self.reader.next_frame()
+        self.sock.settimeout(max(0.1, timeout))
+        try:
+            while frame is None:
+                if not self.reader.recv_into(self.sock):
+                    return False
+                frame = self.reader.next_frame()
+        except socket.timeout:
+            return False
+        finally:
+            self.sock.settimeout(30)
+        self._handle_frame(frame)
+        return True
+
+    def poll(self, timeout):
+        """
+        Дождаться данных не дольше timeout и разобрать все готовые кадры.
+        Ждёт через select, не трогая таймаут сокета, — так можно читать из
+        одного потока, пока другие пишут. False — за timeout ничего не пришло.
+        """
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if not readable:
+            return False
+        if not self.reader.recv_into(self.sock):
+            raise ConnectionError("Ретранслятор закрыл соединение")
+        self._extract_messages()
+        return True
 
     def get_peers_once(self):
         """Один запрос списка подключённых."""
-        self.sock.sendall(b"print\n")
-        time.sleep(1.5)
-        raw = self._recv_all_available()
-
-        peers = []
-        for line in raw.strip().split("\n"):
-            line = line.strip()
-            if not line:
-                continue
-            if "||" in line:
-                parts = line.split("||")
-                for part in parts:
-                    part = part.strip()
-                    if part.startswith("{"):
-                        self.message_queue.append(part)
-            elif line.startswith("{"):
-                self.message_queue.append(line)
-            elif "available connections" not in line:
-                peers.append(line)
+        self.lines.clear()
+        self._send_command("print")
+        return self._await(self._scan_roster, 30) or []
+
+    def wait_for_peers(self, count, timeout=3600):
+        """
+        Ретранслятор ответит списком подключённых, как только их (вместе
+        с нами) станет count. None — ретранслятор не поддерживает wait.
+        """
+        self.lines.clear()
+        self._send_command(f"wait {count}")
+        peers = self._await(lambda: self._scan_roster("wait"), timeout)
+        if not isinstance(peers, list):
+            return None
         return peers
 
+    def barrier(self, name, count, timeout=3600):
+        """Барьер на стороне ретранслятора (если он есть в features)."""
+        self._send_command(f"barrier {name} {count}")
+
+        def scan():
+            if name in self.released:
+                self.released.discard(name)
+                return True
+            return None
+
+        return bool(self._await(scan, timeout))
+
+    def reduce(self, tag, count, modulus, values, timeout=3600):
+        """
+        Сумма векторов values всех count участников по модулю modulus
+        (reduce на стороне ретранслятора, если он есть в features).
+        None — не дождались или вклады не сошлись.
+        """
+        self._send_command(f"reduce {tag} {count} {modulus} {','.join(map(str, values))}")
+
+        def scan():
+            if tag in self.reduced:
+                return self.reduced.pop(tag)
+            if f"Reduce mismatch: {tag}" in self.lines:
+                self.lines.remove(f"Reduce mismatch: {tag}")
+                return False
+            return None
+
+        return self._await(scan, timeout) or None
+
+    def subscribe(self):
+        """Подписаться на события joined/left; roster обновляется по ним."""
+        self._send_command("subscribe")
+
+        def scan():
+            if "subscribed" in self.lines:
+                self.lines.remove("subscribed")
+                return True
+            if any(line.startswith("Unknown command: subscribe") for line in self.lines):
+                return False
+            return None
+
+        if not self._await(scan, 10):
+            return False
+        self.roster = set(self.get_peers_once())
+        return True
+
     def _recv_until(self, marker):
-        while marker not in self.buffer:
-            chunk = self.sock.recv(4096).decode()
-            if not chunk:
-                break
-            self.buffer += chunk
-        idx = self.buffer.find(marker)
-        if idx != -1:
-            result = self.buffer[:idx + len(marker)]
-            self.buffer = self.buffer[idx + len(marker):]
-            return result
-        result = self.buffer
-        self.buffer = ""
-        return result
-
-    def _recv_all_available(self):
-        self.sock.settimeout(2)
-        data = ""
-        try:
-            while True:
-                chunk = self.sock.recv(4096).decode()
-                if not chunk:
-                    break
-                data += chunk
-        except socket.timeout:
-            pass
-        self.sock.settimeout(30)
-        return data
+        marker = marker.encode()
+        while True:
+            data = self.reader.take_until(marker)
+            if data is None and not self.reader.recv_into(self.sock):
+                data = self.reader.take_all()
+            if data is not None:
+                if self.recorder:
+                    self.recorder.write(RECEIVED, data)
+                return data.decode()
 
     def close(self):
-        self.sock.close()
\ No newline at end of file
+        self.sock.close()
+        if self.recorder:
+            self.recorder.write(END, b"")
+            self.recorder.close()
+            self.recorder = None
\ No newline at end of file
@@ -1,281 +1,1007 @@
 # player.py
 
+import functools
+import hashlib
 import json
-import random
+import os
 import time
-from config import FIELD_SIZE, PRIME
-from crypto_utils import generate_additive_shares
+from codec import CODECS, BinaryCodec, JsonCodec
+from config import (BOARD, CODEC, DIMENSIONS, FIELD_SIZE, FRAME_MODE, MESH, PEER_POLL_INTERVAL, PREPROCESS_BATCH,
+                    PREPROCESS_POOL, OPEN_MODE, PRIME, ROOM, ROUND_MODE, SHARE_MODE, TIE_BREAK)
+from crypto_utils import (expand_seed, generate_additive_shares_vector, generate_seed_shares, pack_point,
+                          random_field_elements, reconstruct_additive_vector)
+from inbox import Inbox
+from mesh import PeerMesh
+from metrics import Spans, log, timed
 from network import RepeaterConnection
+from preprocessing import MaskPool
+from session import wrap
+
+# turns — игроки угадывают по очереди; simultaneous — все сразу, одна проверка на раунд
+ROUND_MODES = ("turns", "simultaneous")
+# Кто побеждает, если в одновременном раунде угадали несколько игроков:
+# first — первый в all_players, rotate — первый по кругу, начиная с номера раунда,
+# all — все угадавшие
+TIE_BREAKS = ("first", "rotate", "all")
+# plain — пиру уходят сами доли; seed — короткое зерно, из которого пир
+# разворачивает доли сам (поправку раздающий оставляет себе)
+SHARE_MODES = ("plain", "seed")
+# peers — каждый рассылает доли разности всем и складывает сам; reduce —
+# складывает ретранслятор (команда reduce) и рассылает только сумму
+OPEN_MODES = ("peers", "reduce")
+# coords — x и y делятся и раскрываются по отдельности (только 2D); packed —
+# точка любой размерности одним элементом по модулю field_size^dimensions
+BOARDS = ("coords", "packed")
+
+
+class Resync(Exception):
+    """Пир переподключился (resume): текущий раунд бросается и переигрывается."""
+
+    def __init__(self, request):
+        super().__init__(request["from"])
+        self.request = request
 
 
 class Player:
-    def __init__(self, nickname, host, port, field_size=FIELD_SIZE):
+    def __init__(self, nickname, host, port, field_size=FIELD_SIZE, frame_mode=FRAME_MODE,
+                 round_mode=ROUND_MODE, tie_break=TIE_BREAK, share_mode=SHARE_MODE,
+                 pool_size=PREPROCESS_POOL, pool_batch=PREPROCESS_BATCH, codec=CODEC,
+                 room=ROOM, session=None, conn=None, mesh=MESH, trace=False, open_mode=OPEN_MODE,
+                 board=BOARD, dimensions=DIMENSIONS, record=None, checkpoint=None):
+        if board == "coords" and dimensions != 2:
+            raise ValueError("доска coords только двумерная, для других размерностей — packed")
+        if board == "packed" and pool_size:
+            raise ValueError("пул масок готовит маски только для доски coords")
         self.nickname = nickname
+        # id игры в конверте каждого сообщения и в именах барьеров
+        self.session = session or room or "game"
+        # Партии одной серии (play_session) и переигровки после обрыва — свои id:
+        # базовый, затем <база>:<партия>.<эпоха>
+        self.base_session = self.session
+        self.game = 1
+        self.epoch = 0
+        self.completed_round = 0
+        # Файл контрольной точки: доли Q и последний законченный раунд
+        self.checkpoint = checkpoint
         self.field_size = field_size
-        self.conn = RepeaterConnection(host, port, nickname)
+        self.board = board
+        self.dimensions = dimensions
+        # Модуль долей точки: field_size для каждой координаты или field_size^d для всей точки
+        self.modulus = field_size ** dimensions if board == "packed" else field_size
+        # Что делится по отдельности — по полю на каждое в сообщениях с долями
+        self.axes = ("p",) if board == "packed" else ("x", "y")
+        self.round_mode = round_mode
+        self.tie_break = tie_break
+        self.share_mode = share_mode
+        self.open_mode = open_mode
+        # Номер раскрытия — метка reduce; у всех игроков раскрытия идут в одном порядке
+        self.openings = 0
+        # Общий для игроков этой игры nonce (из вкладов всех в codecs): метки
+        # reduce разных игр с тем же id сессии на ретрансляторе не совпадут
+        self.nonce = ""
+        # Источники случайности: свой и фонового потока пула масок. По
+        # умолчанию CSPRNG; воспроизведение трассы подставляет ГПСЧ с зерном
+        self.randbytes = os.urandom
+        self.pool_randbytes = os.urandom
+        # Ходы конвейером: до какого раунда доли догадок уже розданы и свои доли наших ходов
+        self.dealt_round = 0
+        self.turn_shares = {}
+        self.pool_size = pool_size
+        self.pool_batch = pool_batch
+        self.pool = None
+        # Предпочтение; пока не договорились на старте игры — JSON
+        self.preferred_codec = codec
+        self.mesh_mode = mesh
+        # Время по фазам протокола; trace — хранить и каждое событие для трассы
+        self.spans = Spans(keep_events=trace)
+        self.codec = JsonCodec()
+        # conn — готовый канал (SessionChannel), если игр несколько на одном соединении
+        # record — файл трассы кадров соединения для воспроизведения (replay.py)
+        self.conn = conn or RepeaterConnection(host, port, nickname, frame_mode=frame_mode, room=room,
+                                               record=record)
+        self.inbox = Inbox(self.conn, session=self.session)
         self.peers = []
         self.all_players = []
         self.my_index = -1
         self.num_parties = 0
-        self.shares_x = {}
-        self.shares_y = {}
-        self.my_total_share_x = 0
-        self.my_total_share_y = 0
+        # Доли точки Q от каждого игрока и их сумма — по элементу на ось из axes
+        self.point_shares = {}
+        self.total_shares = [0] * len(self.axes)
 
+    @timed("connect")
     def connect_and_wait(self, expected_players):
         self.conn.connect()
-        print(f"\n[{self.nickname}] Ожидаю {expected_players - 1} других игроков...")
+        log(1, f"\n[{self.nickname}] Ожидаю {expected_players - 1} других игроков...")
 
-        while True:
+        # Ретранслятор сам ответит, когда подключится последний игрок
+        self.peers = self.conn.wait_for_peers(expected_players)
+        while self.peers is None or len(self.peers) + 1 < expected_players:
+            # Старый ретранслятор без wait — опрашиваем print
             self.peers = self.conn.get_peers_once()
             current = len(self.peers) + 1
-            print(f"[{self.nickname}] Подключено: {current}/{expected_players}")
+            log(1, f"[{self.nickname}] Подключено: {current}/{expected_players}")
             if current >= expected_players:
                 break
-            time.sleep(3)
+            time.sleep(PEER_POLL_INTERVAL)
 
         self.all_players = sorted(self.peers + [self.nickname])
         self.my_index = self.all_players.index(self.nickname)
         self.num_parties = len(self.all_players)
-        print(f"[{self.nickname}] Все игроки: {self.all_players}")
-
-    def wait_for_message(self, msg_type, extra_check=None, timeout=300):
-        """Ожидание конкретного типа сообщения."""
-        deadline = time.time() + timeout
-
-        # Сначала ищем в очереди
-        new_queue = []
-        found = None
-        for item in self.conn.message_queue:
-            if found is not None:
-                new_queue.append(item)
-                continue
-            try:
-                data = json.loads(item)
-                if data.get("type") == msg_type:
-                    if extra_check is None or extra_check(data):
-                        found = data
-                        continue
-            except json.JSONDecodeError:
-                pass
-            new_queue.append(item)
-
-        if found is not None:
-            self.conn.message_queue = new_queue
-            return found
-
-        # Не нашли в очереди — читаем из сети
-        while time.time() < deadline:
-            remaining = max(1, deadline - time.time())
-            raw = self.conn.recv_message(timeout=remaining)
-            if not raw:
-                continue
-            try:
-                data = json.loads(raw)
-                if data.get("type") == msg_type:
-                    if extra_check is None or extra_check(data):
-                        return data
-                # Не подошло — обратно в очередь
-                self.conn.message_queue.append(raw)
-            except json.JSONDecodeError:
-                pass
-        return None
-
-    def collect_messages(self, msg_type, count, extra_check=None, timeout=300):
+        log(1, f"[{self.nickname}] Все игроки: {self.all_players}")
+
+    @timed("codec")
+    def negotiate_codec(self):
+        """
+        Договориться о кодеке: каждый рассылает, какие кодеки готов
+        использовать, и двоичный включается, только если его предлагают все.
+        Принимать двоичные сообщения можно сразу — пир может переключиться
+        раньше нас. Заодно каждый вносит случайную часть nonce игры.
+        """
+        binary = BinaryCodec(self.all_players, self.modulus)
+        self.inbox.decode = binary.decode
+        offered = list(CODECS) if self.preferred_codec == "binary" else ["json"]
+        nonce = self.nonce_part()
+        msg = self.codec.encode({
+            "type": "codecs",
+            "from": self.nickname,
+            "codecs": offered,
+            "nonce": nonce
+        })
+        self.send_to(self.peers, msg)
+        agreed = "binary" in offered
+        parts = {self.nickname: nonce}
+        for data in self.collect_messages("codecs", self.num_parties - 1):
+            agreed = agreed and "binary" in data["codecs"]
+            parts[data["from"]] = data.get("nonce", "")
+        self.nonce = hashlib.sha256("".join(parts[p] for p in self.all_players).encode()).hexdigest()[:16]
+        if agreed:
+            self.codec = binary
+        log(1, f"[{self.nickname}] Кодек сообщений: {self.codec.name}")
+
+    def nonce_part(self):
+        """Своя случайная часть nonce игры (hex); воспроизведение трассы берёт записанную."""
+        return self.randbytes(8).hex()
+
+    @timed("mesh")
+    def setup_mesh(self):
+        """
+        Перейти на прямые соединения с пирами. Адреса рассылаются через
+        ретранслятор; каждую пару соединяет игрок с меньшим номером и
+        сообщает второму, удалось ли, и токен связи — без него входящее
+        соединение не принимается. Где связи нет, остаётся ретранслятор.
+        """
+        mesh = PeerMesh(self.conn, self.mesh_mode)
+        msg = self.codec.encode({
+            "type": "mesh",
+            "from": self.nickname,
+            **mesh.listen()
+        })
+        self.send_to(self.peers, msg)
+        offers = {data["from"]: data for data in self.collect_messages("mesh", self.num_parties - 1)}
+
+        for peer in self.all_players[self.my_index + 1:]:
+            token = mesh.dial(peer, offers[peer])
+            msg = self.codec.encode({
+                "type": "mesh_link",
+                "from": self.nickname,
+                "direct": token is not None,
+                "token": token
+            })
+            self.send_to(peer, msg)
+        for peer in self.all_players[:self.my_index]:
+            data = self.wait_for_message("mesh_link", sender=peer)
+            if data["direct"] and not mesh.accept(peer, data.get("token") or ""):
+                log(1, f"[{self.nickname}] Прямая связь с {peer} не пришла")
+        mesh.reject_pending()
+
+        self.conn = self.inbox.conn = mesh
+        direct = sorted(mesh.links)
+        log(1, f"[{self.nickname}] Прямые связи: {direct}, через ретранслятор: "
+              f"{[peer for peer in self.peers if peer not in mesh.links]}")
+
+    def send_to(self, recipients, msg):
+        """Отправить сообщение этой игры: в конверте с id сессии."""
+        self.conn.send_to(recipients, wrap(self.session, msg))
+
+    def send_each(self, messages):
+        """Каждому пиру своё сообщение {ник: msg} — одной командой scatter."""
+        self.conn.scatter({peer: wrap(self.session, msg) for peer, msg in messages.items()})
+
+    def wait_for_message(self, msg_type, tag=None, sender=None, extra_check=None, timeout=300):
+        """
+        Ожидание конкретного типа сообщения. tag — значение guesser/name,
+        по которому сообщение проиндексировано в Inbox.
+        """
+        with self.spans.span(f"wait:{msg_type}"):
+            return self.inbox.wait(msg_type, tag, sender, extra_check, timeout=timeout)
+
+    def collect_messages(self, msg_type, count, tag=None, timeout=300):
         """Собрать count сообщений определённого типа."""
-        results = []
-        deadline = time.time() + timeout
-        while len(results) < count and time.time() < deadline:
-            remaining = max(1, deadline - time.time())
-            data = self.wait_for_message(msg_type, extra_check, timeout=remaining)
-            if data:
-                results.append(data)
-        return results
+        with self.spans.span(f"wait:{msg_type}"):
+            return self.inbox.collect(msg_type, count, tag, timeout=timeout)
 
-    def sync_barrier(self, barrier_name):
-        """Синхронизация между всеми игроками."""
-        print(f"[{self.nickname}] Барьер '{barrier_name}' — отправляю...")
-        msg = json.dumps({
+    @timed("barrier")
+    def sync_barrier(self, barrier_name, relay=True):
+        """
+        Синхронизация между всеми игроками. relay=False — барьер
+        сообщениями через Inbox, даже если ретранслятор умеет свой: такое
+        ожидание прерывает Resync, а ожидание ответа ретранслятора — нет.
+        """
+        if relay and "barrier" in self.conn.features:
+            # Ретранслятор сам отпустит всех, когда соберутся num_parties игроков
+            log(2, f"[{self.nickname}] Барьер '{barrier_name}' — жду на ретрансляторе...")
+            if not self.conn.barrier(self.game_key(barrier_name), self.num_parties):
+                raise TimeoutError(f"Барьер '{barrier_name}' не собрался")
+            log(2, f"[{self.nickname}] Барьер '{barrier_name}' ОК")
+            return
+
+        log(2, f"[{self.nickname}] Барьер '{barrier_name}' — отправляю...")
+        msg = self.codec.encode({
             "type": "barrier",
             "name": barrier_name,
             "from": self.nickname
         })
-        self.conn.send_to(self.peers, msg)
+        self.send_to(self.peers, msg)
 
         received = set()
         while len(received) < len(self.peers):
-            data = self.wait_for_message(
-                "barrier",
-                extra_check=lambda d: d.get("name") == barrier_name
-            )
+            data = self.wait_for_message("barrier", tag=barrier_name)
             if data:
                 received.add(data["from"])
-                print(f"[{self.nickname}] Барьер '{barrier_name}' — получил от {data['from']}")
-        print(f"[{self.nickname}] Барьер '{barrier_name}' ОК")
+                log(2, f"[{self.nickname}] Барьер '{barrier_name}' — получил от {data['from']}")
+        # Повторы этого барьера больше не нужны
+        self.inbox.retire(("barrier", barrier_name))
+        log(2, f"[{self.nickname}] Барьер '{barrier_name}' ОК")
+
+    def opens_on_repeater(self):
+        """Раскрывать доли разности через reduce: если он выбран и ретранслятор его знает."""
+        return self.open_mode == "reduce" and "reduce" in self.conn.features
+
+    def game_key(self, name):
+        """Метка барьера или reduce этой игры на ретрансляторе: id сессии и nonce."""
+        if self.nonce:
+            return f"{self.session}.{self.nonce}/{name}"
+        return f"{self.session}/{name}"
+
+    def open_on_repeater(self, *vectors):
+        """
+        Раскрыть суммы векторов долей разности (по одному на ось, равной
+        длины): каждый шлёт ретранслятору их все одной командой reduce,
+        обратно приходит только сумма по модулю — n сообщений вместо n·(n−1).
+        """
+        self.openings += 1
+        with self.spans.span("wait:reduce"):
+            total = self.conn.reduce(self.game_key(f"open_{self.openings}"), self.num_parties,
+                                     self.modulus, [value for vector in vectors for value in vector])
+        if total is None:
+            raise TimeoutError(f"Раскрытие {self.openings} не собралось")
+        k = len(vectors[0])
+        return [total[i * k:(i + 1) * k] for i in range(len(vectors))]
+
+    def deal_shares(self, values, randbytes=None):
+        """
+        Разбить вектор values на доли всех сторон. Возвращает (свои доли,
+        {пир: список долей или зерно bytes}). В режиме seed явный вектор
+        поправки достаётся самому раздающему, пирам уходят только зёрна.
+        randbytes — источник случайности (по умолчанию self.randbytes).
+        """
+        randbytes = randbytes or self.randbytes
+        if self.share_mode == "seed":
+            seeds, mine = generate_seed_shares(values, self.num_parties, p=self.modulus,
+                                               correction_index=self.my_index, randbytes=randbytes)
+            dealt = seeds
+        else:
+            dealt = generate_additive_shares_vector(values, self.num_parties, p=self.modulus,
+                                                    randbytes=randbytes)
+            mine = dealt[self.my_index]
+        return mine, {player: dealt[i] for i, player in enumerate(self.all_players)
+                      if player != self.nickname}
+
+    @staticmethod
+    def share_fields(share, names, count=None):
+        """
+        Поля сообщения с долями: по значению на каждое из names или зерно.
+        count — длина векторов (None — в каждом поле одно число).
+        """
+        if isinstance(share, bytes):
+            fields = {"seed": share.hex()}
+            if count is not None:
+                fields["count"] = count
+            return fields
+        if count is None:
+            return dict(zip(names, share))
+        return {name: share[i * count:(i + 1) * count] for i, name in enumerate(names)}
+
+    def shares_from(self, data, names):
+        """Обратное к share_fields: доли по каждому из names, при необходимости из зерна."""
+        if "seed" not in data:
+            return [data[name] for name in names]
+        count = data.get("count")
+        flat = expand_seed(bytes.fromhex(data["seed"]), len(names) * (count or 1), p=self.modulus)
+        if count is None:
+            return flat
+        return [flat[i * count:(i + 1) * count] for i in range(len(names))]
+
+    def fields(self, prefix):
+        """Имена полей сообщения по осям доски: share_g → share_gx, share_gy (packed — share_gp)."""
+        return tuple(prefix + axis for axis in self.axes)
+
+    def point_values(self, guess):
+        """
+        Догадка (координаты 1..field_size по каждому измерению) — в то, что
+        делится: внутренние координаты 0..field_size-1 или packed-число.
+        """
+        internal = [c - 1 for c in guess]
+        if self.board == "packed":
+            return [pack_point(internal, self.field_size)]
+        return internal
 
+    @timed("share_distribution")
     def generate_secret_point(self):
         """
-        Каждый игрок генерирует случайные координаты и раздаёт шеры.
-        Итоговая точка Q = сумма всех вкладов по модулю field_size.
+        Каждый игрок генерирует случайный вклад и раздаёт шеры.
+        Итоговая точка Q = сумма всех вкладов по модулю: по field_size для
+        каждой координаты (coords) или по field_size^d для всей точки (packed).
         Координаты Q: 0..field_size-1 (внутренние), 1..field_size (для пользователя).
         """
-        my_x = random.randint(0, self.field_size - 1)
-        my_y = random.randint(0, self.field_size - 1)
-
-        shares_x = generate_additive_shares(my_x, self.num_parties, p=self.field_size)
-        shares_y = generate_additive_shares(my_y, self.num_parties, p=self.field_size)
+        names = self.fields("share_")
+        mine, dealt = self.deal_shares(random_field_elements(len(self.axes), self.modulus, self.randbytes))
+        self.point_shares[self.nickname] = mine
 
-        for i, player in enumerate(self.all_players):
-            if player == self.nickname:
-                self.shares_x[self.nickname] = shares_x[i]
-                self.shares_y[self.nickname] = shares_y[i]
-            else:
-                msg = json.dumps({
-                    "type": "share",
-                    "from": self.nickname,
-                    "share_x": shares_x[i],
-                    "share_y": shares_y[i]
-                })
-                self.conn.send_to(player, msg)
-                print(f"[{self.nickname}] Отправил долю для {player}")
+        self.send_each({player: self.codec.encode({
+            "type": "share",
+            "from": self.nickname,
+            **self.share_fields(share, names)
+        }) for player, share in dealt.items()})
+        log(2, f"[{self.nickname}] Отправил доли для {list(dealt)}")
 
         msgs = self.collect_messages("share", self.num_parties - 1)
         for data in msgs:
             sender = data["from"]
-            self.shares_x[sender] = data["share_x"]
-            self.shares_y[sender] = data["share_y"]
-            print(f"[{self.nickname}] Получена доля от {sender}")
+            self.point_shares[sender] = self.shares_from(data, names)
+            log(2, f"[{self.nickname}] Получена доля от {sender}")
 
-        self.my_total_share_x = sum(self.shares_x.values()) % self.field_size
-        self.my_total_share_y = sum(self.shares_y.values()) % self.field_size
-        print(f"[{self.nickname}] Точка Q сгенерирована")
+        self.total_shares = [sum(column) % self.modulus for column in zip(*self.point_shares.values())]
+        log(1, f"[{self.nickname}] Точка Q сгенерирована")
 
-    def check_guess(self, guesser, guess_x=None, guess_y=None):
+    def start_preprocessing(self):
+        """Запустить фоновую подготовку масок и разослать пирам первые партии."""
+        self.pool = MaskPool(self.deal_shares, self.field_size, self.pool_size, self.pool_batch,
+                             randbytes=self.pool_randbytes)
+        self.refill_pool(block=True)
+        log(1, f"[{self.nickname}] Пул масок: {len(self.pool.own)}")
+
+    def refill_pool(self, block=False):
+        """
+        Разослать пирам готовые партии масок, пока в пуле есть место.
+        block — дождаться, пока фоновый поток доготовит партию; иначе
+        рассылается только уже готовое.
+        """
+        pool = self.pool
+        while pool.room() >= pool.batch:
+            batch = pool.next_batch(block)
+            if batch is None:
+                break
+            masks, mine, dealt = batch
+            first = pool.add_own(masks, mine)
+            self.send_each({player: self.codec.encode({
+                "type": "pool",
+                "from": self.nickname,
+                "first": first,
+                **self.share_fields(share, ("r_x", "r_y"), count=pool.batch)
+            }) for player, share in dealt.items()})
+
+    def peer_mask(self, dealer, mask_id):
+        """Свои доли маски mask_id игрока dealer; пришедшие до неё партии складываются в пул."""
+        while True:
+            entry = self.pool.take_peer(dealer, mask_id)
+            if entry is not None:
+                return entry
+            data = self.wait_for_message("pool", sender=dealer)
+            if data is None:
+                raise TimeoutError(f"нет маски {mask_id} от {dealer}")
+            shares_x, shares_y = self.shares_from(data, ("r_x", "r_y"))
+            self.pool.add_peer(dealer, data["first"], shares_x, shares_y)
+
+    def check_guess_preprocessed(self, guesser, guess_x=None, guess_y=None):
+        """
+        Проверка с маской из пула: guesser открывает e = g − r, где r —
+        его заранее розданная маска, вместе со своей долей разности, и
+        каждый получает долю догадки как [r] (+ e у самого guesser).
+        Онлайн остаётся один обмен diff_share, без раздачи долей догадки.
+        """
+        f = self.field_size
+        if guesser == self.nickname:
+            log(1, f"[{self.nickname}] Угадываю: ({guess_x}, {guess_y})")
+            entry = self.pool.take_own()
+            if entry is None:
+                # Пул опустел быстрее, чем пополнялся — доготовить партию сейчас
+                self.pool.misses += 1
+                self.refill_pool(block=True)
+                entry = self.pool.take_own()
+            else:
+                self.pool.hits += 1
+            mask_id, r_x, r_y, share_rx, share_ry = entry
+            e_x = (guess_x - 1 - r_x) % f
+            e_y = (guess_y - 1 - r_y) % f
+            share_gx, share_gy = share_rx + e_x, share_ry + e_y
+        else:
+            opening = self.wait_for_message("diff_share", tag=guesser, sender=guesser)
+            share_gx, share_gy = self.peer_mask(guesser, opening["mask"])
+
+        total_x, total_y = self.total_shares
+        d_x = (total_x - share_gx) % f
+        d_y = (total_y - share_gy) % f
+        msg = {
+            "type": "diff_share",
+            "from": self.nickname,
+            "d_x": d_x,
+            "d_y": d_y,
+            "guesser": guesser
+        }
+        if guesser == self.nickname:
+            msg.update(mask=mask_id, e_x=e_x, e_y=e_y)
+        self.send_to(self.peers, self.codec.encode(msg))
+
+        total_dx, total_dy = d_x, d_y
+        remaining = self.num_parties - 1
+        if guesser != self.nickname:
+            total_dx += opening["d_x"]
+            total_dy += opening["d_y"]
+            remaining -= 1
+        for data in self.collect_messages("diff_share", remaining, tag=guesser):
+            total_dx += data["d_x"]
+            total_dy += data["d_y"]
+
+        guessed = total_dx % f == 0 and total_dy % f == 0
+        if guessed:
+            log(1, f"[{self.nickname}] ✅ {guesser} УГАДАЛ!")
+        else:
+            log(1, f"[{self.nickname}] ❌ {guesser} не угадал")
+        return guessed
+
+    @timed("check")
+    def check_guess(self, guesser, *guess):
         """
         Проверить угадывание через MPC.
-        guess_x, guess_y — координаты 1..field_size (пользовательские).
-        Внутри переводим в 0..field_size-1.
+        guess — координаты 1..field_size (пользовательские), задаёт только сам guesser.
+        Внутри переводим в 0..field_size-1 (packed — в одно число).
         """
+        if self.pool is not None:
+            return self.check_guess_preprocessed(guesser, *guess)
+
         is_me = (guesser == self.nickname)
 
         if is_me:
-            # Пользователь вводит 1..n, внутри храним 0..n-1
-            internal_x = guess_x - 1
-            internal_y = guess_y - 1
-            print(f"[{self.nickname}] Угадываю: ({guess_x}, {guess_y})")
-
-            shares_gx = generate_additive_shares(internal_x, self.num_parties, p=self.field_size)
-            shares_gy = generate_additive_shares(internal_y, self.num_parties, p=self.field_size)
-            my_share_gx = shares_gx[self.my_index]
-            my_share_gy = shares_gy[self.my_index]
-
-            for i, player in enumerate(self.all_players):
-                if player != self.nickname:
-                    msg = json.dumps({
-                        "type": "guess_share",
-                        "from": self.nickname,
-                        "guesser": guesser,
-                        "share_gx": shares_gx[i],
-                        "share_gy": shares_gy[i]
-                    })
-                    self.conn.send_to(player, msg)
+            log(1, f"[{self.nickname}] Угадываю: {guess}")
+
+            my_shares, dealt = self.deal_shares(self.point_values(guess))
+
+            self.send_each({player: self.codec.encode({
+                "type": "guess_share",
+                "from": self.nickname,
+                "guesser": guesser,
+                **self.share_fields(share, self.fields("share_g"))
+            }) for player, share in dealt.items()})
         else:
-            data = self.wait_for_message(
-                "guess_share",
-                extra_check=lambda d: d.get("guesser") == guesser
-            )
-            my_share_gx = data["share_gx"]
-            my_share_gy = data["share_gy"]
-
-        # Вычисляем долю разности
-        d_x_share = (self.my_total_share_x - my_share_gx) % self.field_size
-        d_y_share = (self.my_total_share_y - my_share_gy) % self.field_size
-
-        # Отправляем свою долю разности всем
-        msg = json.dumps({
-            "type": "diff_share",
+            data = self.wait_for_message("guess_share", tag=guesser)
+            my_shares = self.shares_from(data, self.fields("share_g"))
+
+        # Вычисляем доли разности — по одной на ось
+        diff = [(total - share) % self.modulus for total, share in zip(self.total_shares, my_shares)]
+
+        if self.opens_on_repeater():
+            totals = [vector[0] for vector in self.open_on_repeater(*([d] for d in diff))]
+        else:
+            # Отправляем свои доли разности всем
+            names = self.fields("d_")
+            msg = self.codec.encode({
+                "type": "diff_share",
+                "from": self.nickname,
+                **dict(zip(names, diff)),
+                "guesser": guesser
+            })
+            self.send_to(self.peers, msg)
+
+            # Собираем доли от всех и восстанавливаем разность
+            totals = list(diff)
+            msgs = self.collect_messages("diff_share", self.num_parties - 1, tag=guesser)
+            for data in msgs:
+                for i, name in enumerate(names):
+                    totals[i] += data[name]
+
+        guessed = all(total % self.modulus == 0 for total in totals)
+
+        if guessed:
+            log(1, f"[{self.nickname}] ✅ {guesser} УГАДАЛ!")
+        else:
+            log(1, f"[{self.nickname}] ❌ {guesser} не угадал")
+        return guessed
+
+    def start_game(self, expected_players):
+        """Всё до первого раунда: подключение, ожидание игроков, генерация Q."""
+        self.connect_and_wait(expected_players)
+
+        self.negotiate_codec()
+        if self.mesh_mode != "off":
+            self.setup_mesh()
+        self.sync_barrier("game_start")
+
+        log(1, f"\n{'='*50}")
+        log(1, f"[{self.nickname}] ИГРА! Поле {'x'.join([str(self.field_size)] * self.dimensions)}")
+        log(1, f"{'='*50}\n")
+
+        self.generate_secret_point()
+        if self.pool_size:
+            self.start_preprocessing()
+        self.sync_barrier("point_generated")
+
+    @timed("check")
+    def check_guesses(self, guesser, guesses=None):
+        """
+        Пакетная проверка K догадок одного игрока: по одному сообщению на
+        пира в каждой фазе при любом K. guesses — список точек в 1..field_size,
+        задаёт его только сам guesser. Возвращает список: угадана ли каждая.
+        """
+        names = self.fields("share_g")
+        if guesser == self.nickname:
+            log(1, f"[{self.nickname}] Проверяю пакет из {len(guesses)} догадок")
+            k = len(guesses)
+            values = [self.point_values(guess) for guess in guesses]
+            # Векторы по осям подряд: все x, затем все y
+            mine, dealt = self.deal_shares([point[axis] for axis in range(len(self.axes)) for point in values])
+            self.send_each({player: self.codec.encode({
+                "type": "guess_share",
+                "from": self.nickname,
+                "guesser": guesser,
+                **self.share_fields(share, names, count=k)
+            }) for player, share in dealt.items()})
+            my_shares = [mine[axis * k:(axis + 1) * k] for axis in range(len(self.axes))]
+        else:
+            data = self.wait_for_message("guess_share", tag=guesser)
+            my_shares = self.shares_from(data, names)
+
+        # K долей разности одним проходом по вектору
+        m = self.modulus
+        diff = [[(total - g) % m for g in shares] for total, shares in zip(self.total_shares, my_shares)]
+        if self.opens_on_repeater():
+            totals = self.open_on_repeater(*diff)
+        else:
+            names = self.fields("d_")
+            msg = self.codec.encode({
+                "type": "diff_share",
+                "from": self.nickname,
+                "guesser": guesser,
+                **dict(zip(names, diff))
+            })
+            self.send_to(self.peers, msg)
+
+            collected = [[vector] for vector in diff]
+            for data in self.collect_messages("diff_share", self.num_parties - 1, tag=guesser):
+                for vectors, name in zip(collected, names):
+                    vectors.append(data[name])
+            totals = [reconstruct_additive_vector(vectors, p=m) for vectors in collected]
+        results = [all(d == 0 for d in column) for column in zip(*totals)]
+        log(1, f"[{self.nickname}] {guesser}: угадано {sum(results)} из {len(results)}")
+        return results
+
+    @timed("check")
+    def check_all_guesses(self, round_num, *guess):
+        """
+        Одновременный раунд: каждый игрок делит свою догадку, доли разности
+        уходят одним сообщением с вектором по всем угадывающим, и все n
+        проверок раскрываются за один обмен. Возвращает {игрок: угадал}.
+        """
+        log(1, f"[{self.nickname}] Угадываю: {guess}")
+        names = self.fields("share_g")
+        mine, dealt = self.deal_shares(self.point_values(guess))
+
+        self.send_each({player: self.codec.encode({
+            "type": "guess_share",
             "from": self.nickname,
-            "d_x": d_x_share,
-            "d_y": d_y_share,
-            "guesser": guesser
-        })
-        self.conn.send_to(self.peers, msg)
+            "guesser": self.nickname,
+            "round": round_num,
+            **self.share_fields(share, names)
+        }) for player, share in dealt.items()})
+
+        shares = {self.nickname: mine}
+        for player in self.peers:
+            data = self.wait_for_message("guess_share", tag=player)
+            shares[player] = self.shares_from(data, names)
+
+        # По одной доле разности на каждого угадывающего, в порядке all_players; вектор на ось
+        m = self.modulus
+        diff = [[(total - shares[p][axis]) % m for p in self.all_players]
+                for axis, total in enumerate(self.total_shares)]
+        if self.opens_on_repeater():
+            totals = self.open_on_repeater(*diff)
+        else:
+            names = self.fields("d_")
+            msg = self.codec.encode({
+                "type": "diff_share",
+                "from": self.nickname,
+                "round": round_num,
+                **dict(zip(names, diff))
+            })
+            self.send_to(self.peers, msg)
+            totals = [list(vector) for vector in diff]
+            for data in self.collect_messages("diff_share", self.num_parties - 1, tag=round_num):
+                for vector, name in zip(totals, names):
+                    for i in range(self.num_parties):
+                        vector[i] += data[name][i]
+
+        results = {}
+        for i, player in enumerate(self.all_players):
+            guessed = all(vector[i] % m == 0 for vector in totals)
+            results[player] = guessed
+            if guessed:
+                log(1, f"[{self.nickname}] ✅ {player} УГАДАЛ!")
+            else:
+                log(1, f"[{self.nickname}] ❌ {player} не угадал")
+        return results
 
-        # Собираем доли от всех
-        all_dx = {self.nickname: d_x_share}
-        all_dy = {self.nickname: d_y_share}
+    def break_tie(self, winners, round_num):
+        """Применить правило tie_break к списку угадавших в одном раунде."""
+        if len(winners) < 2 or self.tie_break == "all":
+            return winners
+        order = self.all_players
+        if self.tie_break == "rotate":
+            start = round_num % self.num_parties
+            order = order[start:] + order[:start]
+        return [next(player for player in order if player in winners)]
+
+    def ask_guess(self):
+        """Координаты догадки 1..field_size по каждому измерению доски."""
+        names = "xyzw" if self.dimensions <= 4 else [f"x{i}" for i in range(1, self.dimensions + 1)]
+        return tuple(int(input(f"{name} (1-{self.field_size}): ")) for name in names[:self.dimensions])
+
+    @timed("round")
+    def play_turn(self, round_num, player):
+        """Ход одного игрока в очередном режиме. Возвращает True, если он угадал."""
+        log(1, f"\n--- Раунд {round_num}: {player} ---")
+
+        if player == self.nickname:
+            guess = self.ask_guess()
+
+            msg = self.codec.encode({
+                "type": "start_check",
+                "guesser": self.nickname
+            })
+            self.send_to(self.peers, msg)
+        else:
+            log(1, f"[{self.nickname}] Жду ход {player}...")
+            self.wait_for_message("start_check", tag=player)
 
-        msgs = self.collect_messages(
-            "diff_share",
-            self.num_parties - 1,
-            extra_check=lambda d: d.get("guesser") == guesser
-        )
-        for data in msgs:
-            all_dx[data["from"]] = data["d_x"]
-            all_dy[data["from"]] = data["d_y"]
+        # Всё, что написано до очередного ожидания, уходит одной записью:
+        # доли догадки вместе с долей разности, маски пула вместе с барьером
+        with self.conn.batch():
+            if player == self.nickname:
+                guessed = self.check_guess(self.nickname, *guess)
+            else:
+                guessed = self.check_guess(player)
 
-        # Восстанавливаем разность
-        total_dx = sum(all_dx.values()) % self.field_size
-        total_dy = sum(all_dy.values()) % self.field_size
+            if self.pool is not None:
+                # Простой до барьера — дослать маски, израсходованные за ход
+                self.refill_pool()
+            self.sync_barrier(f"round_{round_num}")
+        self.inbox.retire_round(round_num)
+        return guessed
 
-        guessed = (total_dx == 0 and total_dy == 0)
+    def turn_guesser(self, round_num):
+        """Чей ход в раунде round_num: игроки по кругу в порядке all_players."""
+        return self.all_players[(round_num - 1) % self.num_parties]
 
+    def pipelines_turns(self):
+        """
+        Ходы по очереди идут конвейером; с пулом масок — по одному через
+        play_turn: там доли разности ждут маску, открытую угадывающим.
+        """
+        return self.pool is None
+
+    def deal_turn(self, round_num):
+        """
+        Раздать доли догадки хода round_num, если он наш. Доли помечены
+        номером раунда, поэтому уходят, пока раскрывается предыдущий ход.
+        Каждый ход раздаётся один раз.
+        """
+        if round_num <= self.dealt_round:
+            return
+        self.dealt_round = round_num
+        if self.turn_guesser(round_num) != self.nickname:
+            return
+        guess = self.ask_guess()
+        log(1, f"[{self.nickname}] Угадываю в раунде {round_num}: {guess}")
+        self.turn_shares[round_num], dealt = self.deal_shares(self.point_values(guess))
+        self.send_each({player: self.codec.encode({
+            "type": "guess_share",
+            "from": self.nickname,
+            "round": round_num,
+            **self.share_fields(share, self.fields("share_g"))
+        }) for player, share in dealt.items()})
+
+    @timed("round")
+    def play_pipelined_turn(self, round_num):
+        """
+        Ход round_num конвейером: пока раскрывается его разность, по сети
+        уже идут доли догадки следующего хода. Без start_check и барьера —
+        сообщения помечены раундом, а результаты применяются строго по
+        порядку ходов. Возвращает True, если игрок хода угадал.
+        """
+        guesser = self.turn_guesser(round_num)
+        log(1, f"\n--- Раунд {round_num}: {guesser} ---")
+        self.deal_turn(round_num)
+        if guesser == self.nickname:
+            shares = self.turn_shares.pop(round_num)
+        else:
+            data = self.wait_for_message("guess_share", tag=round_num, sender=guesser)
+            shares = self.shares_from(data, self.fields("share_g"))
+
+        m = self.modulus
+        diff = [(total - share) % m for total, share in zip(self.total_shares, shares)]
+        if self.opens_on_repeater():
+            self.deal_turn(round_num + 1)
+            totals = [vector[0] for vector in self.open_on_repeater(*([d] for d in diff))]
+        else:
+            names = self.fields("d_")
+            self.send_to(self.peers, self.codec.encode({
+                "type": "diff_share",
+                "from": self.nickname,
+                "round": round_num,
+                **dict(zip(names, diff))
+            }))
+            # Своя доля разности уже ушла — следующий ход раздаётся, пока идут чужие
+            self.deal_turn(round_num + 1)
+            totals = list(diff)
+            for data in self.collect_messages("diff_share", self.num_parties - 1, tag=round_num):
+                for i, name in enumerate(names):
+                    totals[i] += data[name]
+        self.inbox.retire_round(round_num)
+
+        guessed = all(total % m == 0 for total in totals)
         if guessed:
-            print(f"[{self.nickname}] ✅ {guesser} УГАДАЛ!")
+            log(1, f"[{self.nickname}] ✅ {guesser} УГАДАЛ!")
         else:
-            print(f"[{self.nickname}] ❌ {guesser} не угадал")
+            log(1, f"[{self.nickname}] ❌ {guesser} не угадал")
         return guessed
 
+    @timed("round")
+    def play_simultaneous_round(self, round_num):
+        """Раунд, в котором угадывают все сразу. Возвращает победителей."""
+        log(1, f"\n--- Раунд {round_num}: все игроки ---")
+        results = self.check_all_guesses(round_num, *self.ask_guess())
+        # Все доли раунда собраны — опоздавшие его сообщения хранить незачем
+        self.inbox.retire_round(round_num)
+        winners = [player for player in self.all_players if results[player]]
+        return self.break_tie(winners, round_num)
+
     def play(self, expected_players):
         """Основной игровой процесс."""
-        self.connect_and_wait(expected_players)
+        self.start_game(expected_players)
+        self.announce(self.play_rounds())
+        if self.pool is not None:
+            self.pool.close()
+        self.conn.close()
 
-        print(f"[{self.nickname}] Жду 3 сек перед стартом...")
-        time.sleep(3)
+    def play_rounds(self, first=None):
+        """
+        Раунды до победы; first — что сделать перед ними (реванш, возврат
+        в партию). Resync в любом месте — в first, в раунде или посреди
+        самой пересинхронизации — переводит на эпоху вернувшегося пира, и
+        игра идёт дальше с согласованного раунда. Возвращает победителей.
+        """
+        winners = []
+        request = None
+        while not winners:
+            try:
+                if first is not None:
+                    step, first = first, None
+                    step()
+                elif request is not None:
+                    pending, request = request, None
+                    self.resync(pending)
+                else:
+                    winners = self.play_next_round()
+            except Resync as e:
+                request = e.request
+        return winners
 
-        self.sync_barrier("game_start")
+    def play_next_round(self):
+        """
+        Раунд после completed_round в режиме игры; победители раунда (пусто —
+        никто). completed_round None — точки Q в этой партии ещё нет, и
+        вместо раунда она раздаётся.
+        """
+        if self.completed_round is None:
+            self.deal_game()
+            return []
+        round_num = self.completed_round + 1
+        if self.round_mode == "simultaneous":
+            winners = self.play_simultaneous_round(round_num)
+        elif self.pipelines_turns():
+            winners = [self.turn_guesser(round_num)] if self.play_pipelined_turn(round_num) else []
+        else:
+            guesser = self.turn_guesser(round_num)
+            winners = [guesser] if self.play_turn(round_num, guesser) else []
+        self.completed_round = round_num
+        self.save_checkpoint()
+        return winners
+
+    def announce(self, winners):
+        log(0, f"\n{'='*50}")
+        log(0, f"🏆 ПОБЕДИТЕЛЬ: {', '.join(winners)}!")
+        log(0, f"{'='*50}")
+        phases = sorted(self.spans.summary().items(), key=lambda item: -item[1]["total_ms"])
+        log(1, f"[{self.nickname}] Время по фазам, мс: "
+               + ", ".join(f"{name} {summary['total_ms']:.1f}" for name, summary in phases))
+
+    def play_session(self, expected_players, games):
+        """
+        Серия из games партий на одном соединении: подключение, договор о
+        кодеке и состав игроков — один раз, реванш начинается с барьера и
+        новой точки Q. С checkpoint после каждого раунда на диск пишется
+        своя доля Q и номер раунда; если файл уже есть, игрок не начинает
+        заново, а возвращается в идущую партию (resume). Возвращает
+        победителей каждой сыгранной здесь партии.
+        """
+        if self.pool_size:
+            raise ValueError("серия партий идёт без пула масок")
+        if self.checkpoint and (self.open_mode != "peers" or self.mesh_mode != "off"):
+            raise ValueError("возврат в партию только с --open peers и без --mesh")
+        self.inbox.control["resume"] = self.on_resume
+        self.inbox.upcoming = set(self.next_sessions())
+        state = self.load_checkpoint()
+        if state is not None:
+            first = functools.partial(self.resume, expected_players, state)
+        else:
+            self.start_game(expected_players)
+            self.save_checkpoint()
+            first = None
 
-        print(f"\n{'='*50}")
-        print(f"[{self.nickname}] ИГРА! Поле {self.field_size}x{self.field_size}")
-        print(f"{'='*50}\n")
+        results = []
+        while True:
+            winners = self.play_rounds(first)
+            self.announce(winners)
+            results.append(winners)
+            if self.game >= games:
+                break
+            first = self.rematch
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.conn.close()
+        return results
+
+    def game_session(self, game, epoch):
+        if (game, epoch) == (1, 0):
+            return self.base_session
+        return f"{self.base_session}:{game}.{epoch}"
 
+    def next_sessions(self):
+        """Чьи сообщения могут прийти раньше, чем мы туда перейдём: переигровка и реванш."""
+        return self.game_session(self.game, self.epoch + 1), self.game_session(self.game + 1, 0)
+
+    def switch_game(self, game, epoch):
+        """
+        Перейти к партии game (эпохе epoch): новый id в конвертах, барьерах
+        и reduce. Контрольная точка пишется до первого сообщения в новой
+        эпохе — вернувшись, игрок пошлёт resume туда, где его ждут.
+        """
+        self.game, self.epoch = game, epoch
+        self.session = self.game_session(game, epoch)
+        self.openings = 0
+        self.dealt_round = 0
+        self.turn_shares = {}
+        self.save_checkpoint()
+        # Заранее пришедший resume бросит Resync уже здесь — переход к этому моменту сделан
+        self.inbox.switch(self.session, self.next_sessions())
+
+    def rematch(self):
+        """Следующая партия серии: те же соединение и игроки; точку Q раздаст deal_game."""
+        self.completed_round = None
+        self.total_shares = None
+        self.switch_game(self.game + 1, 0)
+
+    @timed("rematch")
+    def deal_game(self):
+        """Барьер и новая точка Q партии — в реванше или заново, если кто-то оборвался до неё."""
+        # Вернувшийся пир должен прервать и сам барьер — он на сообщениях
+        self.sync_barrier("game_start", relay=False)
+        log(1, f"\n[{self.nickname}] Партия {self.game}")
         self.generate_secret_point()
-        self.sync_barrier("point_generated")
+        self.completed_round = 0
+        self.save_checkpoint()
+
+    def save_checkpoint(self):
+        """Записать контрольную точку: новый файл и rename, чтобы не оставить половину."""
+        if not self.checkpoint:
+            return
+        state = {
+            "nickname": self.nickname,
+            "session": self.base_session,
+            "game": self.game,
+            "epoch": self.epoch,
+            "round": self.completed_round,
+            "players": self.all_players,
+            "total_shares": self.total_shares,
+            "codec": self.codec.name,
+            "nonce": self.nonce,
+            "modulus": self.modulus
+        }
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpoint)
+
+    def load_checkpoint(self):
+        """Состояние из файла контрольной точки; None — файла нет."""
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return None
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if (state["nickname"], state["session"], state["modulus"]) != (self.nickname, self.base_session,
+                                                                      self.modulus):
+            raise ValueError(f"{self.checkpoint}: контрольная точка другой игры")
+        return state
+
+    @timed("resume")
+    def resume(self, expected_players, state):
+        """
+        Вернуться в идущую партию после обрыва: доли Q и раунд — из
+        контрольной точки, пиры по resume переходят на новую эпоху партии,
+        и все продолжают с самого раннего незаконченного раунда. Если
+        обрыв пришёлся на реванш до точки Q, её раздают заново.
+        """
+        self.all_players = state["players"]
+        self.my_index = self.all_players.index(self.nickname)
+        self.num_parties = len(self.all_players)
+        self.peers = [player for player in self.all_players if player != self.nickname]
+        self.total_shares = state["total_shares"]
+        self.nonce = state["nonce"]
+        self.completed_round = state["round"]
+        self.game, self.epoch = state["game"], state["epoch"]
+        self.session = self.game_session(self.game, self.epoch)
+        self.inbox.switch(self.session, self.next_sessions())
 
-        round_num = 0
-        winner = None
-
-        while winner is None:
-            for player in self.all_players:
-                round_num += 1
-                print(f"\n--- Раунд {round_num}: {player} ---")
-
-                if player == self.nickname:
-                    guess_x = int(input(f"x (1-{self.field_size}): "))
-                    guess_y = int(input(f"y (1-{self.field_size}): "))
-
-                    msg = json.dumps({
-                        "type": "start_check",
-                        "guesser": self.nickname
-                    })
-                    self.conn.send_to(self.peers, msg)
-                    time.sleep(0.5)
-                    guessed = self.check_guess(self.nickname, guess_x, guess_y)
-                else:
-                    print(f"[{self.nickname}] Жду ход {player}...")
-                    self.wait_for_message(
-                        "start_check",
-                        extra_check=lambda d: d.get("guesser") == player
-                    )
-                    guessed = self.check_guess(player)
-
-                self.sync_barrier(f"round_{round_num}")
-
-                if guessed:
-                    winner = player
-                    break
-
-        print(f"\n{'='*50}")
-        print(f"🏆 ПОБЕДИТЕЛЬ: {winner}!")
-        print(f"{'='*50}")
-        self.conn.close()
\ No newline at end of file
+        self.conn.connect()
+        self.conn.wait_for_peers(expected_players)
+        binary = BinaryCodec(self.all_players, self.modulus)
+        self.inbox.decode = binary.decode
+        if state["codec"] == binary.name:
+            self.codec = binary
+        log(1, f"[{self.nickname}] Возвращаюсь в партию {self.game} после раунда {self.completed_round}")
+
+        # resume уходит в эпохе контрольной точки — её пиры слушают или ждут как следующую
+        self.send_to(self.peers, self.codec.encode({
+            "type": "resume",
+            "from": self.nickname,
+            "epoch": self.epoch + 1
+        }))
+        self.switch_game(self.game, self.epoch + 1)
+        self.sync_rounds()
+
+    def on_resume(self, data):
+        """Обработчик resume в Inbox: прервать ожидание текущего раунда."""
+        raise Resync(data)
+
+    @timed("resync")
+    def resync(self, request):
+        """Пир вернулся: перейти на его эпоху партии и договориться, с какого раунда продолжать."""
+        log(1, f"[{self.nickname}] {request['from']} вернулся, переигрываем незаконченный раунд")
+        self.switch_game(self.game, request["epoch"])
+        self.sync_rounds()
+
+    def sync_rounds(self):
+        """
+        Каждый рассылает последний законченный раунд; продолжают все с
+        самого раннего — раунд, который кто-то не успел закончить,
+        переигрывается целиком.
+        """
+        self.send_to(self.peers, self.codec.encode({
+            "type": "resync",
+            "from": self.nickname,
+            "completed": self.completed_round
+        }))
+        completed = [self.completed_round]
+        completed += [data["completed"] for data in self.collect_messages("resync", self.num_parties - 1)]
+        # Кто-то ещё без точки Q этой партии — её раздают заново все
+        self.completed_round = None if None in completed else min(completed)
+        self.save_checkpoint()
\ No newline at end of file
@@ -0,0 +1,92 @@
+# preprocessing.py
+
+import collections
+import os
+import queue
+import threading
+import time
+
+from crypto_utils import random_field_elements
+
+
+class MaskPool:
+    """
+    Пул заранее розданных случайных масок (r_x, r_y) для проверки догадок.
+    Маски, которые раздал этот игрок, известны ему целиком; от остальных
+    хранятся только свои доли, по id маски. Фоновый поток готовит партии
+    масок и их долей в ограниченную очередь, а рассылает их основной поток
+    в простое между ходами, чтобы не делить с ним сокет. randbytes —
+    свой источник случайности потока: deal получает его вторым аргументом.
+    """
+
+    def __init__(self, deal, field_size, size, batch, randbytes=os.urandom):
+        self.deal = deal
+        self.randbytes = randbytes
+        self.field_size = field_size
+        self.size = size
+        self.batch = min(batch, size)
+        self.ready = queue.Queue(maxsize=max(1, size // self.batch))
+        self.own = collections.OrderedDict()
+        self.peer = collections.defaultdict(dict)
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.generate_time = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+        self.thread.start()
+
+    def _produce(self):
+        """Фоновая генерация: маски, доли всех сторон, сообщения для пиров."""
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            masks = random_field_elements(2 * self.batch, self.field_size, self.randbytes)
+            mine, dealt = self.deal(masks, self.randbytes)
+            self.generate_time += time.perf_counter() - start
+            self.generated += self.batch
+            while not self.stopped.is_set():
+                try:
+                    self.ready.put((masks, mine, dealt), timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def room(self):
+        """Сколько своих масок ещё поместится в пул."""
+        return self.size - len(self.own)
+
+    def next_batch(self, block):
+        """Готовая партия (masks, mine, dealt) или None, если её ещё нет."""
+        try:
+            return self.ready.get(block=block, timeout=30 if block else None)
+        except queue.Empty:
+            return None
+
+    def add_own(self, masks, mine):
+        """Разосланная партия: присваивает маскам id, возвращает первый."""
+        first = self.next_id
+        k = len(masks) // 2
+        for i in range(k):
+            self.own[first + i] = (masks[i], masks[k + i], mine[i], mine[k + i])
+        self.next_id += k
+        return first
+
+    def take_own(self):
+        """Следующая своя маска: (id, r_x, r_y, доля r_x, доля r_y) или None."""
+        if not self.own:
+            return None
+        mask_id, entry = self.own.popitem(last=False)
+        return (mask_id,) + entry
+
+    def add_peer(self, dealer, first, shares_x, shares_y):
+        entries = self.peer[dealer]
+        for i, (share_x, share_y) in enumerate(zip(shares_x, shares_y)):
+            entries[first + i] = (share_x, share_y)
+
+    def take_peer(self, dealer, mask_id):
+        """Доли маски mask_id игрока dealer или None, если партия ещё не пришла."""
+        return self.peer[dealer].pop(mask_id, None)
+
+    def close(self):
+        self.stopped.set()
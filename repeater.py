@@ -1,131 +1,1152 @@
 #!/usr/bin/env -S python3
 #-*- coding:utf-8 -*-
 
-from sys import argv
+import argparse
+import collections
+import http.server
 import os
+import selectors
 import socket
 import socketserver
 import threading
 import time
 import re
 
+from framing import FRAME_MODES, FrameError, FrameReader, pack_frame
+from metrics import BYTES_BOUNDS, SECONDS_BOUNDS, Metrics
+
 available_connections = {}
 connections_lock = threading.Lock()
+# Комнаты: имя -> {никнейм: соединение}. До команды join клиент в комнате "",
+# так что без комнат всё работает как раньше: один порт — одна игра
+rooms = {"": {}}
+# Подписчики на события joined/left и ждущие "wait N" (conn -> N)
+presence_subscribers = set()
+presence_waiters = {}
+# Открытые барьеры: (комната, имя) -> множество пришедших соединений
+barriers = {}
+# Открытые reduce: (комната, метка) -> {n, modulus, sums, count, conns}
+reduces = {}
+# Кластер: каталог клиентов других узлов. remote_connections: никнейм ->
+# (связь с узлом, комната), remote_rooms: комната -> {никнейм: связь}
+cluster = None
+remote_connections = {}
+remote_rooms = {}
+# Счётчики и гистограммы ретранслятора: команда stats и --metrics-port
+stats = Metrics()
+
+# Что умеет ретранслятор сверх print/send — клиент спрашивает командой features
+FEATURES = ("frames", "wait", "subscribe", "barrier", "rooms", "stats", "scatter", "reduce")
+COMMANDS = ("print", "send", "scatter", "wait", "subscribe", "barrier", "reduce", "join", "features", "frames", "stats")
+COMMAND_COUNTERS = {name: 'commands_total{{command="{}"}}'.format(name) for name in COMMANDS + ("unknown",)}
+ROOM_PATTERN = "[a-z0-9_-]+"
+
+IDLE_TIMEOUT = 3600  # 1 час таймаут
+MAX_RECV_SIZE = 1024
+ENGINES = ("threaded", "loop")
+
+# Очередь исходящих у каждого соединения ограничена OUTBOX_LIMIT байт.
+# Что делать с отстающим получателем: drop — выбросить сообщение,
+# disconnect — отключить получателя, block — притормозить отправителя.
+OUTBOX_LIMIT = 1024 * 1024
+SLOW_POLICIES = ("block", "drop", "disconnect")
+BLOCK_TIMEOUT = 30
+
+# Потоковый движок держит по потоку-обработчику на клиента; сверх MAX_CLIENTS
+# новых клиентов отклоняем с ошибкой. Потоки записи и связи кластера не в счёт.
+MAX_CLIENTS = 4096
+
+def register_connection(conn, nickname):
+    """Регистрирует соединение под никнеймом. Возвращает текст ошибки или None."""
+    if not re.fullmatch("[a-z0-9_]+", nickname, flags=re.IGNORECASE):
+        return "Nickname must contain only characters A-Za-z0-9_\n"
+    with connections_lock:
+        if nickname in available_connections or nickname in remote_connections:
+            return "Nickname is already used\n"
+        available_connections[nickname] = conn
+        stats.inc("connections_total")
+        conn.room = ""
+        rooms[""][nickname] = conn
+        subscribers = _room_subscribers("", conn)
+        released = _ready_waiters("")
+    conn.nickname = nickname
+    # Рассылаем вне блокировки: send_raw может закрыть соединение и снять регистрацию
+    _notify_presence(subscribers, "joined", nickname)
+    _release_waiters(released)
+    _publish_presence(nickname, "")
+    return None
+
+def _room_subscribers(room, conn):
+    """Подписчики комнаты, кроме самого conn. Вызывать под connections_lock."""
+    return [other for other in presence_subscribers if other.room == room and other is not conn]
+
+def _room_size(room):
+    """Участников комнаты на всех узлах кластера. Под connections_lock."""
+    return len(rooms.get(room, ())) + len(remote_rooms.get(room, ()))
+
+def _ready_waiters(room):
+    """Снимает и возвращает ждущих wait N, чья комната набрала N. Под connections_lock."""
+    members = _room_size(room)
+    ready = [other for other, n in presence_waiters.items() if other.room == room and members >= n]
+    for other in ready:
+        presence_waiters.pop(other)
+    return ready
+
+def _leave_room(conn):
+    """
+    Убирает conn из его комнаты и её барьеров. Под connections_lock.
+    Возвращает reduce, в которые conn уже внёс вклад: [(метка, остальные
+    участники)] — им надо ответить _fail_reduces вне блокировки.
+    """
+    members = rooms.get(conn.room, {})
+    if members.get(conn.nickname) is conn:
+        members.pop(conn.nickname)
+    if not members and conn.room:
+        rooms.pop(conn.room, None)
+    for key, arrived in list(barriers.items()):
+        if key[0] == conn.room:
+            arrived.discard(conn)
+            if not arrived:
+                del barriers[key]
+    # Без вклада ушедшего сумма не соберётся, а с ним — была бы чужой
+    # следующей игре с той же меткой: reduce снимается целиком
+    failed = []
+    for key, entry in list(reduces.items()):
+        if key[0] == conn.room and conn in entry["conns"]:
+            del reduces[key]
+            failed.append((key[1], entry["conns"] - {conn}))
+    return failed
+
+def _fail_reduces(failed):
+    for tag, conns in failed:
+        data = "Reduce mismatch: {}\n".format(tag).encode()
+        for other in conns:
+            other.send_raw(data)
+
+def _notify_presence(subscribers, event, nickname):
+    data = "{} {}\n".format(event, nickname).encode()
+    for other in subscribers:
+        other.send_raw(data)
+
+def _release_waiters(released):
+    for other in released:
+        other.send_raw(available_connections_text(other.nickname, other.room).encode())
+
+def unregister_connection(conn):
+    with connections_lock:
+        presence_subscribers.discard(conn)
+        presence_waiters.pop(conn, None)
+        if available_connections.get(conn.nickname) is not conn:
+            return
+        available_connections.pop(conn.nickname)
+        failed = _leave_room(conn)
+        subscribers = _room_subscribers(conn.room, conn)
+    _fail_reduces(failed)
+    _notify_presence(subscribers, "left", conn.nickname)
+    _publish_presence(conn.nickname, None)
+
+def join_room(conn, room):
+    """
+    join <room>: перевести соединение в комнату. print, send, wait, subscribe
+    и barrier дальше видят только её участников. Ответ — как на print.
+    """
+    with connections_lock:
+        old = conn.room
+        if old != room:
+            presence_waiters.pop(conn, None)
+            failed = _leave_room(conn)
+            left_to = _room_subscribers(old, conn)
+            conn.room = room
+            rooms.setdefault(room, {})[conn.nickname] = conn
+            joined_to = _room_subscribers(room, conn)
+            released = _ready_waiters(room)
+        else:
+            left_to = joined_to = released = failed = []
+    _fail_reduces(failed)
+    _notify_presence(left_to, "left", conn.nickname)
+    _notify_presence(joined_to, "joined", conn.nickname)
+    _release_waiters(released)
+    _publish_presence(conn.nickname, room)
+    conn.send_raw(available_connections_text(conn.nickname, room).encode())
+
+def wait_for_connections(conn, n):
+    """wait N: ответить списком подключённых, как только их (вместе с conn) станет N."""
+    with connections_lock:
+        ready = _room_size(conn.room) >= n
+        if not ready:
+            presence_waiters[conn] = n
+    if ready:
+        conn.send_raw(available_connections_text(conn.nickname, conn.room).encode())
+
+def arrive_at_barrier(conn, name, n):
+    """
+    barrier <name> <n>: когда придут n участников, всем уходит одна строка
+    "released <name>" — вместо n·(n−1) сообщений между игроками.
+    """
+    with connections_lock:
+        key = (conn.room, name)
+        arrived = barriers.setdefault(key, set())
+        arrived.add(conn)
+        if len(arrived) < n:
+            return
+        del barriers[key]
+    data = "released {}\n".format(name).encode()
+    for other in arrived:
+        other.send_raw(data)
+
+def arrive_at_reduce(conn, tag, n, modulus, values):
+    """
+    reduce <tag> <n> <modulus> <v1,v2,...>: сложить по модулю векторы n
+    участников и всем им разослать одну строку "reduced <tag> <суммы>" —
+    вместо того чтобы каждый рассылал свой вектор каждому.
+    """
+    with connections_lock:
+        key = (conn.room, tag)
+        entry = reduces.setdefault(key, {"n": n, "modulus": modulus, "sums": [0] * len(values),
+                                         "count": 0, "conns": set()})
+        # Второй вклад того же участника или другие n, модуль, длина — ошибка
+        accepted = (entry["n"] == n and entry["modulus"] == modulus
+                    and len(entry["sums"]) == len(values) and conn not in entry["conns"])
+        if accepted:
+            sums = entry["sums"]
+            for i, value in enumerate(values):
+                sums[i] = (sums[i] + value) % modulus
+            entry["conns"].add(conn)
+            entry["count"] += 1
+            if entry["count"] < n:
+                return
+            del reduces[key]
+    if not accepted:
+        conn.send_raw("Reduce mismatch: {}\n".format(tag).encode())
+        return
+    data = "reduced {} {}\n".format(tag, ",".join(map(str, entry["sums"]))).encode()
+    for other in entry["conns"]:
+        other.send_raw(data)
+
+def subscribe_presence(conn):
+    with connections_lock:
+        presence_subscribers.add(conn)
+    conn.send_raw("subscribed\n".encode())
+
+def available_connections_text(nickname, room=""):
+    with connections_lock:
+        keys = [key for key in rooms.get(room, ()) if key != nickname]
+        keys += [key for key in remote_rooms.get(room, ()) if key != nickname]
+    lines = ["{} available connections:\n".format(len(keys))]
+    lines += ["{}\n".format(key) for key in keys]
+    return "".join(lines)
+
+def execute_command(conn, line):
+    """
+    Выполняет одну команду протокола от conn. Общая часть для всех движков:
+    соединение должно иметь атрибут nickname и методы send_raw(bytes)
+    и set_frame_mode(mode).
+    """
+    start = time.perf_counter()
+    # Разосланное: (сколько получателей, размер сообщения)
+    relayed = []
+    command = line.split(" ")
+    if command[0] == "print":
+        conn.send_raw(available_connections_text(conn.nickname, conn.room).encode())
+    elif command[0] == "send":
+        if len(command) < 3:
+            conn.send_raw("Send command usage: send nickname1,nickname2,... data\n".encode())
+        else:
+            nicks = command[1].split(",")
+            data = line
+            data = data[data.find(" ") + 1:]
+            data = data[data.find(" ") + 1:]
+            with connections_lock:
+                members = rooms.get(conn.room, {})
+                conns = [members[nick] for nick in nicks if (nick in members and nick != conn.nickname)]
+                # Адресаты с других узлов — одним кадром на узел
+                remote = remote_rooms.get(conn.room, {})
+                links = {}
+                for nick in nicks:
+                    if nick in remote and nick not in members:
+                        links.setdefault(remote[nick], []).append(nick)
+            for link, targets in links.items():
+                link.send("deliver {} {} {}".format(_room_token(conn.room), ",".join(targets), data))
+            data = data.encode()
+            for other in conns:
+                other.send_raw(data, sender=conn)
+            relayed.append((len(conns) + sum(len(targets) for targets in links.values()), len(data)))
+    elif command[0] == "scatter":
+        pieces = parse_scatter(line)
+        if not pieces:
+            conn.send_raw("Scatter command usage: scatter nickname1 data1||nickname2 data2||...\n".encode())
+        else:
+            with connections_lock:
+                members = rooms.get(conn.room, {})
+                remote = remote_rooms.get(conn.room, {})
+                local = [(members[nick], data) for nick, data in pieces
+                         if nick in members and nick != conn.nickname]
+                forwarded = [(remote[nick], nick, data) for nick, data in pieces
+                             if nick in remote and nick not in members]
+            for link, nick, data in forwarded:
+                link.send("deliver {} {} {}".format(_room_token(conn.room), nick, data))
+                relayed.append((1, len(data)))
+            for other, data in local:
+                data = data.encode()
+                other.send_raw(data, sender=conn)
+                relayed.append((1, len(data)))
+    elif command[0] == "wait":
+        if len(command) != 2 or not command[1].isdigit():
+            conn.send_raw("Wait command usage: wait number_of_players\n".encode())
+        else:
+            wait_for_connections(conn, int(command[1]))
+    elif command[0] == "subscribe":
+        subscribe_presence(conn)
+    elif command[0] == "barrier":
+        if len(command) != 3 or not command[2].isdigit():
+            conn.send_raw("Barrier command usage: barrier name number_of_players\n".encode())
+        else:
+            arrive_at_barrier(conn, command[1], int(command[2]))
+    elif command[0] == "reduce":
+        values = parse_reduce(command)
+        if values is None:
+            conn.send_raw("Reduce command usage: reduce tag number_of_players modulus v1,v2,...\n".encode())
+        else:
+            arrive_at_reduce(conn, command[1], int(command[2]), int(command[3]), values)
+    elif command[0] == "join":
+        if len(command) != 2 or not re.fullmatch(ROOM_PATTERN, command[1], flags=re.IGNORECASE):
+            conn.send_raw("Join command usage: join room (A-Za-z0-9_-)\n".encode())
+        else:
+            join_room(conn, command[1])
+    elif command[0] == "features":
+        features = FEATURES
+        if cluster is not None:
+            # Барьер и reduce считаются на одном узле — в кластере клиент обойдётся рассылкой
+            features = [feature for feature in FEATURES if feature not in ("barrier", "reduce")]
+        conn.send_raw("features {}\n".format(" ".join(features)).encode())
+    elif command[0] == "frames":
+        if len(command) != 2 or command[1] not in FRAME_MODES:
+            conn.send_raw("Frames command usage: frames {}\n".format("|".join(FRAME_MODES)).encode())
+        else:
+            conn.set_frame_mode(command[1])
+    elif command[0] == "stats":
+        lines = stats_lines()
+        conn.send_raw("stats {}\n{}\n".format(len(lines), "\n".join(lines)).encode())
+    else:
+        conn.send_raw("Unknown command: {}\n".format(command[0]).encode())
+    # Все счётчики команды — одним обращением к stats, под одной блокировкой
+    counters = [(COMMAND_COUNTERS.get(command[0]) or COMMAND_COUNTERS["unknown"], 1)]
+    observations = [("command_seconds", time.perf_counter() - start, SECONDS_BOUNDS)]
+    for count, size in relayed:
+        if count:
+            counters += [("messages_relayed", count), ("bytes_relayed", count * size)]
+            observations.append(("message_bytes", size, BYTES_BOUNDS))
+    stats.update(counters, observations)
+
+def parse_scatter(line):
+    """
+    "scatter nick1 data1||nick2 data2||" -> [(nick1, "data1||"), ...].
+    Каждому получателю — своё сообщение одной командой; None — ошибка формата.
+    """
+    body = line[len("scatter "):]
+    if not line.startswith("scatter ") or not body.endswith("||"):
+        return None
+    pieces = []
+    for piece in body[:-2].split("||"):
+        nick, _, data = piece.partition(" ")
+        if not nick or not data:
+            return None
+        pieces.append((nick, data + "||"))
+    return pieces
+
+def parse_reduce(command):
+    """Вектор слагаемых команды reduce; None — ошибка формата."""
+    if len(command) != 5 or not command[2].isdigit() or not command[3].isdigit():
+        return None
+    if int(command[2]) < 1 or int(command[3]) < 2:
+        return None
+    values = command[4].split(",")
+    if not all(value.isdigit() for value in values):
+        return None
+    return [int(value) for value in values]
+
+def stats_lines():
+    """Метрики ретранслятора с текущими значениями: соединения, очереди, барьеры."""
+    with connections_lock:
+        conns = list(available_connections.values())
+        gauges = [("active_connections", len(conns)),
+                  ("remote_connections", len(remote_connections)),
+                  ("rooms", len(rooms)),
+                  ("open_barriers", len(barriers)),
+                  ("open_reduces", len(reduces))]
+    # Глубина очереди исходящих по соединениям: сумма, максимум и самые длинные
+    depths = sorted(((conn.queued_bytes(), conn.nickname) for conn in conns), reverse=True)
+    gauges += [("queued_bytes_total", sum(depth for depth, _ in depths)),
+               ("queued_bytes_max", depths[0][0] if depths else 0)]
+    gauges += [('queued_bytes{{nick="{}"}}'.format(nick), depth) for depth, nick in depths[:10] if depth]
+    return stats.render(gauges)
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """GET на любой путь — метрики текстом, как ответ на stats."""
+
+    def do_GET(self):
+        body = ("\n".join(stats_lines()) + "\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """HTTP-эндпоинт метрик в фоновом потоке; только localhost по умолчанию."""
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _room_token(room):
+    """Комната в кадре между узлами: общая комната "" передаётся точкой."""
+    return room or "."
+
+def _parse_room(token):
+    return "" if token == "." else token
+
+def _publish_presence(nickname, room):
+    """Сообщить другим узлам, что наш клиент в комнате room (None — отключился)."""
+    if cluster is None:
+        return
+    if room is None:
+        cluster.broadcast("absent {}".format(nickname))
+    else:
+        cluster.broadcast("presence {} {}".format(nickname, _room_token(room)))
+
+def remote_presence(link, nickname, room):
+    """Клиент другого узла подключился или перешёл в комнату room."""
+    with connections_lock:
+        old = remote_connections.get(nickname)
+        if old is not None:
+            remote_rooms.get(old[1], {}).pop(nickname, None)
+        remote_connections[nickname] = (link, room)
+        remote_rooms.setdefault(room, {})[nickname] = link
+        moved = old is None or old[1] != room
+        left_to = _room_subscribers(old[1], None) if old is not None and moved else []
+        joined_to = _room_subscribers(room, None) if moved else []
+        released = _ready_waiters(room)
+    _notify_presence(left_to, "left", nickname)
+    _notify_presence(joined_to, "joined", nickname)
+    _release_waiters(released)
+
+def remote_absence(link, nickname):
+    """Клиент другого узла отключился (или пропала связь с его узлом)."""
+    with connections_lock:
+        entry = remote_connections.get(nickname)
+        if entry is None or entry[0] is not link:
+            return
+        remote_connections.pop(nickname)
+        members = remote_rooms.get(entry[1], {})
+        members.pop(nickname, None)
+        if not members:
+            remote_rooms.pop(entry[1], None)
+        subscribers = _room_subscribers(entry[1], None)
+    _notify_presence(subscribers, "left", nickname)
 
-def is_socket_closed(sock: socket.socket) -> bool:
-    try:
-        data = sock.recv(16, socket.MSG_DONTWAIT | socket.MSG_PEEK)
-        if len(data) == 0:
+def deliver_local(room, nicks, data):
+    """Доставить своим клиентам комнаты room сообщение, пересланное другим узлом."""
+    with connections_lock:
+        members = rooms.get(room, {})
+        conns = [members[nick] for nick in nicks if nick in members]
+    for other in conns:
+        other.send_raw(data)
+    stats.inc("cluster_delivered", len(conns))
+
+class ClusterLink:
+    """
+    Постоянное соединение с другим узлом кластера. Кадры lp с командами
+    hello, presence, absent и deliver. Писатель — отдельный поток с
+    очередью, так что send не блокирует ни клиентов, ни цикл событий.
+    """
+
+    def __init__(self, node, sock, address=None):
+        self.node = node
+        self.sock = sock
+        # Адрес, по которому мы сами дозвонились (чтобы переподключиться), иначе None
+        self.address = address
+        self.peer_id = None
+        self.frames = FrameReader(mode="lp")
+        self.outbox = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        threading.Thread(target=self._drain_outbox, daemon=True).start()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def send(self, text):
+        with self.cond:
+            if self.closed:
+                return
+            self.outbox.append(pack_frame(text.encode()))
+            self.cond.notify()
+
+    def _drain_outbox(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.outbox or self.closed)
+                if self.closed:
+                    return
+                data = b"".join(self.outbox)
+                self.outbox.clear()
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+    def _read(self):
+        try:
+            while self.frames.recv_into(self.sock):
+                for frame in self.frames.frames():
+                    self.node.dispatch(self.node.handle_frame, self, frame.decode())
+        except OSError:
+            pass
+        self.close()
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.node.dispatch(self.node.link_lost, self)
+
+class ClusterNode:
+    """
+    Узел кластера ретрансляторов. Узлы связаны каждый с каждым: узел
+    дозванивается до тех, чей адрес больше его собственного, и принимает
+    остальных. По связям расходится каталог присутствия (кто на каком узле
+    и в какой комнате) и пересылаются send адресатам с других узлов.
+    dispatch(fn, *args) выполняет обработчик там, где движку можно трогать
+    соединения клиентов: сразу (threaded) или в цикле событий (loop).
+    """
+
+    def __init__(self, node_id, peers, dispatch):
+        self.node_id = node_id
+        self.dispatch = dispatch
+        self.links = set()
+        host, port = node_id.rsplit(":", 1)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, int(port)))
+        self.listener.listen(socket.SOMAXCONN)
+        threading.Thread(target=self._accept, daemon=True).start()
+        for peer in peers:
+            if peer > node_id:
+                threading.Thread(target=self._dial, args=(peer,), daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            self._attach(ClusterLink(self, sock))
+
+    def _dial(self, address):
+        host, port = address.rsplit(":", 1)
+        while True:
+            try:
+                sock = socket.create_connection((host, int(port)), timeout=5)
+            except OSError:
+                time.sleep(1)
+                continue
+            sock.settimeout(None)
+            self._attach(ClusterLink(self, sock, address))
+            return
+
+    def _attach(self, link):
+        link.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        link.send("hello {}".format(self.node_id))
+        # Связь попадает в links под той же блокировкой, под которой снимаем
+        # каталог: всё, что зарегистрируется позже, уйдёт по ней через broadcast
+        with connections_lock:
+            self.links.add(link)
+            local = [(conn.nickname, conn.room) for conn in available_connections.values()]
+        for nickname, room in local:
+            link.send("presence {} {}".format(nickname, _room_token(room)))
+
+    def broadcast(self, text):
+        with connections_lock:
+            links = list(self.links)
+        for link in links:
+            link.send(text)
+
+    def handle_frame(self, link, text):
+        kind, _, rest = text.partition(" ")
+        if kind == "deliver":
+            room, nicks, data = rest.split(" ", 2)
+            deliver_local(_parse_room(room), nicks.split(","), data.encode())
+        elif kind == "presence":
+            nickname, room = rest.split(" ")
+            remote_presence(link, nickname, _parse_room(room))
+        elif kind == "absent":
+            remote_absence(link, rest)
+        elif kind == "hello":
+            link.peer_id = rest
+
+    def link_lost(self, link):
+        with connections_lock:
+            self.links.discard(link)
+            gone = [nick for nick, (owner, _) in remote_connections.items() if owner is link]
+        for nickname in gone:
+            remote_absence(link, nickname)
+        if link.address is not None:
+            threading.Thread(target=self._dial, args=(link.address,), daemon=True).start()
+
+class ThreadedTCPRequestHandler(socketserver.BaseRequestHandler):
+    def send_raw(self, data, sender=None):
+        """
+        Отправитель никогда не ждёт чужой сокет: пока очередь пуста, пишем
+        без блокировки, остаток уходит в ограниченную очередь, которую
+        разгребает собственный поток-писатель этого соединения.
+        """
+        with self.outbox_cond:
+            if self.closed:
+                return
+            if self.length_prefixed:
+                data = pack_frame(data)
+            if not self.outbox and not self.writer_active:
+                try:
+                    sent = self.direct.send(data)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    return
+                if sent == len(data):
+                    return
+                if sent:
+                    # Хвост начатого сообщения дописываем всегда, иначе порвём поток
+                    self._enqueue(data[sent:])
+                    return
+            if self._admit(len(data), sender):
+                self._enqueue(data)
+
+    def _admit(self, size, sender):
+        limit = self.server.outbox_limit
+        if not self.outbox_bytes or self.outbox_bytes + size <= limit:
             return True
-    except BlockingIOError:
-        return False
-    except ConnectionResetError:
-        return True
-    except Exception as e:
+        policy = self.server.slow_policy
+        if policy == "block":
+            if sender is None or sender is self:
+                return True
+            deadline = time.monotonic() + BLOCK_TIMEOUT
+            while not self.closed and self.outbox_bytes and self.outbox_bytes + size > limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    stats.inc("slow_disconnects")
+                    self._disconnect()
+                    break
+                self.outbox_cond.wait(remaining)
+            return not self.closed
+        if policy == "disconnect":
+            stats.inc("slow_disconnects")
+            self._disconnect()
+            return False
+        self.dropped += 1
+        stats.inc("messages_dropped")
         return False
-    return False
 
-class ThreadedTCPRequestHandler(socketserver.BaseRequestHandler):
+    def queued_bytes(self):
+        return self.outbox_bytes
+
+    def _enqueue(self, data):
+        self.outbox.append(data)
+        self.outbox_bytes += len(data)
+        if not self.writer_active:
+            self.writer_active = True
+            threading.Thread(target=self._drain_outbox, daemon=True).start()
+
+    def _drain_outbox(self):
+        while True:
+            with self.outbox_cond:
+                if self.closed or not self.outbox:
+                    self.writer_active = False
+                    self.outbox_cond.notify_all()
+                    return
+                data = b"".join(self.outbox)
+                self.outbox.clear()
+            try:
+                self.request.sendall(data)
+            except OSError:
+                with self.outbox_cond:
+                    self.closed = True
+                    self.writer_active = False
+                    self.outbox_cond.notify_all()
+                return
+            with self.outbox_cond:
+                self.outbox_bytes -= len(data)
+                self.outbox_cond.notify_all()
+
+    def _disconnect(self):
+        self.closed = True
+        self.outbox.clear()
+        self.outbox_cond.notify_all()
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def set_frame_mode(self, mode):
+        # Подтверждение уходит ещё в старом режиме, под той же блокировкой,
+        # чтобы чужие сообщения не вклинились между ним и переключением
+        with self.outbox_cond:
+            self.send_raw("frames {}\n".format(mode).encode())
+            self.length_prefixed = mode == "lp"
+        self.frames.mode = mode
+
     def print_available_connections(self):
-        with connections_lock:
-            conn_count = len(available_connections)-1
-            conn_list = available_connections.keys()
-        self.request.sendall("{} available connections:\n".format(conn_count).encode())
-        for key in conn_list:
-            if key != self.nickname:
-                self.request.sendall("{}\n".format(key).encode())
-    
+        self.send_raw(available_connections_text(self.nickname, self.room).encode())
+
     def setup(self):
+        self.nickname = None
+        self.room = ""
+        self.outbox = collections.deque()
+        self.outbox_bytes = 0
+        self.outbox_cond = threading.Condition()
+        self.writer_active = False
+        self.closed = False
+        self.dropped = 0
+        self.length_prefixed = False
+        self.frames = FrameReader(size=4 * MAX_RECV_SIZE)
         try:
-            self.request.settimeout(3600)  # 1 час таймаут
-            self.max_recv_size = 1024
+            self.request.settimeout(IDLE_TIMEOUT)
+            # Каждое сообщение и так уходит одной записью — Nagle только задерживал бы его
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Копия дескриптора для неблокирующей записи из чужих потоков
+            self.direct = self.request.dup()
+            self.direct.setblocking(False)
+            self.max_recv_size = MAX_RECV_SIZE
             while True:
                 self.request.sendall("Pick nickname: ".encode())
-                self.nickname = self.request.recv(self.max_recv_size).decode().strip()
-                if re.fullmatch("[a-z0-9_]+", self.nickname, flags=re.IGNORECASE):
-                    with connections_lock:
-                        used = self.nickname in available_connections.keys()
-                    if not used:
-                        break
-                    else:
-                        self.request.sendall("Nickname is already used\n".encode())
-                else:
-                    self.request.sendall("Nickname must contain only characters A-Za-z0-9_\n".encode())
-            with connections_lock:
-                available_connections[self.nickname] = self
+                nickname = self.request.recv(self.max_recv_size).decode().strip()
+                error = register_connection(self, nickname)
+                if error is None:
+                    break
+                self.request.sendall(error.encode())
             self.print_available_connections()
-            self.commands = [""]
         except Exception as e:
             error = getattr(e, 'message', repr(e))
             self.request.sendall("Error: {}\n".format(error).encode())
             return
 
     def handle_commands(self):
-        while len(self.commands) > 1:
-            command = self.commands[0].split(" ")
-            if command[0] == "print":
-                self.print_available_connections()
-            elif command[0] == "send":
-                if len(command) < 3:
-                    self.request.sendall("Send command usage: send nickname1,nickname2,... data\n".encode())
-                else:
-                    nicks = command[1].split(",")
-                    data = self.commands[0]
-                    data = data[data.find(" ") + 1:]
-                    data = data[data.find(" ") + 1:]
-                    with connections_lock:
-                        conns = [available_connections[nick] for nick in nicks if (nick in available_connections.keys() and nick != self.nickname)]
-                    for sock in conns:
-                        sock.request.sendall(data.encode())
-            else:
-                self.request.sendall("Unknown command: {}\n".format(command[0]).encode())
-            self.commands.pop(0)
+        for frame in self.frames.frames():
+            execute_command(self, frame.decode().rstrip("\n"))
 
     def handle(self):
         try:
-            while True:
-                s = self.request.recv(self.max_recv_size).decode().split("\n")
-                self.commands[-1] = self.commands[-1] + s[0]
-                self.commands += s[1:]
+            # recv_into вернёт 0, когда клиент закроет соединение
+            while self.frames.recv_into(self.request):
                 self.handle_commands()
-                if is_socket_closed(self.request):
-                    return
         except Exception as e:
             error = getattr(e, 'message', repr(e))
             self.request.sendall("Error: {}\n".format(error).encode())
             return
 
     def finish(self):
+        with self.outbox_cond:
+            self.closed = True
+            self.outbox.clear()
+            self.outbox_cond.notify_all()
+        if hasattr(self, "direct"):
+            self.direct.close()
         try:
-            with connections_lock:
-                available_connections.pop(self.nickname)
+            unregister_connection(self)
         except Exception as e:
             error = getattr(e, 'message', repr(e))
             self.request.sendall("Error: {}\n".format(error).encode())
-            return    
+            return
 
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     allow_reuse_address = True
+    outbox_limit = OUTBOX_LIMIT
+    slow_policy = "block"
+    max_clients = MAX_CLIENTS  # 0 — без ограничения
 
+    def __init__(self, *args, **kwargs):
+        self.handlers = 0
+        self.handlers_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
 
-def start_server(port=0):
-    with ThreadedTCPServer(('0.0.0.0', port), ThreadedTCPRequestHandler) as server:
-        server_thread = threading.Thread(target=server.serve_forever)
-        server_thread.daemon = True
-        server_thread.start()
+    def process_request(self, request, client_address):
+        # Считаем только потоки-обработчики: лишнего клиента отклоняем сразу,
+        # не заводя ему поток
+        with self.handlers_lock:
+            admitted = not self.max_clients or self.handlers < self.max_clients
+            if admitted:
+                self.handlers += 1
+        if not admitted:
+            stats.inc("connections_rejected")
+            try:
+                request.sendall("Error: server is full ({} clients)\n".format(self.max_clients).encode())
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._handler_done()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._handler_done()
+
+    def _handler_done(self):
+        with self.handlers_lock:
+            self.handlers -= 1
+
+
+class EventLoopClient:
+    """Одно соединение однопоточного ретранслятора: буферы чтения и записи."""
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.nickname = None
+        self.room = ""
+        self.frames = FrameReader(size=4 * MAX_RECV_SIZE)
+        self.length_prefixed = False
+        self.outbuf = bytearray()
+        self.closed = False
+        self.last_activity = time.monotonic()
+        self.events = selectors.EVENT_READ
+        self.dropped = 0
+        # Политика block: кого из отправителей мы притормозили и кто тормозит нас,
+        # с каких пор мы держим отправителей и с каких пор нас держат
+        self.waiting_senders = set()
+        self.blocked_on = set()
+        self.holding_since = None
+        self.blocked_since = None
+
+    def send_raw(self, data, sender=None):
+        """Отправка без блокировки: что не ушло сразу, допишет on_writable."""
+        if self.closed:
+            return
+        if self.length_prefixed:
+            data = pack_frame(data)
+        if self.outbuf:
+            if len(self.outbuf) + len(data) > self.server.outbox_limit and not self._admit(sender):
+                return
+            self.outbuf += data
+            return
+        try:
+            sent = self.sock.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.close()
+            return
+        if sent < len(data):
+            self.outbuf += data[sent:]
+            self._update_events()
+
+    def _admit(self, sender):
+        policy = self.server.slow_policy
+        if policy == "block":
+            if sender is not None and sender is not self and sender not in self.waiting_senders:
+                now = time.monotonic()
+                if not self.waiting_senders:
+                    self.holding_since = now
+                if not sender.blocked_on:
+                    sender.blocked_since = now
+                self.waiting_senders.add(sender)
+                sender.blocked_on.add(self)
+                sender._update_events()
+            return True
+        if policy == "disconnect":
+            stats.inc("slow_disconnects")
+            self.close()
+            return False
+        self.dropped += 1
+        stats.inc("messages_dropped")
+        return False
+
+    def _release_senders(self):
+        for sender in self.waiting_senders:
+            sender.blocked_on.discard(self)
+            if not sender.blocked_on:
+                sender._unblocked()
+            sender._update_events()
+        self.waiting_senders.clear()
+        self.holding_since = None
+
+    def _unblocked(self):
+        # Пока нас держали, мы не могли ничего прислать — это не простой
+        if self.blocked_since is not None:
+            self.last_activity += time.monotonic() - self.blocked_since
+            self.blocked_since = None
+
+    def queued_bytes(self):
+        return len(self.outbuf)
+
+    def _update_events(self):
+        if self.closed:
+            return
+        # Приторможенный отправитель не читается, пока получатели не разгребут очередь
+        events = 0 if self.blocked_on else selectors.EVENT_READ
+        if self.outbuf:
+            events |= selectors.EVENT_WRITE
+        if events == self.events:
+            return
+        if not self.events:
+            self.server.selector.register(self.sock, events, self)
+        elif not events:
+            self.server.selector.unregister(self.sock)
+        else:
+            self.server.selector.modify(self.sock, events, self)
+        self.events = events
+
+    def on_writable(self):
+        try:
+            sent = self.sock.send(self.outbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close()
+            return
+        del self.outbuf[:sent]
+        if self.waiting_senders and len(self.outbuf) <= self.server.outbox_limit // 2:
+            self._release_senders()
+        if not self.outbuf:
+            self._update_events()
+
+    def on_readable(self):
+        try:
+            received = self.frames.recv_into(self.sock)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close()
+            return
+        if not received:
+            self.close()
+            return
+        self.last_activity = time.monotonic()
+        try:
+            for frame in self.frames.frames():
+                self.handle_line(frame.decode(errors="replace").rstrip("\n"))
+                if self.closed:
+                    return
+        except FrameError as e:
+            # Испорченный поток — закрываем только этого клиента, цикл живёт дальше
+            self.send_raw("Error: {}\n".format(e).encode())
+            self.close()
+
+    def set_frame_mode(self, mode):
+        self.send_raw("frames {}\n".format(mode).encode())
+        self.length_prefixed = mode == "lp"
+        self.frames.mode = mode
+
+    def handle_line(self, line):
+        try:
+            if self.nickname is None:
+                error = register_connection(self, line.strip())
+                if error is None:
+                    self.send_raw(available_connections_text(self.nickname, self.room).encode())
+                else:
+                    self.send_raw(error.encode() + "Pick nickname: ".encode())
+            else:
+                execute_command(self, line)
+        except Exception as e:
+            error = getattr(e, 'message', repr(e))
+            self.send_raw("Error: {}\n".format(error).encode())
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.events:
+            self.server.selector.unregister(self.sock)
+        self._release_senders()
+        for recipient in self.blocked_on:
+            recipient.waiting_senders.discard(self)
+            if not recipient.waiting_senders:
+                recipient.holding_since = None
+        self.server.clients.discard(self)
+        self.sock.close()
+        if self.nickname is not None:
+            unregister_connection(self)
 
+
+class EventLoopServer:
+    """
+    Однопоточный ретранслятор на selectors. Тот же текстовый протокол,
+    что и у ThreadedTCPServer, но все соединения обслуживает один цикл
+    событий — без потока и без MSG_PEEK-проверки на каждого клиента.
+    Интерфейс повторяет socketserver: serve_forever / shutdown / server_close.
+    """
+
+    def __init__(self, server_address, idle_timeout=IDLE_TIMEOUT,
+                 outbox_limit=OUTBOX_LIMIT, slow_policy="block"):
+        self.idle_timeout = idle_timeout
+        self.outbox_limit = outbox_limit
+        self.slow_policy = slow_policy
+        self.clients = set()
+        self.selector = selectors.DefaultSelector()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(server_address)
+        self.socket.listen(socket.SOMAXCONN)
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()
+        self.selector.register(self.socket, selectors.EVENT_READ, None)
+        # call_soon из других потоков (связи кластера): очередь + пробуждение select
+        self.callbacks = collections.deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self)
+        self._shutdown_request = False
+        self._is_shut_down = threading.Event()
+
+    def _accept(self):
         while True:
-            if threading.active_count() > 75:
-                raise Exception()
-            time.sleep(100)
+            try:
+                sock, _ = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = EventLoopClient(self, sock)
+            self.clients.add(client)
+            self.selector.register(sock, selectors.EVENT_READ, client)
+            client.send_raw("Pick nickname: ".encode())
+
+    def call_soon(self, fn, *args):
+        """Выполнить fn(*args) в потоке цикла событий; можно звать из любого потока."""
+        self.callbacks.append((fn, args))
+        try:
+            self._wakeup_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_callbacks(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self.callbacks:
+            fn, args = self.callbacks.popleft()
+            fn(*args)
+
+    def _close_idle(self):
+        now = time.monotonic()
+        # Как и у ThreadedTCPServer: получатель, который держит отправителей
+        # дольше BLOCK_TIMEOUT, отключается, и отправители едут дальше
+        for client in [c for c in self.clients if c.holding_since is not None
+                       and now - c.holding_since > BLOCK_TIMEOUT]:
+            stats.inc("slow_disconnects")
+            client.close()
+        deadline = now - self.idle_timeout
+        for client in [c for c in self.clients if not c.blocked_on and c.last_activity < deadline]:
+            client.close()
+
+    def serve_forever(self, poll_interval=0.5):
+        self._is_shut_down.clear()
+        last_sweep = time.monotonic()
+        try:
+            while not self._shutdown_request:
+                for key, mask in self.selector.select(poll_interval):
+                    client = key.data
+                    if client is None:
+                        self._accept()
+                        continue
+                    if client is self:
+                        self._run_callbacks()
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        client.on_readable()
+                    if mask & selectors.EVENT_WRITE and not client.closed:
+                        client.on_writable()
+                if time.monotonic() - last_sweep >= 1:
+                    last_sweep = time.monotonic()
+                    self._close_idle()
+        finally:
+            self._shutdown_request = False
+            self._is_shut_down.set()
+
+    def shutdown(self):
+        self._shutdown_request = True
+        self._is_shut_down.wait()
+
+    def server_close(self):
+        for client in list(self.clients):
+            client.close()
+        self.selector.close()
+        self.socket.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
 
-        server_thread.join()
+
+def start_cluster(node_id, peers, dispatch):
+    """Включить режим кластера: этот процесс — узел node_id (host:port связей)."""
+    global cluster
+    cluster = ClusterNode(node_id, peers, dispatch)
+    return cluster
+
+def start_server(port=0, engine="threaded", outbox_limit=OUTBOX_LIMIT, slow_policy="block",
+                 cluster_node=None, cluster_peers=(), metrics_port=None, max_clients=MAX_CLIENTS):
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+    if engine == "loop":
+        with EventLoopServer(('0.0.0.0', port), outbox_limit=outbox_limit, slow_policy=slow_policy) as server:
+            if cluster_node:
+                start_cluster(cluster_node, cluster_peers, server.call_soon)
+            server.serve_forever()
+        return
+
+    if cluster_node:
+        # Соединения потокового движка потокобезопасны — обработчик зовём сразу
+        start_cluster(cluster_node, cluster_peers, lambda fn, *args: fn(*args))
+    with ThreadedTCPServer(('0.0.0.0', port), ThreadedTCPRequestHandler) as server:
+        server.outbox_limit = outbox_limit
+        server.slow_policy = slow_policy
+        server.max_clients = max_clients
+        server.serve_forever()
 
 def main():
-    if len(argv) < 2:
-        print("Usage: %s port" % (argv[0]))
-        return 0
-    start_server(port=int(argv[1]))
+    parser = argparse.ArgumentParser(description="Ретранслятор сообщений MPC Game")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--engine", choices=ENGINES, default="threaded",
+                        help="threaded — поток на клиента, loop — один цикл событий")
+    parser.add_argument("--outbox-limit", type=int, default=OUTBOX_LIMIT,
+                        help="предел очереди исходящих на соединение, байт")
+    parser.add_argument("--slow-policy", choices=SLOW_POLICIES, default="block",
+                        help="что делать с отстающим получателем")
+    parser.add_argument("--cluster-node", metavar="HOST:PORT",
+                        help="адрес для связей с другими узлами кластера (включает режим кластера)")
+    parser.add_argument("--cluster-peer", metavar="HOST:PORT", action="append", default=[],
+                        help="адрес связей другого узла; повторить для каждого")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="отдавать метрики по HTTP на 127.0.0.1:PORT (как ответ на stats)")
+    parser.add_argument("--max-clients", type=int, default=MAX_CLIENTS,
+                        help="предел одновременных клиентов потокового движка, 0 — без предела")
+    args = parser.parse_args()
+    start_server(port=args.port, engine=args.engine,
+                 outbox_limit=args.outbox_limit, slow_policy=args.slow_policy,
+                 cluster_node=args.cluster_node, cluster_peers=args.cluster_peer,
+                 metrics_port=args.metrics_port, max_clients=args.max_clients)
     return 0
 
 if __name__ == "__main__":
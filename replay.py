@@ -0,0 +1,203 @@
+# replay.py
+
+import json
+import random
+import re
+import time
+
+from network import RepeaterConnection
+from player import Player
+from session import unwrap
+from transcript import END, RECEIVED, SENT
+
+# codecs кодируется JSON до договора о кодеке; вложенных объектов в нём нет
+CODECS_MESSAGE = re.compile(rb'\{"type": "codecs"[^{}]*\}')
+# Кто выиграл одновременный раунд, из трассы без своих долей не узнать
+UNKNOWN_WINNER = "?"
+
+
+class TraceEnded(ConnectionError):
+    """Трасса кончилась раньше игры: воспроизведение неполное."""
+
+    def __init__(self, player, conn):
+        super().__init__(f"трасса кончилась до конца игры: отдано {conn.position} из {len(conn.frames)} "
+                         f"кадров, закончено раундов {player.completed_round}")
+        self.player = player
+        self.conn = conn
+
+
+class NullSocket:
+    """Сокет, который ничего не делает: ReplayConnection не ходит в сеть."""
+
+    def connect(self, address):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplayConnection(RepeaterConnection):
+    """
+    RepeaterConnection без сети: принятые кадры берутся из записанной
+    трассы в том же порядке, а отправленное только считается. Весь разбор
+    (служебные строки, очередь сообщений, Inbox и кодеки у игрока) идёт
+    тем же кодом, что и вживую.
+
+    speed — во сколько раз быстрее записи отдавать кадры (1 — как было),
+    None — без пауз, как можно быстрее. Когда трасса кончилась, любое
+    ожидание кадра бросает ConnectionError.
+    """
+
+    def __init__(self, meta, records, speed=None):
+        super().__init__(meta.get("host"), meta.get("port"), meta["nickname"],
+                         frame_mode=meta.get("frame_mode", "text"), room=meta.get("room"), sock=NullSocket())
+        self.frames = [(stamp, payload) for kind, stamp, payload in records if kind == RECEIVED]
+        # Без END запись оборвалась (процесс упал или файл обрезан) — конца игры в ней нет
+        self.complete = any(kind == END for kind, _, _ in records)
+        self.position = 0
+        self.speed = speed
+        self.started = None
+        self.sent_bytes = 0
+
+    def _next_frame(self):
+        if self.position >= len(self.frames):
+            raise ConnectionError("Трасса закончилась")
+        stamp, payload = self.frames[self.position]
+        self.position += 1
+        if self.speed:
+            if self.started is None:
+                self.started = time.perf_counter() - stamp / self.speed
+            delay = self.started + stamp / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return payload
+
+    def remaining(self):
+        """Сколько принятых кадров трассы ещё не отдано."""
+        return len(self.frames) - self.position
+
+    def _sendall(self, data):
+        self.sent_bytes += len(data)
+
+    def _recv_until(self, marker):
+        return self._next_frame().decode()
+
+    def _read_frame(self, timeout):
+        self._handle_frame(self._next_frame())
+        return True
+
+    def recv_message(self, timeout=60):
+        self.flush()
+        while not self.message_queue:
+            self._handle_frame(self._next_frame())
+        return self.message_queue.popleft()
+
+    def poll(self, timeout):
+        self._handle_frame(self._next_frame())
+        return True
+
+
+class ReplayPlayer(Player):
+    """
+    Игрок для воспроизведения: догадки, свои доли, зёрна и маски пула — из
+    ГПСЧ с заданным зерном (у каждого свой поток), так что два прогона с
+    одним зерном делают одно и то же. Доли с записью, сделанные CSPRNG,
+    всё равно не совпадают, поэтому не совпадает и итог раскрытия —
+    игра кончается ровно тогда, когда отдано последнее раскрытие трассы
+    (diff_share пира или ответ reduce). Доли догадок следующего хода,
+    которые конвейер успел прислать до конца игры, раскрытием не считаются.
+    Победитель хода — его угадывающий; в одновременном раунде — кто
+    угадал по своему раскрытию, а если никто, UNKNOWN_WINNER.
+    """
+
+    def __init__(self, *args, seed=0, nonce=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.random = random.Random(seed)
+        self.randbytes = random.Random(f"shares:{seed}").randbytes
+        self.pool_randbytes = random.Random(f"pool:{seed}").randbytes
+        self.recorded_nonce = nonce
+        self.last_opening = None
+
+    def nonce_part(self):
+        # Имена барьеров и метки reduce в трассе — с nonce записанной игры
+        if self.recorded_nonce is None:
+            return super().nonce_part()
+        return self.recorded_nonce
+
+    def ask_guess(self):
+        return tuple(self.random.randint(1, self.field_size) for _ in range(self.dimensions))
+
+    def _is_opening(self, frame):
+        if frame.endswith(b"||"):
+            _, payload = unwrap(frame[:-2].decode().strip())
+            try:
+                return self.inbox.decode(payload).get("type") == "diff_share"
+            except ValueError:
+                return False
+        return any(line.startswith(b"reduced ") for line in frame.split(b"\n"))
+
+    def trace_done(self):
+        """
+        Отдано последнее раскрытие полной трассы: записанная игра на этом
+        кончилась. В оборванной трассе игра идёт, пока не кончатся кадры.
+        """
+        if not self.conn.complete:
+            return False
+        if self.last_opening is None:
+            # Считается один раз, когда кодек уже выбран
+            openings = [i for i, (_, frame) in enumerate(self.conn.frames) if self._is_opening(frame)]
+            self.last_opening = openings[-1] if openings else -1
+        return self.conn.position > self.last_opening
+
+    def play_turn(self, round_num, player):
+        super().play_turn(round_num, player)
+        return self.trace_done()
+
+    def play_pipelined_turn(self, round_num):
+        super().play_pipelined_turn(round_num)
+        return self.trace_done()
+
+    def play_simultaneous_round(self, round_num):
+        winners = super().play_simultaneous_round(round_num)
+        if not self.trace_done():
+            return []
+        return winners or [UNKNOWN_WINNER]
+
+
+def recorded_nonce(records):
+    """Своя часть nonce из отправленного в трассе codecs; None — его там нет."""
+    for kind, _, payload in records:
+        if kind == SENT:
+            match = CODECS_MESSAGE.search(payload)
+            if match:
+                return json.loads(match.group()).get("nonce", "")
+    return None
+
+
+def replay(meta, records, expected_players, speed=None, seed=0, **options):
+    """
+    Провести записанную сессию через ReplayPlayer с настройками игры
+    options (те же, что у записанного игрока). Возвращает игрока и
+    соединение, когда игра дошла до конца вместе с трассой; если трасса
+    кончилась посреди игры — TraceEnded (в нём те же игрок и соединение).
+    """
+    conn = ReplayConnection(meta, records, speed)
+    player = ReplayPlayer(meta["nickname"], conn.host, conn.port, room=meta.get("room"), conn=conn,
+                          mesh="off", seed=seed, nonce=recorded_nonce(records), **options)
+    try:
+        player.play(expected_players)
+    except ConnectionError as e:
+        raise TraceEnded(player, conn) from e
+    finally:
+        if player.pool is not None:
+            player.pool.close()
+    return player, conn
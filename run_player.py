@@ -2,8 +2,15 @@
 # run_player.py
 
 import argparse
-from config import SERVER_HOST, SERVER_PORT, FIELD_SIZE
-from player import Player
+import json
+import os
+from codec import CODECS
+from config import (BOARD, CODEC, DIMENSIONS, SERVER_HOST, SERVER_PORT, FIELD_SIZE, FRAME_MODE, MESH,
+                    PREPROCESS_POOL, ROOM, OPEN_MODE, ROUND_MODE, SHARE_MODE, TIE_BREAK, VERBOSITY)
+from framing import FRAME_MODES
+from mesh import MESH_MODES
+from metrics import VERBOSITY_LEVELS, set_verbosity
+from player import BOARDS, OPEN_MODES, Player, ROUND_MODES, SHARE_MODES, TIE_BREAKS
 
 
 def main():
@@ -12,22 +19,77 @@ def main():
     parser.add_argument("--host", default=SERVER_HOST, help=f"Адрес сервера (по умолчанию {SERVER_HOST})")
     parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"Порт (по умолчанию {SERVER_PORT})")
     parser.add_argument("--players", type=int, default=2, help="Количество игроков (по умолчанию 2)")
+    parser.add_argument("--games", type=int, default=1,
+                        help="Партий подряд на одном соединении (по умолчанию 1)")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="Контрольная точка серии: после обрыва та же команда вернёт игрока в партию")
     parser.add_argument("--field", type=int, default=FIELD_SIZE, help=f"Размер поля (по умолчанию {FIELD_SIZE})")
+    parser.add_argument("--board", choices=BOARDS, default=BOARD,
+                        help=f"Доска: координаты по отдельности или точка одним числом (по умолчанию {BOARD})")
+    parser.add_argument("--dims", type=int, default=DIMENSIONS,
+                        help=f"Размерность поля, больше 2 — только с --board packed (по умолчанию {DIMENSIONS})")
+    parser.add_argument("--frames", choices=FRAME_MODES, default=FRAME_MODE,
+                        help=f"Кадрирование: text или lp — префикс длины (по умолчанию {FRAME_MODE})")
+    parser.add_argument("--rounds", choices=ROUND_MODES, default=ROUND_MODE,
+                        help=f"Раунды по очереди или одновременно (по умолчанию {ROUND_MODE})")
+    parser.add_argument("--tie-break", choices=TIE_BREAKS, default=TIE_BREAK,
+                        help=f"Правило ничьей в одновременном раунде (по умолчанию {TIE_BREAK})")
+    parser.add_argument("--shares", choices=SHARE_MODES, default=SHARE_MODE,
+                        help=f"Раздача долей: сами доли или зёрна ГПСЧ (по умолчанию {SHARE_MODE})")
+    parser.add_argument("--open", choices=OPEN_MODES, default=OPEN_MODE,
+                        help=f"Раскрытие долей разности: всем пирам или суммой на ретрансляторе (по умолчанию {OPEN_MODE})")
+    parser.add_argument("--room", default=ROOM,
+                        help="Комната на ретрансляторе: игроки одной комнаты играют вместе")
+    parser.add_argument("--mesh", choices=MESH_MODES, default=MESH,
+                        help=f"Прямые соединения между игроками (по умолчанию {MESH})")
+    parser.add_argument("--codec", choices=CODECS, default=CODEC,
+                        help=f"Предпочитаемый кодек сообщений (по умолчанию {CODEC})")
+    parser.add_argument("--pool", type=int, default=PREPROCESS_POOL,
+                        help=f"Масок в пуле предобработки, 0 — без неё (по умолчанию {PREPROCESS_POOL})")
+    parser.add_argument("--verbosity", type=int, choices=VERBOSITY_LEVELS, default=VERBOSITY,
+                        help=f"0 — только итог, 1 — ход игры, 2 — каждое сообщение (по умолчанию {VERBOSITY})")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Записать фазы протокола в FILE (формат Chrome trace, открыть в Perfetto)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="Дописать в FILE все кадры соединения с ретранслятором (python3 -m bench.replay)")
 
     args = parser.parse_args()
+    set_verbosity(args.verbosity)
 
     player = Player(
         nickname=args.nickname,
         host=args.host,
         port=args.port,
-        field_size=args.field
+        field_size=args.field,
+        board=args.board,
+        dimensions=args.dims,
+        frame_mode=args.frames,
+        round_mode=args.rounds,
+        tie_break=args.tie_break,
+        share_mode=args.shares,
+        open_mode=args.open,
+        pool_size=args.pool,
+        codec=args.codec,
+        room=args.room,
+        mesh=args.mesh,
+        trace=bool(args.trace),
+        record=args.record,
+        checkpoint=args.checkpoint
     )
 
     try:
-        player.play(args.players)
+        if args.games > 1 or args.checkpoint:
+            player.play_session(args.players, args.games)
+        else:
+            player.play(args.players)
     except KeyboardInterrupt:
         print("\nИгра прервана")
         player.conn.close()
+    if args.trace:
+        events = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": args.nickname}}]
+        events += player.spans.chrome_trace(os.getpid())
+        with open(args.trace, "w") as f:
+            json.dump({"traceEvents": events}, f)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# run_tables.py
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+from config import BOARD, DIMENSIONS, SERVER_HOST, SERVER_PORT, FIELD_SIZE, FRAME_MODE, OPEN_MODE
+from framing import FRAME_MODES
+from metrics import set_verbosity
+from network import RepeaterConnection
+from player import BOARDS, OPEN_MODES, Player
+from session import SessionMux
+
+
+class AutoPlayer(Player):
+    """Игрок без ввода с клавиатуры: догадки случайные."""
+
+    def ask_guess(self):
+        return tuple(random.randint(1, self.field_size) for _ in range(self.dimensions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MPC Game: много столов через одно соединение")
+    parser.add_argument("nickname", help="Уникальный никнейм игрока (один на все столы)")
+    parser.add_argument("--host", default=SERVER_HOST, help=f"Адрес сервера (по умолчанию {SERVER_HOST})")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"Порт (по умолчанию {SERVER_PORT})")
+    parser.add_argument("--room", default="tables", help="Комната на ретрансляторе (по умолчанию tables)")
+    parser.add_argument("--players", type=int, default=2, help="Игроков за каждым столом (по умолчанию 2)")
+    parser.add_argument("--tables", type=int, default=10, help="Сколько игр вести одновременно (по умолчанию 10)")
+    parser.add_argument("--field", type=int, default=FIELD_SIZE, help=f"Размер поля (по умолчанию {FIELD_SIZE})")
+    parser.add_argument("--board", choices=BOARDS, default=BOARD,
+                        help=f"Доска: координаты по отдельности или точка одним числом (по умолчанию {BOARD})")
+    parser.add_argument("--dims", type=int, default=DIMENSIONS,
+                        help=f"Размерность поля, больше 2 — только с --board packed (по умолчанию {DIMENSIONS})")
+    parser.add_argument("--frames", choices=FRAME_MODES, default=FRAME_MODE,
+                        help=f"Кадрирование: text или lp — префикс длины (по умолчанию {FRAME_MODE})")
+    parser.add_argument("--open", choices=OPEN_MODES, default=OPEN_MODE,
+                        help=f"Раскрытие долей разности: всем пирам или суммой на ретрансляторе (по умолчанию {OPEN_MODE})")
+    parser.add_argument("--verbose", action="store_true", help="Печатать ход каждой игры")
+
+    args = parser.parse_args()
+
+    conn = RepeaterConnection(args.host, args.port, args.nickname, frame_mode=args.frames, room=args.room)
+    mux = SessionMux(conn)
+    mux.start()
+    players = mux.wait_for_room(args.players)
+    print(f"[{args.nickname}] Комната {args.room}: {players}, столов: {args.tables}")
+
+    winners = {}
+
+    def play(table):
+        session = f"table{table}"
+        player = AutoPlayer(args.nickname, args.host, args.port, field_size=args.field,
+                            session=session, conn=mux.open(session, players), open_mode=args.open,
+                            board=args.board, dimensions=args.dims)
+        player.play(args.players)
+        winners[session] = player
+
+    threads = [threading.Thread(target=play, args=(i,), daemon=True) for i in range(args.tables)]
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            set_verbosity(0)
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    print(f"[{args.nickname}] Сыграно столов: {len(winners)} из {args.tables}")
+    mux.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# session.py
+
+import collections
+import contextlib
+import threading
+
+from config import QUEUE_LIMIT
+
+# Каждое сообщение игрока несёт id игры (сессии): "@<сессия> <сообщение>".
+# По нему один процесс ведёт много игр через одно соединение, а сообщения
+# закончившейся игры не попадают в следующую
+SESSION_MARKER = "@"
+
+
+def wrap(session, payload):
+    return f"{SESSION_MARKER}{session} {payload}"
+
+
+def unwrap(raw):
+    """(сессия, сообщение); у сообщения без конверта сессия None."""
+    if not raw.startswith(SESSION_MARKER):
+        return None, raw
+    session, _, payload = raw[len(SESSION_MARKER):].partition(" ")
+    return session, payload
+
+
+class SessionChannel:
+    """
+    Одна игра поверх общего соединения SessionMux. Повторяет ту часть
+    интерфейса RepeaterConnection, которой пользуются Player и Inbox:
+    connect, wait_for_peers, get_peers_once, barrier, reduce, send_to, scatter,
+    batch, recv_message, message_queue, features, close.
+    """
+
+    def __init__(self, mux, session, players):
+        self.mux = mux
+        self.session = session
+        self.players = list(players)
+        self.nickname = mux.conn.nickname
+        self.features = mux.conn.features
+        self.message_queue = collections.deque()
+
+    def connect(self):
+        """Соединение общее и уже открыто SessionMux."""
+
+    def wait_for_peers(self, count, timeout=3600):
+        """Участники игры заданы заранее; ждём, пока все они будут в комнате."""
+        peers = [player for player in self.players if player != self.nickname]
+        with self.mux.cond:
+            self.mux.cond.wait_for(lambda: self.mux.closed or self.mux.conn.roster.issuperset(peers),
+                                   timeout)
+        return peers
+
+    def get_peers_once(self):
+        return [player for player in self.players if player != self.nickname]
+
+    def barrier(self, name, count, timeout=3600):
+        conn = self.mux.conn
+        with self.mux.send_lock:
+            conn._send_command(f"barrier {name} {count}")
+        with self.mux.cond:
+            released = self.mux.cond.wait_for(lambda: self.mux.closed or name in conn.released, timeout)
+            conn.released.discard(name)
+        return bool(released) and not self.mux.closed
+
+    def reduce(self, tag, count, modulus, values, timeout=3600):
+        conn = self.mux.conn
+        with self.mux.send_lock:
+            conn._send_command(f"reduce {tag} {count} {modulus} {','.join(map(str, values))}")
+        mismatch = f"Reduce mismatch: {tag}"
+        with self.mux.cond:
+            self.mux.cond.wait_for(lambda: self.mux.closed or tag in conn.reduced or mismatch in conn.lines,
+                                   timeout)
+            if mismatch in conn.lines:
+                conn.lines.remove(mismatch)
+            return conn.reduced.pop(tag, None)
+
+    def send_to(self, recipients, data):
+        with self.mux.send_lock:
+            self.mux.conn.send_to(recipients, data)
+
+    def scatter(self, messages):
+        with self.mux.send_lock:
+            self.mux.conn.scatter(messages)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Соединение общее с другими играми и читается чужим потоком —
+        запись не копим; каждая отправка уже одна команда.
+        """
+        yield
+
+    def recv_message(self, timeout=60):
+        with self.mux.cond:
+            self.mux.cond.wait_for(lambda: self.message_queue or self.mux.closed, timeout)
+            if self.message_queue:
+                return self.message_queue.popleft()
+        return None
+
+    def close(self):
+        self.mux.release(self.session)
+
+
+class SessionMux:
+    """
+    Много игр поверх одного RepeaterConnection. Сокет читает один поток
+    и раскладывает сообщения по сессиям; каждая игра получает свой
+    SessionChannel, который Player принимает вместо соединения. Запись
+    из разных игр сериализуется send_lock.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.channels = {}
+        # Сообщения игр, которые у нас ещё не открыты
+        self.pending = collections.defaultdict(collections.deque)
+        # Закончившиеся игры: их запоздавшие сообщения просто отбрасываем
+        self.finished = set()
+        # Сверх queue_limit сообщений ещё не открытой игры вытесняются самые старые
+        self.queue_limit = QUEUE_LIMIT
+        self.overflow = 0
+        self.send_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = None
+
+    def start(self):
+        """Подключиться, подписаться на присутствие в комнате и запустить чтение."""
+        self.conn.connect()
+        self.conn.subscribe()
+        self.thread = threading.Thread(target=self._pump, daemon=True)
+        self.thread.start()
+
+    def wait_for_room(self, count, timeout=3600):
+        """Дождаться count участников комнаты (вместе с нами); их отсортированный список."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.closed or len(self.conn.roster) + 1 >= count, timeout)
+            return sorted(self.conn.roster | {self.conn.nickname})
+
+    def open(self, session, players):
+        """Канал игры session; players — никнеймы участников, включая наш."""
+        channel = SessionChannel(self, session, players)
+        with self.cond:
+            self.channels[session] = channel
+            channel.message_queue.extend(self.pending.pop(session, ()))
+        return channel
+
+    def release(self, session):
+        with self.cond:
+            self.channels.pop(session, None)
+            self.finished.add(session)
+
+    def _pump(self):
+        while not self.closed:
+            try:
+                received = self.conn.poll(0.5)
+            except (ConnectionError, OSError, ValueError):
+                break
+            # Сообщения, разобранные ещё при connect/subscribe, тоже разложить
+            if not received and not self.conn.message_queue:
+                continue
+            with self.cond:
+                queue = self.conn.message_queue
+                while queue:
+                    raw = queue.popleft()
+                    session, _ = unwrap(raw)
+                    channel = self.channels.get(session)
+                    if channel is not None:
+                        channel.message_queue.append(raw)
+                    elif session not in self.finished:
+                        pending = self.pending[session]
+                        if len(pending) >= self.queue_limit:
+                            pending.popleft()
+                            self.overflow += 1
+                        pending.append(raw)
+                self.cond.notify_all()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+        if self.thread is not None:
+            self.thread.join()
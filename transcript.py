@@ -0,0 +1,69 @@
+# transcript.py
+
+import json
+import struct
+import threading
+import time
+
+# Запись обмена с ретранслятором на уровне кадров: файл начинается с MAGIC,
+# дальше записи «вид, микросекунды от начала сессии, длина, данные». Файл
+# только дописывается — каждое соединение начинает в нём новую сессию с
+# записи META (JSON: ник, комната, адрес), а закрытое штатно — кончает END
+MAGIC = b"MPCTRACE1\n"
+RECORD = struct.Struct("!cQI")
+META = b"M"      # начало сессии
+SENT = b"S"      # запись в сокет (несколько команд, если собраны batch)
+RECEIVED = b"R"  # принятый кадр: сообщение игрока с || или служебная строка
+END = b"E"       # соединение закрыто штатно; без END трасса оборвана
+
+
+class TranscriptWriter:
+    """
+    Дописывает записи в файл трассы. Каждая запись уходит одним write,
+    так что SessionMux может писать из нескольких потоков.
+    """
+
+    def __init__(self, path, meta):
+        self.file = open(path, "ab")
+        self.lock = threading.Lock()
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.start = time.perf_counter()
+        self.records = 0
+        self.write(META, json.dumps(meta).encode())
+
+    def write(self, kind, payload):
+        stamp = int((time.perf_counter() - self.start) * 1e6)
+        record = RECORD.pack(kind, stamp, len(payload)) + bytes(payload)
+        with self.lock:
+            self.file.write(record)
+            self.records += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_transcript(path):
+    """
+    Сессии файла трассы: список (meta, [(вид, секунды, данные), ...]).
+    Оборванная запись в хвосте (процесс упал посреди write) отбрасывается.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path}: не файл трассы")
+    sessions = []
+    offset = len(MAGIC)
+    while offset + RECORD.size <= len(data):
+        kind, stamp, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        payload = data[offset:offset + length]
+        offset += length
+        if kind == META:
+            sessions.append((json.loads(payload), []))
+        elif sessions:
+            sessions[-1][1].append((kind, stamp / 1e6, payload))
+    return sessions